@@ -0,0 +1,112 @@
+"""Bulk post import benchmark.
+
+Imports ``--posts`` posts through ``POST /api/posts/bulk`` (JSON array or
+NDJSON) and, for comparison, ``--baseline`` posts one ``POST /api/posts/``
+at a time, then prints elapsed time and posts per second as JSON. The app
+is called in-process through httpx's ASGI transport:
+
+    python -m benchmarks.bulk_import --posts 100000
+    python -m benchmarks.bulk_import --format ndjson --db-url postgres://postgres@localhost/flux_bench
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+
+from benchmarks.common import DEFAULT_DB_URL, git_revision, init_db
+
+import orjson
+from httpx import ASGITransport, AsyncClient
+from tortoise import Tortoise
+
+from src.main import app
+from src.users.models import Profile, User
+from src.users.service import pwd_context
+
+USERNAME = "bulkbench"
+PASSWORD = "Benchmark1!"
+
+
+async def login(client: AsyncClient) -> dict:
+    if not await User.exists(username=USERNAME):
+        user = await User.create(username=USERNAME, password=pwd_context.hash(PASSWORD))
+        await Profile.create(user=user)
+    response = await client.post("/api/users/token", data={"username": USERNAME, "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def bulk_body(posts: int, fmt: str) -> tuple:
+    items = [{"title": f"imported {i}", "content": f"imported post body {i} " * 10} for i in range(posts)]
+    if fmt == "ndjson":
+        return b"\n".join(orjson.dumps(item) for item in items), "application/x-ndjson"
+    return orjson.dumps(items), "application/json"
+
+
+async def run(args: argparse.Namespace) -> dict:
+    await init_db(args.db_url)
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            auth = await login(client)
+
+            started = time.perf_counter()
+            for i in range(args.baseline):
+                response = await client.post("/api/posts/", json={"title": f"single {i}", "content": "body"},
+                                             headers=auth)
+                response.raise_for_status()
+            baseline_elapsed = time.perf_counter() - started
+
+            body, content_type = bulk_body(args.posts, args.format)
+            started = time.perf_counter()
+            response = await client.post("/api/posts/bulk", content=body,
+                                         headers={**auth, "Content-Type": content_type})
+            bulk_elapsed = time.perf_counter() - started
+            response.raise_for_status()
+            result = response.json()
+    finally:
+        await Tortoise.close_connections()
+
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "database": args.db_url.split(":", 1)[0],
+        "format": args.format,
+        "bulk": {
+            "posts": args.posts,
+            "created": result["created"],
+            "errors": len(result["errors"]),
+            "seconds": round(bulk_elapsed, 2),
+            "posts_per_second": round(result["created"] / bulk_elapsed, 1),
+        },
+        "single": {
+            "posts": args.baseline,
+            "seconds": round(baseline_elapsed, 2),
+            "posts_per_second": round(args.baseline / baseline_elapsed, 1) if args.baseline else 0.0,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--format", choices=("json", "ndjson"), default="json")
+    parser.add_argument("--baseline", type=int, default=500, help="posts created one request at a time")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Compare two benchmark results.
+
+Prints the change in RPS and p99 latency per endpoint between a baseline
+and a candidate JSON file written by ``benchmarks.http_api``:
+
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+
+
+def change(old: float, new: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(baseline: dict, candidate: dict) -> list:
+    rows = [("endpoint", "rps", "", "p99_ms", "")]
+    for name, new in candidate["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            continue
+        rows.append((
+            name,
+            f"{old['rps']} -> {new['rps']}", change(old["rps"], new["rps"]),
+            f"{old['p99_ms']} -> {new['p99_ms']}", change(old["p99_ms"], new["p99_ms"]),
+        ))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline.get('revision')} -> {candidate.get('revision')}")
+    rows = compare(baseline, candidate)
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    main()
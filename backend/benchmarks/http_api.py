@@ -0,0 +1,174 @@
+"""REST API throughput benchmark.
+
+Seeds a dataset (see ``benchmarks.seed``) and drives each endpoint with a
+fixed number of requests from ``--concurrency`` closed-loop clients, then
+prints RPS and latency percentiles per endpoint as JSON. Targets:
+
+* ``asgi`` (default): the app is called in-process through httpx's ASGI
+  transport, so only the application itself is measured.
+* ``uvicorn``: the app is served by uvicorn on a local port in this process
+  and requests go over TCP, adding HTTP parsing and socket overhead.
+* ``--url``: an already running server, e.g. ``uvicorn src.main:app``
+  pointed at the same database passed as ``--db-url``.
+
+Runs fully offline against SQLite (default, in memory) or a local Postgres:
+
+    python -m benchmarks.http_api --output before.json
+    python -m benchmarks.http_api --target uvicorn --db-url postgres://postgres@localhost/flux_bench
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import socket
+import sys
+import time
+
+from benchmarks.common import DEFAULT_DB_URL, git_revision, init_db, summarize
+from benchmarks.seed import PASSWORD, add_size_arguments, seed, size_arguments
+
+import uvicorn
+from httpx import ASGITransport, AsyncClient
+from tortoise import Tortoise
+
+from src.main import app
+
+# name -> (method, path); {username} is filled in from the seeded dataset
+ENDPOINTS = {
+    "posts_feed": ("GET", "/api/posts/"),
+    "channels": ("GET", "/api/chat/channels"),
+    "token": ("POST", "/api/users/token"),
+    "profile": ("GET", "/api/users/profile/{username}"),
+}
+
+# Logins are bcrypt-bound, so they get their own (smaller) request count
+LOGIN_ENDPOINTS = {"token"}
+WARMUP_REQUESTS = 10
+
+
+async def drive(client: AsyncClient, method: str, path: str, requests: int,
+                concurrency: int, **kwargs) -> dict:
+    """Issue ``requests`` requests from ``concurrency`` clients; summarize latencies."""
+    for _ in range(min(WARMUP_REQUESTS, requests)):
+        await client.request(method, path, **kwargs)
+
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return {**summarize(latencies, time.perf_counter() - started), "errors": errors}
+
+
+async def benchmark(client: AsyncClient, endpoints: list, requests: int,
+                    login_requests: int, concurrency: int) -> dict:
+    login = {"username": "bench0", "password": PASSWORD}
+    response = await client.post("/api/users/token", data=login)
+    response.raise_for_status()
+    auth = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    results = {}
+    for name in endpoints:
+        method, path = ENDPOINTS[name]
+        path = path.format(username="bench1")
+        if name in LOGIN_ENDPOINTS:
+            results[name] = await drive(client, method, path, login_requests, concurrency, data=login)
+        else:
+            results[name] = await drive(client, method, path, requests, concurrency, headers=auth)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    await init_db(args.db_url)
+    try:
+        dataset = await seed(**size_arguments(args))
+        options = dict(
+            endpoints=args.endpoints, requests=args.requests,
+            login_requests=args.login_requests, concurrency=args.concurrency,
+        )
+
+        if args.url:
+            target = "external"
+            async with AsyncClient(base_url=args.url) as client:
+                results = await benchmark(client, **options)
+        elif args.target == "uvicorn":
+            target = "uvicorn"
+            port = free_port()
+            # lifespan is off: the database is already initialised above
+            server = uvicorn.Server(uvicorn.Config(
+                app, host="127.0.0.1", port=port, lifespan="off", log_level="warning", access_log=False,
+            ))
+            serving = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            try:
+                async with AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+                    results = await benchmark(client, **options)
+            finally:
+                server.should_exit = True
+                await serving
+        else:
+            target = "asgi"
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+                results = await benchmark(client, **options)
+    finally:
+        await Tortoise.close_connections()
+
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "database": args.db_url.split(":", 1)[0],
+        "target": target,
+        "concurrency": args.concurrency,
+        "dataset": dataset,
+        "endpoints": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--target", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint")
+    parser.add_argument("--login-requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--log-level", default="WARNING",
+                        help="application log level; INFO logs every request to stderr")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    add_size_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    result = asyncio.run(run(args))
+    result["log_level"] = args.log_level.upper()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
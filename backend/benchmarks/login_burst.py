@@ -0,0 +1,94 @@
+"""Login burst benchmark.
+
+Fires a burst of concurrent ``POST /api/users/token`` requests at the app
+in-process while a probe client keeps requesting ``GET /api/posts/``, and
+reports latency percentiles for both as JSON. Run it with ``--inline`` to
+hash on the event loop (the old behaviour) for comparison:
+
+    python -m benchmarks.login_burst --logins 100
+    python -m benchmarks.login_burst --logins 100 --inline
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from benchmarks.common import init_db, summarize
+
+from httpx import ASGITransport, AsyncClient
+from tortoise import Tortoise
+
+from src.main import app
+from src.users import service
+
+PASSWORD = "Benchmark1!"
+
+
+class InlineHasher:
+    """Hashes on the calling thread, i.e. on the event loop."""
+
+    def __init__(self, context):
+        self.context = context
+
+    async def hash(self, password):
+        return self.context.hash(password)
+
+    async def verify(self, password, hashed):
+        return self.context.verify(password, hashed)
+
+
+async def run(logins: int, inline: bool) -> dict:
+    await init_db()
+    if inline:
+        service.password_hasher = InlineHasher(service.pwd_context)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        response = await client.post("/api/users/register", json={
+            "username": "bench", "email": "bench@example.com", "password": PASSWORD,
+        })
+        response.raise_for_status()
+
+        login_latencies, probe_latencies = [], []
+        burst_done = asyncio.Event()
+
+        async def login():
+            started = time.perf_counter()
+            await client.post("/api/users/token", data={"username": "bench", "password": PASSWORD})
+            login_latencies.append(time.perf_counter() - started)
+
+        async def probe():
+            while not burst_done.is_set():
+                started = time.perf_counter()
+                await client.get("/api/posts/")
+                probe_latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        probe_task = asyncio.create_task(probe())
+        await asyncio.gather(*[login() for _ in range(logins)])
+        burst_done.set()
+        await probe_task
+        elapsed = time.perf_counter() - started
+
+    await Tortoise.close_connections()
+    return {
+        "mode": "inline" if inline else "pool",
+        "hasher": service.password_hasher.stats() if not inline else None,
+        "login": summarize(login_latencies, elapsed),
+        "probe": summarize(probe_latencies, elapsed),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--inline", action="store_true", help="hash on the event loop")
+    args = parser.parse_args(argv)
+    result = asyncio.run(run(args.logins, args.inline))
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
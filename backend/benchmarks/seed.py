@@ -0,0 +1,194 @@
+"""Seed a deterministic benchmark dataset.
+
+Users are named ``bench0`` .. ``benchN`` and all share ``PASSWORD``; the
+password is hashed once so seeding stays fast at any size. Seeding a
+database that already holds a dataset of the requested sizes is a no-op,
+so the same Postgres database can be reused to compare commits; one of
+other sizes is refused rather than silently benchmarked:
+
+    python -m benchmarks.seed --db-url postgres://postgres@localhost/flux_bench --users 1000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+from datetime import timedelta
+
+from benchmarks.common import DEFAULT_DB_URL, init_db
+
+from tortoise import Tortoise, timezone
+from tortoise.functions import Count
+
+from src.chat.models import Channel, ChannelMember, Message
+from src.chat.service import recount_channels
+from src.posts.models import Post
+from src.users.models import Profile, User
+from src.users.service import pwd_context
+
+PASSWORD = "Benchmark1!"
+BATCH_SIZE = 1000
+
+DEFAULT_SIZES = {
+    "users": 200,
+    "posts": 2000,
+    "channels": 50,
+    "members_per_channel": 20,
+    "messages": 5000,
+}
+
+WORDS = (
+    "flux stream async latency socket channel message index cursor query pool "
+    "worker cache token batch shard queue replica commit vector search"
+).split()
+
+
+async def existing_sizes(seed: int) -> dict:
+    """The shape of the dataset already in the database, counted.
+
+    The random seed cannot be read back, so the requested one is reported.
+    """
+    channels = Channel.filter(name__startswith="bench-")
+    largest = await channels.annotate(member_count=Count("members")).order_by("-member_count").first()
+    return {
+        "users": await User.filter(username__startswith="bench").count(),
+        "posts": await Post.filter(user__username__startswith="bench").count(),
+        "channels": await channels.count(),
+        "members_per_channel": largest.member_count if largest is not None else 0,
+        "messages": await Message.filter(channel__name__startswith="bench-").count(),
+        "seed": seed,
+    }
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+async def seed(users: int, posts: int, channels: int, members_per_channel: int,
+               messages: int, seed: int = 0) -> dict:
+    """Create the dataset unless it already exists; return its shape.
+
+    An existing dataset is reused only when its row counts match the
+    requested ones; otherwise SystemExit says what is there.
+    """
+    sizes = {
+        "users": users, "posts": posts, "channels": channels,
+        "members_per_channel": members_per_channel, "messages": messages, "seed": seed,
+    }
+    if await User.exists(username="bench0"):
+        existing = await existing_sizes(seed)
+        # members_per_channel is not compared: owners and bench0 always join,
+        # so small values are rounded up when seeding
+        mismatched = [
+            f"{name}={existing[name]} (requested {sizes[name]})"
+            for name in ("users", "posts", "channels", "messages")
+            if existing[name] != sizes[name]
+        ]
+        if mismatched:
+            raise SystemExit(
+                "benchmark dataset already present with other sizes: " + ", ".join(mismatched)
+                + "; seed an empty database or pass the sizes above"
+            )
+        print("benchmark dataset already present, reusing it", file=sys.stderr)
+        return existing
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    hashed = pwd_context.hash(PASSWORD)
+
+    await User.bulk_create(
+        [User(username=f"bench{i}", email=f"bench{i}@example.com", password=hashed) for i in range(users)],
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = [row["id"] for row in await User.filter(username__startswith="bench").order_by("id").values("id")]
+    await Profile.bulk_create(
+        [Profile(user_id=user_id, bio=sentence(rng, 12)) for user_id in user_ids],
+        batch_size=BATCH_SIZE,
+    )
+
+    # Posts are spread one minute apart so feed pages have distinct timestamps
+    await Post.bulk_create(
+        [
+            Post(
+                user_id=rng.choice(user_ids), title=sentence(rng, 4), content=sentence(rng, 40),
+                created_at=now - timedelta(minutes=posts - i),
+            )
+            for i in range(posts)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    await Channel.bulk_create(
+        [
+            Channel(
+                name=f"bench-{i}-{rng.choice(WORDS)}", description=sentence(rng, 8),
+                is_public=i % 5 != 0, created_by_id=user_ids[i % len(user_ids)],
+            )
+            for i in range(channels)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    channel_rows = await Channel.filter(name__startswith="bench-").order_by("id").values("id", "created_by_id")
+
+    # bench0 belongs to every channel so authenticated routes see all of them
+    memberships = {}
+    for channel in channel_rows:
+        owner = channel["created_by_id"]
+        member_ids = [owner] if owner == user_ids[0] else [owner, user_ids[0]]
+        others = [user_id for user_id in user_ids if user_id not in member_ids]
+        member_ids += rng.sample(others, min(len(others), max(members_per_channel - len(member_ids), 0)))
+        memberships[channel["id"]] = member_ids
+    await ChannelMember.bulk_create(
+        [
+            ChannelMember(channel_id=channel_id, user_id=user_id, role="admin" if i == 0 else "member")
+            for channel_id, member_ids in memberships.items()
+            for i, user_id in enumerate(member_ids)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+    channel_ids = list(memberships)
+    message_rows = []
+    for i in range(messages):
+        channel_id = rng.choice(channel_ids)
+        message_rows.append(Message(
+            channel_id=channel_id, user_id=rng.choice(memberships[channel_id]),
+            content=sentence(rng, 15), created_at=now - timedelta(seconds=messages - i),
+        ))
+    await Message.bulk_create(message_rows, batch_size=BATCH_SIZE)
+    # bulk_create bypasses the chat service, so fill in the channel counters
+    await recount_channels()
+
+    return sizes
+
+
+def add_size_arguments(parser: argparse.ArgumentParser) -> None:
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+    parser.add_argument("--seed", type=int, default=0, help="random seed for generated content")
+
+
+def size_arguments(args: argparse.Namespace) -> dict:
+    return {name: getattr(args, name) for name in DEFAULT_SIZES} | {"seed": args.seed}
+
+
+async def run(db_url: str, sizes: dict) -> dict:
+    await init_db(db_url)
+    try:
+        return await seed(**sizes)
+    finally:
+        await Tortoise.close_connections()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    add_size_arguments(parser)
+    args = parser.parse_args(argv)
+    json.dump(asyncio.run(run(args.db_url, size_arguments(args))), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""List serialization benchmark.
+
+Measures rows per second for serializing list responses two ways:
+
+* ``response_model``: what FastAPI does when a route returns plain data;
+  every row is validated into the response model, dumped back to Python
+  and encoded with the stdlib ``json`` module.
+* ``fast``: ``FastJSONResponse(model_rows(...))``, as the list routes now do.
+
+    python -m benchmarks.serialization --rows 100 --repeat 200
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import timedelta
+
+from benchmarks.common import git_revision
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from tortoise import timezone
+
+from src.chat.schemas import ChannelResponse, MessageResponse
+from src.posts.schemas import PostWithUser
+from src.responses import FastJSONResponse, model_rows
+
+
+def sample_rows(model, rows: int) -> list:
+    """Rows shaped like ``QuerySet.values()`` output for ``model``."""
+    now = timezone.now()
+    values = {
+        "id": 1, "title": "A post title", "content": "Some content " * 20, "username": "alice",
+        "user": "alice", "name": "general", "description": "A channel", "is_public": True,
+        "created_by": "alice", "created_at": now, "updated_at": now,
+    }
+    return [
+        {**{name: values[name] for name in model.model_fields}, "id": i,
+         "created_at": now - timedelta(seconds=i)}
+        for i in range(rows)
+    ]
+
+
+async def response_model_path(field, rows) -> bytes:
+    content = await serialize_response(field=field, response_content=rows)
+    return JSONResponse(content).body
+
+
+async def fast_path(model, rows) -> bytes:
+    return FastJSONResponse(model_rows(model, rows)).body
+
+
+async def measure(func, rows: list, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await func(rows)
+    return round(len(rows) * repeat / (time.perf_counter() - started))
+
+
+async def run(rows: int, repeat: int) -> dict:
+    results = {}
+    for model in (PostWithUser, ChannelResponse, MessageResponse):
+        data = sample_rows(model, rows)
+        field = create_model_field(name="response", type_=list[model])
+        # Both paths must agree on the payload
+        assert json.loads(await response_model_path(field, data)) == json.loads(await fast_path(model, data))
+
+        before = await measure(lambda r: response_model_path(field, r), data, repeat)
+        after = await measure(lambda r: fast_path(model, r), data, repeat)
+        results[model.__name__] = {
+            "response_model_rows_per_second": before,
+            "fast_rows_per_second": after,
+            "speedup": round(after / before, 1),
+        }
+    return {"revision": git_revision(), "rows": rows, "repeat": repeat, "models": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100, help="rows per response")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+    json.dump(asyncio.run(run(args.rows, args.repeat)), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""WebSocket fan-out load harness.
+
+Spreads ``--clients`` connections over ``--channels`` channels, publishes
+``--rate`` messages per second (round-robin over channels) for
+``--duration`` seconds, and reports end-to-end delivery latency
+percentiles, throughput and memory per connection as JSON. Transports:
+
+* ``manager`` (default): in-memory sockets attached straight to a
+  ``ConnectionManager``. This isolates broadcast and per-connection queueing
+  and scales to tens of thousands of connections; memory per connection is
+  measured with tracemalloc and covers only what the manager allocates.
+* ``uvicorn``: real WebSocket clients connecting over local TCP to
+  ``/api/chat/ws/{channel_id}`` served in-process, so every message goes
+  through auth, the database insert and JSON encoding. Memory is the RSS
+  growth per client, client and server side together.
+
+Each client is a member of ``--channels-per-client`` consecutive channels.
+Over uvicorn it opens one socket per channel, or with ``--multiplexed`` a
+single ``/api/chat/ws`` socket subscribed to all of them; the ``manager``
+transport always uses one subscription per channel on a single connection.
+
+``--format`` picks the frame format uvicorn clients negotiate (see
+``src.chat.frames``), and ``--ws-compression none`` stops them offering
+transport-level permessage-deflate, which compresses every frame once per
+recipient. The result includes the average payload size clients received
+(before transport compression) and the process CPU time per delivery.
+
+``--slow-clients`` of the connections take ``--slow-delay`` seconds to accept
+each frame; latency is reported for the other clients only, so the numbers
+show whether slow consumers hold anyone else up:
+
+    python -m benchmarks.ws_fanout --clients 5000 --channels 100 --rate 500
+    python -m benchmarks.ws_fanout --clients 5000 --slow-clients 50 --slow-delay 1
+    python -m benchmarks.ws_fanout --transport uvicorn --clients 1000 --rate 100
+    python -m benchmarks.ws_fanout --transport uvicorn --clients 500 --channels-per-client 10 --multiplexed
+    python -m benchmarks.ws_fanout --transport uvicorn --format msgpack+deflate --ws-compression none
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import DEFAULT_DB_URL, git_revision, init_db, percentiles
+
+import uvicorn
+import websockets
+from tortoise import Tortoise
+
+from src.chat import ws_router
+from src.chat.broker import InProcessBroker
+from src.chat.frames import FORMATS, SUBPROTOCOLS, decode
+from src.chat.models import Channel, ChannelMember
+from src.chat.persistence import MessageWriter
+from src.chat.ws_router import ConnectionManager, MESSAGES_DROPPED
+from src.main import app
+from src.users.models import User
+from src.users.service import create_access_token
+
+# Seconds to keep receiving after the last message is sent
+DRAIN_TIMEOUT = 5.0
+CONNECT_BATCH = 100
+
+
+class Recorder:
+    """Collects delivery latencies from every client."""
+
+    def __init__(self):
+        self.latencies = []
+        self.deliveries = 0
+        self.payload_bytes = 0
+        self.slow_deliveries = 0
+
+    def record(self, sent_at: float, slow: bool) -> None:
+        if slow:
+            self.slow_deliveries += 1
+        else:
+            self.deliveries += 1
+            self.latencies.append(time.perf_counter() - sent_at)
+
+
+class BenchSocket:
+    """Stands in for a Starlette WebSocket on the ``manager`` transport."""
+
+    def __init__(self, recorder: Recorder, delay: float = 0):
+        self.recorder = recorder
+        self.delay = delay
+        self.close_code = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, message: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.recorder.record(float(message), slow=bool(self.delay))
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (Linux)."""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * 4096
+
+
+async def publish(args: argparse.Namespace, send) -> tuple:
+    """Call ``send(channel_index)`` at the target rate; return (sent, elapsed)."""
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for i in range(total):
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await send(i % args.channels)
+    return total, time.perf_counter() - started
+
+
+async def wait_for_deliveries(recorder: Recorder, expected: int) -> None:
+    deadline = time.perf_counter() + DRAIN_TIMEOUT
+    while recorder.deliveries < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+
+def is_slow(index: int, args: argparse.Namespace) -> bool:
+    # Client i joins channel i % channels, so the first N clients put one
+    # slow consumer into each of the first N channels
+    return index < args.slow_clients
+
+
+def channels_of(index: int, args: argparse.Namespace) -> list:
+    """Channel indexes client ``index`` belongs to."""
+    return [(index + j) % args.channels for j in range(args.channels_per_client)]
+
+
+def fast_clients_per_channel(args: argparse.Namespace) -> list:
+    counts = [0] * args.channels
+    for i in range(args.clients):
+        if not is_slow(i, args):
+            for channel_index in channels_of(i, args):
+                counts[channel_index] += 1
+    return counts
+
+
+async def run_manager(args: argparse.Namespace) -> dict:
+    recorder = Recorder()
+    manager = ConnectionManager(broker=InProcessBroker())
+    await manager.start()
+    sockets = [
+        BenchSocket(recorder, args.slow_delay if is_slow(i, args) else 0)
+        for i in range(args.clients)
+    ]
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for i, socket in enumerate(sockets):
+        conn = await manager.open(socket, None)
+        await manager.subscribe(conn, [channel_index + 1 for channel_index in channels_of(i, args)])
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    async def send(channel_index: int):
+        await manager.broadcast(repr(time.perf_counter()), channel_index + 1)
+
+    sent, elapsed = await publish(args, send)
+    fast_counts = fast_clients_per_channel(args)
+    expected = sum(fast_counts[i % args.channels] for i in range(sent))
+    await wait_for_deliveries(recorder, expected)
+
+    evicted = sum(1 for socket in sockets if socket.close_code is not None)
+    await manager.stop()
+    return {
+        "sent": sent, "elapsed": elapsed, "expected": expected, "evicted": evicted,
+        "sockets": args.clients,
+        "memory": {"manager_bytes_per_connection": round((after - before) / args.clients)},
+        "recorder": recorder,
+    }
+
+
+async def seed_ws(args: argparse.Namespace) -> list:
+    """Create one user per client and channel memberships; return (channel_ids, token) per client."""
+    await User.bulk_create(
+        [User(username=f"ws{i}", password="x") for i in range(args.clients)], batch_size=1000,
+    )
+    users = await User.filter(username__startswith="ws").order_by("id").values("id", "username")
+    await Channel.bulk_create(
+        [Channel(name=f"ws-{i}", created_by_id=users[0]["id"]) for i in range(args.channels)],
+        batch_size=1000,
+    )
+    channel_ids = [row["id"] for row in await Channel.filter(name__startswith="ws-").order_by("id").values("id")]
+    await ChannelMember.bulk_create(
+        [
+            ChannelMember(channel_id=channel_ids[channel_index], user_id=user["id"])
+            for i, user in enumerate(users)
+            for channel_index in channels_of(i, args)
+        ],
+        batch_size=1000,
+    )
+    return [
+        ([channel_ids[channel_index] for channel_index in channels_of(i, args)],
+         create_access_token({"sub": user["username"]}))
+        for i, user in enumerate(users)
+    ]
+
+
+async def run_uvicorn(args: argparse.Namespace) -> dict:
+    clients = await seed_ws(args)
+    recorder = Recorder()
+
+    # lifespan is off, so start what main's startup hook would
+    if args.write_behind:
+        ws_router.message_writer = MessageWriter()
+        await ws_router.message_writer.start()
+    await ws_router.manager.start()
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=args.port, lifespan="off", log_level="warning",
+        access_log=False, ws_max_queue=1024,
+    ))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    options = {
+        "max_queue": None,
+        "compression": None if args.ws_compression == "none" else "deflate",
+        "subprotocols": [SUBPROTOCOLS[args.format]] if args.format in SUBPROTOCOLS else None,
+    }
+
+    async def connect(channel_ids: list, token: str) -> list:
+        """Open a client's sockets; returns (channel_id, socket) per channel."""
+        if args.multiplexed:
+            connection = await websockets.connect(
+                f"ws://127.0.0.1:{port}/api/chat/ws?token={token}", **options,
+            )
+            await connection.send(json.dumps({"type": "subscribe", "channels": channel_ids}))
+            await connection.recv()
+            return [(channel_id, connection) for channel_id in channel_ids]
+        return [
+            (channel_id, await websockets.connect(
+                f"ws://127.0.0.1:{port}/api/chat/ws/{channel_id}?token={token}", **options,
+            ))
+            for channel_id in channel_ids
+        ]
+
+    async def receive(connection, slow: bool):
+        try:
+            async for frame in connection:
+                if slow:
+                    await asyncio.sleep(args.slow_delay)
+                if not slow:
+                    recorder.payload_bytes += len(frame)
+                recorder.record(float(decode(args.format, frame)["content"]), slow)
+        except websockets.ConnectionClosed:
+            pass
+
+    rss_before = current_rss()
+    client_sockets = []
+    for start in range(0, len(clients), CONNECT_BATCH):
+        batch = clients[start:start + CONNECT_BATCH]
+        client_sockets += await asyncio.gather(*[connect(*client) for client in batch])
+    rss_after = current_rss()
+    # (client index, socket) for every distinct socket
+    connections = [
+        (i, connection)
+        for i, sockets in enumerate(client_sockets)
+        for connection in dict.fromkeys(connection for _, connection in sockets)
+    ]
+    receivers = [
+        asyncio.create_task(receive(connection, is_slow(i, args)))
+        for i, connection in connections
+    ]
+
+    # The first fast client of each channel publishes into it
+    publishers = {}
+    for i, sockets in enumerate(client_sockets):
+        if not is_slow(i, args):
+            for channel_index, (channel_id, connection) in zip(channels_of(i, args), sockets):
+                publishers.setdefault(channel_index, (channel_id, connection))
+
+    async def send(channel_index: int):
+        if channel_index in publishers:
+            channel_id, connection = publishers[channel_index]
+            await connection.send(json.dumps({
+                "type": "message", "channel_id": channel_id, "content": repr(time.perf_counter()),
+            }))
+
+    cpu_before = time.process_time()
+    sent, elapsed = await publish(args, send)
+    fast_counts = fast_clients_per_channel(args)
+    expected = sum(fast_counts[i % args.channels] for i in range(sent) if i % args.channels in publishers)
+    await wait_for_deliveries(recorder, expected)
+    cpu = time.process_time() - cpu_before
+
+    evicted = sum(
+        1 for i, connection in connections
+        if is_slow(i, args) and connection.close_code == 1008
+    )
+    for _, connection in connections:
+        await connection.close()
+    for receiver in receivers:
+        receiver.cancel()
+    server.should_exit = True
+    await serving
+    await ws_router.manager.stop()
+    if args.write_behind:
+        await ws_router.message_writer.stop()
+    return {
+        "sent": sent, "elapsed": elapsed, "expected": expected, "evicted": evicted,
+        "sockets": len(connections),
+        "memory": {"rss_bytes_per_client": round((rss_after - rss_before) / args.clients)},
+        "cpu_us_per_delivery": round(cpu / max(recorder.deliveries, 1) * 1e6, 1),
+        "recorder": recorder,
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    # Every socket the harness opens is wanted: lift the connection caps
+    sockets = args.clients * args.channels_per_client
+    ws_router.CHAT_WS_MAX_CONNECTIONS = max(ws_router.CHAT_WS_MAX_CONNECTIONS, sockets)
+    ws_router.CHAT_WS_MAX_CONNECTIONS_PER_USER = max(ws_router.CHAT_WS_MAX_CONNECTIONS_PER_USER, sockets)
+    if args.transport == "uvicorn":
+        await init_db(args.db_url)
+        try:
+            outcome = await run_uvicorn(args)
+        finally:
+            await Tortoise.close_connections()
+    else:
+        outcome = await run_manager(args)
+
+    recorder = outcome["recorder"]
+    elapsed = outcome["elapsed"]
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "transport": args.transport,
+        "clients": args.clients,
+        "channels": args.channels,
+        "channels_per_client": args.channels_per_client,
+        "multiplexed": args.multiplexed,
+        "format": args.format,
+        "ws_compression": args.ws_compression,
+        "sockets": outcome["sockets"],
+        "rate": args.rate,
+        "duration": args.duration,
+        "messages_sent": outcome["sent"],
+        "messages_per_second": round(outcome["sent"] / elapsed, 1),
+        "deliveries": recorder.deliveries,
+        "deliveries_expected": outcome["expected"],
+        "deliveries_per_second": round(recorder.deliveries / elapsed, 1),
+        "latency": percentiles(recorder.latencies),
+        "slow_clients": {
+            "count": args.slow_clients,
+            "delay": args.slow_delay,
+            "deliveries": recorder.slow_deliveries,
+            "evicted": outcome["evicted"],
+        },
+        "dropped": {reason: int(count) for (reason,), count in MESSAGES_DROPPED.children.items()},
+        "memory": outcome["memory"],
+        "payload_bytes_per_delivery": round(recorder.payload_bytes / max(recorder.deliveries, 1), 1),
+        "cpu_us_per_delivery": outcome.get("cpu_us_per_delivery"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transport", choices=("manager", "uvicorn"), default="manager")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--channels-per-client", type=int, default=1)
+    parser.add_argument("--multiplexed", action="store_true",
+                        help="uvicorn transport: one /api/chat/ws socket per client instead of one per channel")
+    parser.add_argument("--format", choices=("json", *FORMATS.values()), default="json",
+                        help="uvicorn transport: frame format clients negotiate")
+    parser.add_argument("--ws-compression", choices=("deflate", "none"), default="deflate",
+                        help="uvicorn transport: whether clients offer permessage-deflate")
+    parser.add_argument("--rate", type=float, default=200, help="messages published per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to publish for")
+    parser.add_argument("--slow-clients", type=int, default=0)
+    parser.add_argument("--slow-delay", type=float, default=1.0, help="seconds a slow client takes per frame")
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL, help="uvicorn transport only")
+    parser.add_argument("--port", type=int, default=0, help="uvicorn transport only; 0 picks a free port")
+    parser.add_argument("--write-behind", action="store_true", help="uvicorn transport: batch message inserts")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
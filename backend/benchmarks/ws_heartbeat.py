@@ -0,0 +1,142 @@
+"""WebSocket heartbeat and reaper benchmark.
+
+Attaches ``--clients`` in-memory sockets to a ``ConnectionManager`` spread
+over ``--channels`` channels, of which ``--dead-clients`` behave like
+vanished TCP peers: sends to them still succeed (the kernel buffers them)
+but they never answer a ping. Messages are then broadcast at ``--rate``
+per second for ``--duration`` seconds while the reaper runs with
+``--ping-interval`` and ``--ping-timeout``; ``--ping-interval 0`` turns
+heartbeats off for comparison. Reported as JSON at the start and the end:
+connections tracked, message frames delivered per broadcast, broadcast
+CPU time and the memory those connections hold (measured per connection
+with tracemalloc while attaching them):
+
+    python -m benchmarks.ws_heartbeat --clients 10000 --dead-clients 5000
+    python -m benchmarks.ws_heartbeat --clients 10000 --dead-clients 5000 --ping-interval 0
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import git_revision
+
+from src.chat import ws_router
+from src.chat.broker import InProcessBroker
+from src.chat.ws_router import CONNECTIONS_REAPED, ConnectionManager
+
+
+class HeartbeatSocket:
+    """Stands in for a Starlette WebSocket; a live one answers pings at once."""
+
+    def __init__(self, alive: bool):
+        self.alive = alive
+        self.conn = None
+        self.messages = 0
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, message: str):
+        if message != ws_router.PING.json:
+            self.messages += 1
+        elif self.alive:
+            # What receive() records when the pong arrives
+            self.conn.last_seen = time.monotonic()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def measure(manager: ConnectionManager, sockets: list, args: argparse.Namespace,
+                  bytes_per_connection: float) -> dict:
+    """Broadcast one message per channel and report what it cost."""
+    delivered = sum(socket.messages for socket in sockets)
+    started = time.process_time()
+    for channel_id in range(1, args.channels + 1):
+        await manager.broadcast(repr(time.perf_counter()), channel_id)
+    await asyncio.sleep(0.1)
+    cpu = time.process_time() - started
+    delivered = sum(socket.messages for socket in sockets) - delivered
+    return {
+        "connections": len(manager.connections),
+        "frames_per_broadcast": round(delivered / args.channels, 1),
+        "cpu_ms_per_broadcast": round(cpu / args.channels * 1000, 3),
+        "connection_bytes": round(len(manager.connections) * bytes_per_connection),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    ws_router.CHAT_WS_PING_INTERVAL = args.ping_interval
+    ws_router.CHAT_WS_PING_TIMEOUT = args.ping_timeout
+    ws_router.CHAT_WS_MAX_CONNECTIONS = max(ws_router.CHAT_WS_MAX_CONNECTIONS, args.clients)
+    manager = ConnectionManager(broker=InProcessBroker())
+    await manager.start()
+
+    sockets = [HeartbeatSocket(alive=i >= args.dead_clients) for i in range(args.clients)]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for i, socket in enumerate(sockets):
+        conn = await manager.open(socket, None)
+        await manager.subscribe(conn, [i % args.channels + 1])
+        # Only live sockets keep their connection, to answer pings
+        if socket.alive:
+            socket.conn = conn
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    bytes_per_connection = (after - before) / args.clients
+    start = await measure(manager, sockets, args, bytes_per_connection)
+
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for i in range(total):
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await manager.broadcast(repr(time.perf_counter()), i % args.channels + 1)
+    end = await measure(manager, sockets, args, bytes_per_connection)
+    await manager.stop()
+
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "clients": args.clients,
+        "dead_clients": args.dead_clients,
+        "channels": args.channels,
+        "ping_interval": args.ping_interval,
+        "ping_timeout": args.ping_timeout,
+        "duration": args.duration,
+        "reaped": {reason: int(count) for (reason,), count in CONNECTIONS_REAPED.children.items()},
+        "start": start,
+        "end": end,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--dead-clients", type=int, default=5000)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=100, help="messages broadcast per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds to broadcast for")
+    parser.add_argument("--ping-interval", type=float, default=1.0, help="0 turns heartbeats off")
+    parser.add_argument("--ping-timeout", type=float, default=1.0)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
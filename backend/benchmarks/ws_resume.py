@@ -0,0 +1,191 @@
+"""WebSocket reconnect storm benchmark.
+
+``--clients`` sockets that were ``--gap`` messages behind reconnect at once,
+in waves of ``--waves``. Each wave is measured three ways and reported as
+JSON: elapsed time, database queries and where replays came from.
+
+* ``refetch``: every client reloads ``GET /api/chat/channels/{id}``, as
+  clients had to before sockets could resume.
+* ``resume_cold``: sockets resume with ``last_seen_id`` on a worker with no
+  sockets for the channel, so the first replays read the database.
+* ``resume_warm``: the same storm again while the channel has live
+  sockets, so the ring buffer covers the gap.
+
+The endpoint coroutines are driven directly with in-memory sockets, so
+only application work and queries are measured:
+
+    python -m benchmarks.ws_resume --clients 1000 --gap 50
+    python -m benchmarks.ws_resume --db-url postgres://postgres@localhost/flux_bench
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+
+from benchmarks.common import DEFAULT_DB_URL, git_revision, init_db
+
+from httpx import ASGITransport, AsyncClient
+from tortoise import Tortoise
+from fastapi import WebSocketDisconnect
+
+from src.chat import ws_router
+from src.chat.broker import InProcessBroker
+from src.chat.models import Channel, ChannelMember, Message
+from src.chat.service import recount_channels
+from src.chat.ws_router import RESUMES, ConnectionManager, websocket_endpoint
+from src.main import app
+from src.query_counter import track_queries
+from src.users.models import User
+from src.users.service import create_access_token
+
+USERNAME = "resumebench"
+
+
+class ResumingSocket:
+    """Stands in for a Starlette WebSocket; done once ``expected`` messages arrived."""
+
+    scope = {"subprotocols": []}
+
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.received = 0
+        self.done = asyncio.Event()
+        self._closed = asyncio.Event()
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def receive_text(self) -> str:
+        await self._closed.wait()
+        raise WebSocketDisconnect()
+
+    async def send_text(self, message: str):
+        self.received += 1
+        if self.received >= self.expected:
+            self.done.set()
+
+    async def close(self, code: int = 1000):
+        self._closed.set()
+
+    def hang_up(self):
+        self._closed.set()
+
+
+async def seed(args: argparse.Namespace) -> tuple:
+    user = await User.get_or_none(username=USERNAME) or await User.create(username=USERNAME, password="x")
+    channel = await Channel.create(name=f"resume-{int(time.time())}", created_by=user)
+    await ChannelMember.create(channel=channel, user=user, role="admin")
+    await Message.bulk_create(
+        [Message(channel=channel, user=user, content=f"message {i}") for i in range(args.history + args.gap)],
+        batch_size=1000,
+    )
+    await recount_channels()
+    ids = await Message.filter(channel=channel).order_by("id").values_list("id", flat=True)
+    return channel.id, ids[args.history - 1], create_access_token({"sub": USERNAME})
+
+
+async def resume_storm(args, channel_id: int, last_seen_id: int, token: str) -> tuple:
+    sockets = [ResumingSocket(args.gap) for _ in range(args.clients)]
+    started = time.perf_counter()
+    with track_queries() as stats:
+        tasks = [
+            asyncio.create_task(websocket_endpoint(socket, channel_id, token, last_seen_id=last_seen_id))
+            for socket in sockets
+        ]
+        await asyncio.gather(*[socket.done.wait() for socket in sockets])
+    elapsed = time.perf_counter() - started
+    return sockets, tasks, elapsed, stats.count
+
+
+async def refetch_storm(args, channel_id: int, token: str) -> tuple:
+    headers = {"Authorization": f"Bearer {token}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        started = time.perf_counter()
+        with track_queries() as stats:
+            responses = await asyncio.gather(*[
+                client.get(f"/api/chat/channels/{channel_id}", headers=headers) for _ in range(args.clients)
+            ])
+        elapsed = time.perf_counter() - started
+    for response in responses:
+        response.raise_for_status()
+    return elapsed, stats.count
+
+
+def result(elapsed: float, queries: int, clients: int, **extra) -> dict:
+    return {
+        "seconds": round(elapsed, 3),
+        "clients_per_second": round(clients / elapsed, 1),
+        "queries": queries,
+        **extra,
+    }
+
+
+def resume_sources() -> dict:
+    return {source: int(count) for (source,), count in RESUMES.children.items()}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    await init_db(args.db_url)
+    manager = ConnectionManager(broker=InProcessBroker())
+    ws_router.manager = manager
+    # Both storms' sockets belong to one user
+    ws_router.CHAT_WS_MAX_CONNECTIONS = max(ws_router.CHAT_WS_MAX_CONNECTIONS, 2 * args.clients)
+    ws_router.CHAT_WS_MAX_CONNECTIONS_PER_USER = 2 * args.clients
+    await manager.start()
+    try:
+        channel_id, last_seen_id, token = await seed(args)
+        elapsed, queries = await refetch_storm(args, channel_id, token)
+        refetch = result(elapsed, queries, args.clients)
+
+        RESUMES.children.clear()
+        cold_sockets, cold_tasks, elapsed, queries = await resume_storm(args, channel_id, last_seen_id, token)
+        cold = result(elapsed, queries, args.clients, sources=resume_sources())
+
+        # The cold storm's sockets stay connected, keeping the buffer live
+        RESUMES.children.clear()
+        warm_sockets, warm_tasks, elapsed, queries = await resume_storm(args, channel_id, last_seen_id, token)
+        warm = result(elapsed, queries, args.clients, sources=resume_sources())
+
+        for socket in cold_sockets + warm_sockets:
+            socket.hang_up()
+        await asyncio.gather(*cold_tasks, *warm_tasks)
+    finally:
+        await manager.stop()
+        await Tortoise.close_connections()
+
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "database": args.db_url.split(":", 1)[0],
+        "clients": args.clients,
+        "gap": args.gap,
+        "refetch": refetch,
+        "resume_cold": cold,
+        "resume_warm": warm,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--gap", type=int, default=50, help="messages each client missed")
+    parser.add_argument("--history", type=int, default=1000, help="older messages in the channel")
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "channels" ADD COLUMN IF NOT EXISTS "member_count" INT NOT NULL  DEFAULT 0;
+        ALTER TABLE "channels" ADD COLUMN IF NOT EXISTS "message_count" INT NOT NULL  DEFAULT 0;
+        ALTER TABLE "channels" ADD COLUMN IF NOT EXISTS "last_message_id" INT;
+        ALTER TABLE "channels" ADD COLUMN IF NOT EXISTS "last_message_at" TIMESTAMPTZ;
+        ALTER TABLE "channels" ADD COLUMN IF NOT EXISTS "last_message_preview" VARCHAR(200);
+        ALTER TABLE "channels" ADD COLUMN IF NOT EXISTS "last_message_user" VARCHAR(50);
+        UPDATE "channels" c SET
+            "member_count" = (SELECT COUNT(*) FROM "channel_members" m WHERE m."channel_id" = c."id"),
+            "message_count" = (SELECT COUNT(*) FROM "messages" m WHERE m."channel_id" = c."id");
+        UPDATE "channels" c SET
+            "last_message_id" = last."id",
+            "last_message_at" = last."created_at",
+            "last_message_preview" = SUBSTR(last."content", 1, 200),
+            "last_message_user" = last."username"
+        FROM (
+            SELECT DISTINCT ON (m."channel_id") m."channel_id", m."id", m."created_at", m."content", u."username"
+            FROM "messages" m JOIN "users" u ON u."id" = m."user_id"
+            ORDER BY m."channel_id", m."id" DESC
+        ) last
+        WHERE last."channel_id" = c."id";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "channels" DROP COLUMN IF EXISTS "member_count";
+        ALTER TABLE "channels" DROP COLUMN IF EXISTS "message_count";
+        ALTER TABLE "channels" DROP COLUMN IF EXISTS "last_message_id";
+        ALTER TABLE "channels" DROP COLUMN IF EXISTS "last_message_at";
+        ALTER TABLE "channels" DROP COLUMN IF EXISTS "last_message_preview";
+        ALTER TABLE "channels" DROP COLUMN IF EXISTS "last_message_user";"""
@@ -0,0 +1,16 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "channel_members" ADD COLUMN IF NOT EXISTS "last_read_message_id" INT;
+        UPDATE "channel_members" m SET "last_read_message_id" = c."last_message_id"
+        FROM "channels" c
+        WHERE c."id" = m."channel_id" AND m."last_read_message_id" IS NULL;
+        CREATE INDEX IF NOT EXISTS "idx_channel_mem_user_id_7bcb30" ON "channel_members" ("user_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_channel_mem_user_id_7bcb30";
+        ALTER TABLE "channel_members" DROP COLUMN IF EXISTS "last_read_message_id";"""
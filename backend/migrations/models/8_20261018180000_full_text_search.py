@@ -0,0 +1,17 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "posts" ADD COLUMN IF NOT EXISTS "search_vector" TSVECTOR GENERATED ALWAYS AS (setweight(to_tsvector('english', coalesce("title", '')), 'A') || setweight(to_tsvector('english', "content"), 'B')) STORED;
+        CREATE INDEX IF NOT EXISTS "idx_posts_search_vector" ON "posts" USING GIN ("search_vector");
+        ALTER TABLE "messages" ADD COLUMN IF NOT EXISTS "search_vector" TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', "content")) STORED;
+        CREATE INDEX IF NOT EXISTS "idx_messages_search_vector" ON "messages" USING GIN ("search_vector");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_messages_search_vector";
+        ALTER TABLE "messages" DROP COLUMN IF EXISTS "search_vector";
+        DROP INDEX IF EXISTS "idx_posts_search_vector";
+        ALTER TABLE "posts" DROP COLUMN IF EXISTS "search_vector";"""
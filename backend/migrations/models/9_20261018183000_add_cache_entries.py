@@ -0,0 +1,15 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE UNLOGGED TABLE IF NOT EXISTS "cache_entries" (
+    "key" VARCHAR(255) NOT NULL  PRIMARY KEY,
+    "value" TEXT NOT NULL,
+    "expires_at" TIMESTAMPTZ NOT NULL
+);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "cache_entries";"""
@@ -0,0 +1,237 @@
+# global read-through cache
+
+import abc
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+from tortoise import timezone
+
+from src.metrics import REGISTRY, Counter, Gauge
+from src.models import CacheEntry
+
+# result is one of: hit (process tier), shared_hit, miss (loader ran) and
+# coalesced (waited on a load already in flight for the same key)
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "cache_requests_total", "Cache lookups by cache and result", ("cache", "result"),
+))
+CACHE_INVALIDATIONS = REGISTRY.register(Counter(
+    "cache_invalidations_total", "Keys dropped because the underlying data changed", ("cache",),
+))
+
+
+class SharedCacheBackend(abc.ABC):
+    """Cache tier shared by all workers.
+
+    Values must be JSON-serializable; a missing or expired key reads as None.
+    Every key has a version that ``delete`` bumps, and ``set`` only stores a
+    value if the key is still at the version its caller read before loading.
+    A worker that read the database before another worker's write therefore
+    cannot overwrite the invalidation with what it read.
+    """
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Tuple[Optional[Any], int]:
+        """The value (None on a miss) and the key's current version."""
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: Any, ttl: float, version: int) -> None:
+        """Store ``value`` unless the key has moved past ``version``."""
+
+    @abc.abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """Drop the values and bump the versions of ``keys``."""
+
+
+class InMemorySharedBackend(SharedCacheBackend):
+    """Stand-in for a shared backend within one process.
+
+    Values round-trip through JSON like they would in a real shared store.
+    Several ``Cache`` instances given the same backend behave like workers
+    sharing it, which is how the shared tier is tested.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, tuple] = {}
+        self._versions: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Tuple[Optional[Any], int]:
+        version = self._versions.get(key, 0)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None, version
+        return orjson.loads(entry[0]), version
+
+    async def set(self, key: str, value: Any, ttl: float, version: int) -> None:
+        if self._versions.get(key, 0) == version:
+            self._entries[key] = (orjson.dumps(value), time.monotonic() + ttl)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+
+# One statement each, so a set and a delete racing on the same key cannot
+# interleave: the conditional upsert only writes over the version it read.
+CACHE_SET_SQL = """
+    INSERT INTO "cache_entries" ("key", "value", "expires_at", "version") VALUES ($1, $2, $3, $4)
+    ON CONFLICT ("key") DO UPDATE SET "value" = EXCLUDED."value", "expires_at" = EXCLUDED."expires_at"
+    WHERE "cache_entries"."version" = EXCLUDED."version"
+"""
+CACHE_DELETE_SQL = """
+    INSERT INTO "cache_entries" ("key", "value", "expires_at", "version")
+    SELECT key, 'null', now(), 1 FROM unnest($1::text[]) AS key
+    ON CONFLICT ("key") DO UPDATE SET "expires_at" = now(), "version" = "cache_entries"."version" + 1
+"""
+
+
+class PostgresCacheBackend(SharedCacheBackend):
+    """Shared tier in the unlogged ``cache_entries`` table.
+
+    A hit is one primary-key lookup, in place of the joins and Pydantic work
+    the loader does. Expired rows are overwritten by the next miss for the
+    key; invalidated ones stay behind, expired, to carry the key's version.
+    """
+
+    async def get(self, key: str) -> Tuple[Optional[Any], int]:
+        row = await CacheEntry.filter(key=key).first().values("value", "expires_at", "version")
+        if row is None:
+            return None, 0
+        if row["expires_at"] <= timezone.now():
+            return None, row["version"]
+        return orjson.loads(row["value"]), row["version"]
+
+    async def set(self, key: str, value: Any, ttl: float, version: int) -> None:
+        await CacheEntry._meta.db.execute_query(CACHE_SET_SQL, [
+            key, orjson.dumps(value).decode(), timezone.now() + timedelta(seconds=ttl), version,
+        ])
+
+    async def delete(self, *keys: str) -> None:
+        await CacheEntry._meta.db.execute_query(CACHE_DELETE_SQL, [list(keys)])
+
+
+class Cache:
+    """Read-through cache: a per-process LRU in front of an optional shared tier.
+
+    ``get_or_load`` serves from the process tier, then the shared tier, and
+    only then runs the loader. Concurrent misses for one key share a single
+    load (single-flight), so a popular key expiring does not send a burst of
+    identical queries to the database. Loaders return None for "not found",
+    which is never cached.
+
+    ``invalidate`` drops a key from both tiers and discards any load for it
+    still in flight, so a result read before the write cannot be stored after
+    it; in the shared tier the key's version does the same for loads running
+    on other workers. The process tier of other workers is not reached; with a shared tier
+    its entries live only ``local_ttl`` seconds to bound that staleness.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float,
+                 shared: Optional[SharedCacheBackend] = None, local_ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self.local_ttl = ttl if local_ttl is None else min(local_ttl, ttl)
+        self._entries: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                CACHE_REQUESTS.inc(self.name, "hit")
+                return value
+            del self._entries[key]
+
+        load = self._inflight.get(key)
+        if load is not None:
+            CACHE_REQUESTS.inc(self.name, "coalesced")
+        else:
+            load = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = load
+            load.add_done_callback(lambda task: self._finish(key, task))
+        # A cancelled caller must not cancel the load other callers wait on
+        return await asyncio.shield(load)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        this_load = asyncio.current_task()
+        version = 0
+        if self.shared is not None:
+            value, version = await self.shared.get(key)
+            if value is not None:
+                CACHE_REQUESTS.inc(self.name, "shared_hit")
+                if self._inflight.get(key) is this_load:
+                    self._store(key, value)
+                return value
+
+        CACHE_REQUESTS.inc(self.name, "miss")
+        value = await loader()
+        # Skip storing when the key was invalidated while the loader ran: here
+        # by dropping the load, by other workers through the shared version
+        if value is not None and self._inflight.get(key) is this_load:
+            self._store(key, value)
+            if self.shared is not None:
+                await self.shared.set(key, value, self.ttl, version)
+        return value
+
+    def _finish(self, key: str, load: asyncio.Task) -> None:
+        if self._inflight.get(key) is load:
+            del self._inflight[key]
+
+    def _store(self, key: str, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic() + self.local_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+        CACHE_INVALIDATIONS.inc(self.name, amount=len(keys))
+        if self.shared is not None:
+            await self.shared.delete(*keys)
+
+    def clear(self) -> None:
+        """Empty the process tier."""
+        self._entries.clear()
+        self._inflight.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Every cache built by create_cache, by name, for metrics and tests
+CACHES: Dict[str, Cache] = {}
+
+
+def create_shared_backend(backend: str) -> Optional[SharedCacheBackend]:
+    if backend == "postgres":
+        return PostgresCacheBackend()
+    if backend == "memory":
+        return None
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def create_cache(name: str, backend: str, maxsize: int, ttl: float, local_ttl: float) -> Cache:
+    shared = create_shared_backend(backend)
+    cache = Cache(name, maxsize, ttl, shared, local_ttl if shared is not None else None)
+    CACHES[name] = cache
+    return cache
+
+
+def collect_cache_metrics():
+    entries = Gauge("cache_entries", "Entries in this worker's process tier, per cache", ("cache",))
+    for name, cache in CACHES.items():
+        entries.set(len(cache), name)
+    return [entries]
+
+
+REGISTRY.add_collector(collect_cache_metrics)
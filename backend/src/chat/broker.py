@@ -0,0 +1,219 @@
+# chat/broker.py
+
+import abc
+import asyncio
+import json
+import logging
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+import asyncpg
+from tortoise import connections
+
+logger = logging.getLogger(__name__)
+
+# (channel_id, message, message_id). ``message`` is None when the frame was
+# too large to relay; the handler then loads message ``message_id`` itself.
+MessageHandler = Callable[[int, Optional[str], Optional[int]], Awaitable[None]]
+# Called when frames may have been lost in transit, e.g. while reconnecting
+GapHandler = Callable[[], None]
+
+
+class Broker(abc.ABC):
+    """Fan-out of chat frames between workers.
+
+    ``ConnectionManager`` delivers to its own sockets directly and publishes
+    through the broker so that other workers holding sockets for the same
+    channel receive the frame too. A worker only subscribes to channels it
+    currently has local sockets for.
+    """
+
+    async def start(self, handler: MessageHandler, on_gap: Optional[GapHandler] = None) -> None:
+        self._handler = handler
+        self._on_gap = on_gap
+
+    async def stop(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def subscribe(self, channel_id: int) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def unsubscribe(self, channel_id: int) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def publish(self, channel_id: int, message: str, message_id: Optional[int] = None) -> None:
+        ...
+
+
+class InProcessBroker(Broker):
+    """Broker for a single process.
+
+    Brokers created with the same ``hub`` forward frames to each other, which
+    lets several ``ConnectionManager`` instances stand in for workers in tests.
+    """
+
+    def __init__(self, hub: Optional[Dict[int, Set["InProcessBroker"]]] = None):
+        self._hub = hub if hub is not None else {}
+        self._handler: Optional[MessageHandler] = None
+
+    async def subscribe(self, channel_id: int) -> None:
+        self._hub.setdefault(channel_id, set()).add(self)
+
+    async def unsubscribe(self, channel_id: int) -> None:
+        subscribers = self._hub.get(channel_id)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self._hub[channel_id]
+
+    async def publish(self, channel_id: int, message: str, message_id: Optional[int] = None) -> None:
+        for broker in list(self._hub.get(channel_id, ())):
+            if broker is not self and broker._handler is not None:
+                await broker._handler(channel_id, message, message_id)
+
+    async def stop(self) -> None:
+        for channel_id in list(self._hub):
+            await self.unsubscribe(channel_id)
+
+
+class PostgresBroker(Broker):
+    """Broker backed by Postgres LISTEN/NOTIFY.
+
+    Listens on a dedicated connection opened with the Tortoise client's
+    settings, outside its pool, and publishes with ``pg_notify`` through the
+    regular client. If the listening connection drops, the broker reconnects
+    and LISTENs again on every subscribed channel. Each worker tags its
+    notifications so it can skip its own frames, which it has already
+    delivered locally.
+
+    Frames too large for a NOTIFY payload are sent as their message id and
+    each receiving worker loads the message from the database.
+    """
+
+    # NOTIFY payloads must be shorter than 8000 bytes
+    MAX_PAYLOAD_SIZE = 7999
+    # Seconds between attempts to reopen a dropped listening connection
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, connection_name: str = "default", prefix: str = "chat"):
+        self.connection_name = connection_name
+        self.prefix = prefix
+        self.worker_id = uuid.uuid4().hex
+        self._handler: Optional[MessageHandler] = None
+        self._on_gap: Optional[GapHandler] = None
+        self._listen_conn: Optional[asyncpg.Connection] = None
+        self._channels: Set[int] = set()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._consumer: Optional[asyncio.Task] = None
+        self._reconnecting: Optional[asyncio.Task] = None
+
+    def _pg_channel(self, channel_id: int) -> str:
+        return f"{self.prefix}_{channel_id}"
+
+    async def _connect(self) -> asyncpg.Connection:
+        client = connections.get(self.connection_name)
+        conn = await asyncpg.connect(
+            host=client.host, port=client.port, user=client.user,
+            password=client.password, database=client.database,
+            ssl=client.extra.get("ssl"), server_settings=client.server_settings,
+        )
+        conn.add_termination_listener(self._on_termination)
+        for channel_id in self._channels:
+            await conn.add_listener(self._pg_channel(channel_id), self._on_notify)
+        return conn
+
+    async def start(self, handler: MessageHandler, on_gap: Optional[GapHandler] = None) -> None:
+        await super().start(handler, on_gap)
+        self._listen_conn = await self._connect()
+        self._consumer = asyncio.create_task(self._consume())
+        logger.info(f"Postgres broker started (worker {self.worker_id})")
+
+    async def stop(self) -> None:
+        for task in (self._consumer, self._reconnecting):
+            if task is not None:
+                task.cancel()
+        self._consumer = self._reconnecting = None
+        self._channels.clear()
+        if self._listen_conn is not None:
+            conn, self._listen_conn = self._listen_conn, None
+            conn.remove_termination_listener(self._on_termination)
+            await conn.close()
+        logger.info(f"Postgres broker stopped (worker {self.worker_id})")
+
+    def _on_termination(self, connection) -> None:
+        if connection is not self._listen_conn:
+            return
+        logger.warning(f"Postgres broker lost its listening connection (worker {self.worker_id})")
+        self._listen_conn = None
+        self._reconnecting = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while True:
+            try:
+                conn = await self._connect()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning(f"Postgres broker reconnect failed: {e}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+                continue
+            self._listen_conn = conn
+            self._reconnecting = None
+            logger.info(f"Postgres broker reconnected (worker {self.worker_id})")
+            # Anything published while we were not listening is gone
+            if self._on_gap is not None:
+                self._on_gap()
+            return
+
+    async def subscribe(self, channel_id: int) -> None:
+        if channel_id in self._channels:
+            return
+        self._channels.add(channel_id)
+        # While reconnecting, the new connection listens on every channel
+        if self._listen_conn is not None:
+            await self._listen_conn.add_listener(self._pg_channel(channel_id), self._on_notify)
+
+    async def unsubscribe(self, channel_id: int) -> None:
+        if channel_id not in self._channels:
+            return
+        self._channels.discard(channel_id)
+        if self._listen_conn is not None:
+            await self._listen_conn.remove_listener(self._pg_channel(channel_id), self._on_notify)
+
+    async def publish(self, channel_id: int, message: str, message_id: Optional[int] = None) -> None:
+        payload = json.dumps({"w": self.worker_id, "m": message})
+        if len(payload.encode()) > self.MAX_PAYLOAD_SIZE:
+            if message_id is None:
+                logger.warning(f"Message for channel {channel_id} too large to publish to other workers")
+                return
+            payload = json.dumps({"w": self.worker_id, "id": message_id})
+        client = connections.get(self.connection_name)
+        await client.execute_query(
+            "SELECT pg_notify($1, $2)", [self._pg_channel(channel_id), payload]
+        )
+
+    def _on_notify(self, connection, pid, pg_channel: str, payload: str) -> None:
+        # asyncpg calls listeners synchronously; hand off to the consumer task
+        # so frames are delivered in the order they were received
+        self._queue.put_nowait((pg_channel, payload))
+
+    async def _consume(self) -> None:
+        while True:
+            pg_channel, payload = await self._queue.get()
+            try:
+                data = json.loads(payload)
+                if data["w"] == self.worker_id:
+                    continue
+                channel_id = int(pg_channel.rsplit("_", 1)[1])
+                await self._handler(channel_id, data.get("m"), data.get("id"))
+            except Exception as e:
+                logger.error(f"Error delivering notification on {pg_channel}: {e}", exc_info=True)
+
+
+def create_broker(backend: str) -> Broker:
+    if backend == "postgres":
+        return PostgresBroker()
+    if backend == "memory":
+        return InProcessBroker()
+    raise ValueError(f"Unknown chat broker backend: {backend}")
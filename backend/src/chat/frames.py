@@ -0,0 +1,132 @@
+# chat/frames.py
+
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Union
+
+import msgpack
+
+from src.config import CHAT_WS_DEFLATE_LEVEL
+
+# Wire formats, negotiated as a WebSocket subprotocol at connect time. A
+# client that offers none of these gets JSON text frames.
+JSON = "json"
+FORMATS = {
+    "flux.msgpack": "msgpack",
+    "flux.msgpack+deflate": "msgpack+deflate",
+    "flux.json+deflate": "json+deflate",
+}
+SUBPROTOCOLS = {format: subprotocol for subprotocol, format in FORMATS.items()}
+
+
+def negotiate(offered: list) -> str:
+    """The format for the first subprotocol the client offered that we speak."""
+    for subprotocol in offered:
+        if subprotocol in FORMATS:
+            return FORMATS[subprotocol]
+    return JSON
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} as JSON")
+
+
+def _encode_json(data: dict) -> str:
+    if data.get("type") == "message":
+        # JSON frames have always carried message ids as strings
+        data = {**data, "id": str(data["id"])}
+    return json.dumps(data, default=_json_value)
+
+
+def _msgpack_value(value):
+    # msgpack's timestamp extension needs an aware datetime
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def _encode_msgpack(data: dict) -> bytes:
+    # Ids stay integers and timestamps use the timestamp extension
+    return msgpack.packb(data, datetime=True, default=_msgpack_value)
+
+
+def _deflate(payload: bytes) -> bytes:
+    # Raw DEFLATE, one frame at a time: no shared window, so the same bytes
+    # can go to every subscriber
+    compressor = zlib.compressobj(CHAT_WS_DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(payload) + compressor.flush()
+
+
+def _inflate(payload: bytes) -> bytes:
+    return zlib.decompress(payload, -zlib.MAX_WBITS)
+
+
+class Frame:
+    """One outgoing frame, encoded at most once per wire format.
+
+    A broadcast builds a single Frame and every subscriber's writer asks it
+    for its own format, so encoding and compression cost is paid once per
+    format in use on the channel, not once per recipient. Frames relayed
+    from other workers arrive as JSON text and are only parsed when a
+    subscriber needs another format.
+    """
+
+    __slots__ = ("_data", "_encoded")
+
+    def __init__(self, data: Optional[dict] = None, json_text: Optional[str] = None):
+        self._data = data
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+        if json_text is not None:
+            self._encoded[JSON] = json_text
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = json.loads(self._encoded[JSON])
+            if self._data.get("type") == "message":
+                self._data["id"] = int(self._data["id"])
+                self._data["created_at"] = datetime.fromisoformat(self._data["created_at"])
+        return self._data
+
+    @property
+    def json(self) -> str:
+        return self.encode(JSON)
+
+    def encode(self, format: str) -> Union[str, bytes]:
+        """Text (str) for JSON, binary (bytes) for every other format."""
+        encoded = self._encoded.get(format)
+        if encoded is None:
+            if format == JSON:
+                encoded = _encode_json(self.data)
+            elif format == "msgpack":
+                encoded = _encode_msgpack(self.data)
+            elif format == "msgpack+deflate":
+                encoded = _deflate(self.encode("msgpack"))
+            elif format == "json+deflate":
+                encoded = _deflate(self.json.encode())
+            else:
+                raise ValueError(f"Unknown frame format: {format}")
+            self._encoded[format] = encoded
+        return encoded
+
+
+def decode(format: str, payload: Union[str, bytes]) -> Any:
+    """Decode a client frame: text is always JSON, binary is in ``format``.
+
+    Raises ValueError for a payload that does not decode.
+    """
+    if isinstance(payload, str):
+        return json.loads(payload)
+    if format.endswith("+deflate"):
+        try:
+            payload = _inflate(payload)
+        except zlib.error as e:
+            raise ValueError(f"Invalid compressed frame: {e}") from None
+        format = format[:-len("+deflate")]
+    if format == "msgpack":
+        # Maps may be keyed by channel id, as in a subscribe's last_seen_ids
+        return msgpack.unpackb(payload, timestamp=3, strict_map_key=False)
+    return json.loads(payload)
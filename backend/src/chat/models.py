@@ -10,19 +10,34 @@ class Channel(Model, TimestampMixin):
     description = fields.TextField(null=True)
     is_public = fields.BooleanField(default=True)
     created_by = fields.ForeignKeyField('models.User', related_name='created_channels')
+    # Denormalized for channel lists, kept current by the chat service on
+    # every message and membership change (see record_messages); rebuild
+    # with python -m src.chat.repair_counters
+    member_count = fields.IntField(default=0)
+    message_count = fields.IntField(default=0)
+    last_message_id = fields.IntField(null=True)
+    last_message_at = fields.DatetimeField(null=True)
+    last_message_preview = fields.CharField(max_length=200, null=True)
+    last_message_user = fields.CharField(max_length=50, null=True)
     
     class Meta:
         table = "channels"
+        # name also has a pg_trgm GIN index (see migrations) for search_channels
 
 class ChannelMember(Model, TimestampMixin):
     id = fields.IntField(pk=True)
     channel = fields.ForeignKeyField('models.Channel', related_name='members')
     user = fields.ForeignKeyField('models.User', related_name='channel_memberships')
     role = fields.CharField(max_length=20, default="member")  # admin or member
+    # Newest message id the member has read; only ever moves forward. Unread
+    # counts are messages above it, via the (channel_id, id) index on messages
+    last_read_message_id = fields.IntField(null=True)
     
     class Meta:
         table = "channel_members"
         unique_together = (("channel", "user"),)
+        # A user's channel list and unread counts start from their memberships
+        indexes = (("user",),)
 
 class Message(Model, TimestampMixin):
     id = fields.IntField(pk=True)
@@ -32,4 +47,8 @@ class Message(Model, TimestampMixin):
     
     class Meta:
         table = "messages"
+        # History pages walk a single channel by id
+        indexes = (("channel", "id"),)
+        # The search_vector tsvector column is generated by Postgres and is
+        # deliberately not mapped here, see the full text search migration
         
\ No newline at end of file
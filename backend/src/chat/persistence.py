@@ -0,0 +1,208 @@
+# chat/persistence.py
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from .models import Message
+from .service import record_messages, write_read_cursors
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """Write-behind persistence for chat messages.
+
+    Messages submitted from the WebSocket path are buffered and written with a
+    single multi-row INSERT once ``batch_size`` messages are pending or
+    ``flush_interval`` seconds have passed since the first one arrived.
+    Batches are written one at a time in submission order, so ids increase in
+    the order messages were received and per-channel ordering is preserved.
+    ``submit`` resolves with the assigned id once its batch is committed.
+    Channel counters are updated in the batch's transaction, once per channel.
+
+    A batch that fails is retried one message at a time, so one bad row (say,
+    for a channel deleted meanwhile) fails only its own ``submit``. While the
+    writer is not running, before ``start`` or after ``stop``, ``submit``
+    writes its message itself.
+    """
+
+    COLUMNS = ("channel_id", "user_id", "content", "created_at", "updated_at")
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.01):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[tuple, str, asyncio.Future]] = []
+        self._has_pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._flusher:
+            # Wait for an in-flight batch rather than cancelling it halfway
+            async with self._flush_lock:
+                self._flusher.cancel()
+            self._flusher = None
+        # Write out everything still buffered before the connection closes
+        while self._pending:
+            await self.flush()
+        logger.info("Message writer stopped")
+
+    async def submit(self, channel_id: int, user_id: int, content: str, username: str) -> Tuple[int, datetime]:
+        now = timezone.now()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((channel_id, user_id, content, now, now), username, future))
+        if self._flusher is None:
+            # No flusher to wait for; flushing in order keeps ids increasing
+            while not future.done():
+                await self.flush()
+        else:
+            self._has_pending.set()
+            if len(self._pending) >= self.batch_size:
+                self._batch_full.set()
+        message_id = await future
+        return message_id, now
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            batch = self._pending[:self.batch_size]
+            self._pending = self._pending[self.batch_size:]
+            if not self._pending:
+                self._has_pending.clear()
+            if len(self._pending) < self.batch_size:
+                self._batch_full.clear()
+            if not batch:
+                return
+            await self._write(batch)
+
+    async def _write(self, batch: list) -> None:
+        try:
+            async with in_transaction():
+                ids = await self._insert([row for row, _, _ in batch])
+                await self._record(ids, batch)
+        except Exception as e:
+            if len(batch) > 1:
+                logger.warning(f"Failed to write batch of {len(batch)} messages, retrying one by one: {e}")
+                for entry in batch:
+                    await self._write([entry])
+                return
+            logger.error(f"Failed to write message: {e}", exc_info=True)
+            _, _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        for message_id, (_, _, future) in zip(ids, batch):
+            if not future.done():
+                future.set_result(message_id)
+
+    async def _record(self, ids: List[int], batch: list) -> None:
+        # Rows are in id order, so the last one seen per channel is its newest
+        counts, newest = {}, {}
+        for message_id, ((channel_id, _, content, created_at, _), username, _) in zip(ids, batch):
+            counts[channel_id] = counts.get(channel_id, 0) + 1
+            newest[channel_id] = (message_id, created_at, content, username)
+        for channel_id, count in counts.items():
+            await record_messages(channel_id, count, *newest[channel_id])
+
+    async def _insert(self, rows: List[tuple]) -> List[int]:
+        db = Message._meta.db
+        width = len(self.COLUMNS)
+        if db.capabilities.dialect == "postgres":
+            placeholder = lambda i: f"${i + 1}"
+        else:
+            placeholder = lambda i: "?"
+        values_sql = ", ".join(
+            "(" + ", ".join(placeholder(r * width + c) for c in range(width)) + ")"
+            for r in range(len(rows))
+        )
+        columns_sql = ", ".join(f'"{column}"' for column in self.COLUMNS)
+        sql = (
+            f'INSERT INTO "{Message._meta.db_table}" ({columns_sql}) '
+            f'VALUES {values_sql} RETURNING "id"'
+        )
+        _, result = await db.execute_query(sql, [value for row in rows for value in row])
+        # Serial ids are drawn in VALUES order; sort in case RETURNING is not
+        return sorted(record["id"] for record in result)
+
+
+class ReadCursorWriter:
+    """Coalesced persistence for channel read cursors.
+
+    Clients mark a channel read as messages scroll past, far more often than
+    the cursor needs to be stored. ``mark`` only records the highest message
+    id per member in memory; every ``flush_interval`` seconds the pending
+    cursors are written in one transaction, so each member costs at most one
+    UPDATE per interval however many marks it sent. ``pending`` exposes the
+    unwritten cursors so reads in this process can include them.
+    """
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        # user_id -> channel_id -> message_id
+        self._pending: Dict[int, Dict[int, int]] = {}
+        self._has_pending = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._flusher:
+            async with self._flush_lock:
+                self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        logger.info("Read cursor writer stopped")
+
+    def mark(self, channel_id: int, user_id: int, message_id: int) -> int:
+        """Queue a read cursor; returns the member's pending cursor for the channel."""
+        channels = self._pending.setdefault(user_id, {})
+        if message_id > channels.get(channel_id, 0):
+            channels[channel_id] = message_id
+            self._has_pending.set()
+        return channels[channel_id]
+
+    def pending(self, user_id: int) -> Dict[int, int]:
+        return dict(self._pending.get(user_id, {}))
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            # Marks arriving during the write start the next interval's batch
+            batch, self._pending = self._pending, {}
+            self._has_pending.clear()
+            if not batch:
+                return
+            try:
+                async with in_transaction():
+                    await write_read_cursors(batch)
+            except Exception as e:
+                logger.error(f"Failed to write read cursors for {len(batch)} users: {e}", exc_info=True)
+                # Keep them for the next flush, unless a newer mark replaced them
+                for user_id, channels in batch.items():
+                    for channel_id, message_id in channels.items():
+                        self.mark(channel_id, user_id, message_id)
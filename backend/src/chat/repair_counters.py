@@ -0,0 +1,40 @@
+"""Recompute the denormalized channel counters.
+
+channels.member_count, message_count and the last_message_* columns are
+kept current by the chat service on every write. Rebuild them from
+channel_members and messages after bulk loads or manual SQL, or whenever
+they are suspected to have drifted:
+
+    python -m src.chat.repair_counters
+    python -m src.chat.repair_counters --batch-size 200
+"""
+
+import argparse
+import asyncio
+import logging
+
+from src.database import init_db, close_db
+from .service import recount_channels
+
+logger = logging.getLogger(__name__)
+
+
+async def run(batch_size: int) -> int:
+    await init_db()
+    try:
+        return await recount_channels(batch_size)
+    finally:
+        await close_db()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000, help="channels recounted per transaction")
+    args = parser.parse_args(argv)
+
+    channels = asyncio.run(run(args.batch_size))
+    logger.info(f"Recounted {channels} channels")
+
+
+if __name__ == "__main__":
+    main()
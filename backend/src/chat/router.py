@@ -1,13 +1,25 @@
 # chat/router.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from tortoise.transactions import in_transaction
 from src.users.service import get_current_user
-from src.users.models import User
+from src.users.schemas import Principal
 from .schemas import (ChannelCreate, ChannelResponse, 
                         ChannelDetailResponse, MessageCreate, 
-                        MessageResponse, ChannelMemberResponse)
+                        MessageResponse, ChannelMemberResponse,
+                        MessagePage, MessageSearchPage, ChannelMemberPage,
+                        MarkRead, ReadCursor, UnreadCount)
 from .models import Channel, ChannelMember, Message
-from typing import List
+from . import ws_router
+from .ws_router import message_frame, read_cursors
+from .service import (get_messages_page, get_members_page, get_user_channels,
+                        channel_validators, record_messages, record_membership, with_last_message,
+                        search_channels as search_channels_query, search_messages, get_unread_counts,
+                        RECENT_MESSAGES_LIMIT, RECENT_MEMBERS_LIMIT, LAST_MESSAGE_COLUMNS)
+from src.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.responses import FastJSONResponse, model_rows
+from src.conditional import is_not_modified, not_modified, validator_headers
+from typing import List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,15 +29,26 @@ router = APIRouter()
 
 
 @router.post("/channels/{channel_id}/messages", response_model=MessageResponse)
-async def create_message(channel_id: int, message: MessageCreate, current_user: User = Depends(get_current_user)):
+async def create_message(channel_id: int, message: MessageCreate, current_user: Principal = Depends(get_current_user)):
     channel = await Channel.get_or_none(id=channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
-    if not await ChannelMember.exists(channel=channel, user=current_user):
+    if not await ChannelMember.exists(channel=channel, user_id=current_user.id):
         raise HTTPException(status_code=403, detail="You are not a member of this channel")
     
-    new_message = await Message.create(channel_id=channel_id, user_id=current_user.id, **message.dict())
+    async with in_transaction():
+        new_message = await Message.create(channel_id=channel_id, user_id=current_user.id, **message.dict())
+        await record_messages(channel_id, 1, new_message.id, new_message.created_at,
+                              new_message.content, current_user.username)
+    # Your own message is never unread for you
+    read_cursors.mark(channel_id, current_user.id, new_message.id)
+    # Sockets see it too, so a resumed socket never has to ask the database
+    # about messages it was connected for
+    await ws_router.manager.broadcast(
+        message_frame(channel_id, new_message.id, new_message.content, current_user.username, new_message.created_at),
+        channel_id, new_message.id,
+    )
     return MessageResponse(
         id=new_message.id,
         content=new_message.content,
@@ -35,7 +58,7 @@ async def create_message(channel_id: int, message: MessageCreate, current_user:
 
 
 @router.post("/channels/{channel_id}/join")
-async def join_channel(channel_id: int, current_user: User = Depends(get_current_user)):
+async def join_channel(channel_id: int, current_user: Principal = Depends(get_current_user)):
     channel = await Channel.get_or_none(id=channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
@@ -43,119 +66,119 @@ async def join_channel(channel_id: int, current_user: User = Depends(get_current
     if not channel.is_public:
         raise HTTPException(status_code=403, detail="This channel is private")
     
-    if await ChannelMember.exists(channel=channel, user=current_user):
+    if await ChannelMember.exists(channel=channel, user_id=current_user.id):
         raise HTTPException(status_code=400, detail="Already a member of this channel")
     
-    await ChannelMember.create(channel=channel, user=current_user, role="member")
+    async with in_transaction():
+        # History from before the join does not count as unread
+        await ChannelMember.create(channel=channel, user_id=current_user.id, role="member",
+                                   last_read_message_id=channel.last_message_id)
+        await record_membership(channel_id, 1)
     return {"message": "Successfully joined the channel"}
 
 @router.delete("/channels/{channel_id}/leave")
-async def leave_channel(channel_id: int, current_user: User = Depends(get_current_user)):
+async def leave_channel(channel_id: int, current_user: Principal = Depends(get_current_user)):
     channel = await Channel.get_or_none(id=channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
-    membership = await ChannelMember.get_or_none(channel=channel, user=current_user)
+    membership = await ChannelMember.get_or_none(channel=channel, user_id=current_user.id)
     if not membership:
         raise HTTPException(status_code=400, detail="Not a member of this channel")
     
     if membership.role == "admin" and await ChannelMember.filter(channel=channel, role="admin").count() == 1:
         raise HTTPException(status_code=400, detail="Cannot leave channel - you are the only admin")
     
-    await membership.delete()
+    async with in_transaction():
+        await membership.delete()
+        await record_membership(channel_id, -1)
     return {"message": "Successfully left the channel"}
 
 
+@router.post("/channels/{channel_id}/read", response_model=ReadCursor)
+async def mark_channel_read(
+    channel_id: int, read: Optional[MarkRead] = None, current_user: Principal = Depends(get_current_user)
+):
+    membership = await ChannelMember.filter(channel_id=channel_id, user_id=current_user.id).first().values(
+        "last_read_message_id", last_message_id="channel__last_message_id"
+    )
+    if membership is None:
+        if not await Channel.exists(id=channel_id):
+            raise HTTPException(status_code=404, detail="Channel not found")
+        raise HTTPException(status_code=403, detail="You are not a member of this channel")
+
+    # Ids past the channel's newest message would hide messages not sent yet
+    newest = membership["last_message_id"] or 0
+    message_id = newest if read is None or read.message_id is None else min(read.message_id, newest)
+    cursor = max(membership["last_read_message_id"] or 0, read_cursors.pending(current_user.id).get(channel_id, 0))
+    if message_id > cursor:
+        # Written by the next flush, coalesced with any later marks
+        cursor = read_cursors.mark(channel_id, current_user.id, message_id)
+    return ReadCursor(channel_id=channel_id, last_read_message_id=cursor or None)
+
 
 # Important: Place the search endpoint BEFORE any parameterized routes
 @router.get("/channels/search", response_model=List[ChannelResponse])
-async def search_channels(query: str = "", current_user: User = Depends(get_current_user)):
+async def search_channels(
+    query: str = "",
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: Principal = Depends(get_current_user)
+):
     logger.info(f"Searching channels with query: {query} by user: {current_user.username}")
     try:
-        # Find all public channels matching the query
-        public_channels = await Channel.filter(
-            name__icontains=query,
-            is_public=True
-        ).prefetch_related('created_by')
-
-        # Find all private channels the user is a member of matching the query
-        private_channels = await Channel.filter(
-            name__icontains=query,
-            is_public=False,
-            members__user=current_user
-        ).prefetch_related('created_by')
-
-        # Combine and deduplicate results
-        channels = list({channel.id: channel for channel in public_channels + private_channels}.values())
+        # Public channels plus the user's private channels, ranked, in one query
+        channels = await search_channels_query(query, current_user.id, limit)
 
         logger.info(f"Found {len(channels)} channels matching query: {query}")
 
-        response = [
-            ChannelResponse(
-                id=channel.id,
-                name=channel.name,
-                description=channel.description,
-                is_public=channel.is_public,
-                created_at=channel.created_at,
-                created_by=channel.created_by.username if channel.created_by else None
-            )
-            for channel in channels
-        ]
-        
-        return response
+        return FastJSONResponse(model_rows(ChannelResponse, channels))
     except Exception as e:
         logger.error(f"Error searching channels: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error searching channels")
 
+@router.get("/channels/unread", response_model=List[UnreadCount])
+async def get_unread(current_user: Principal = Depends(get_current_user)):
+    counts = await get_unread_counts(current_user.id, read_cursors.pending(current_user.id))
+    return FastJSONResponse(model_rows(UnreadCount, counts))
+
 @router.post("/channels", response_model=ChannelResponse)
-async def create_channel(channel: ChannelCreate, current_user: User = Depends(get_current_user)):
+async def create_channel(channel: ChannelCreate, current_user: Principal = Depends(get_current_user)):
     logger.info(f"Creating new channel: {channel.name} by user: {current_user.username}")
-    new_channel = await Channel.create(**channel.dict(), created_by_id=current_user.id)
-    await ChannelMember.create(channel=new_channel, user=current_user, role="admin")
+    async with in_transaction():
+        new_channel = await Channel.create(**channel.dict(), created_by_id=current_user.id, member_count=1)
+        await ChannelMember.create(channel=new_channel, user_id=current_user.id, role="admin")
     return ChannelResponse(
         id=new_channel.id,
         name=new_channel.name,
         description=new_channel.description,
         is_public=new_channel.is_public,
         created_at=new_channel.created_at,
-        created_by=current_user.username
+        created_by=current_user.username,
+        member_count=new_channel.member_count,
     )
 
 @router.get("/channels", response_model=List[ChannelResponse])
-async def get_channels(current_user: User = Depends(get_current_user)):
+async def get_channels(current_user: Principal = Depends(get_current_user)):
     logger.info(f"Fetching channels for user: {current_user.username}")
-    user_channels = await ChannelMember.filter(user=current_user).prefetch_related('channel', 'channel__created_by')
-    return [
-        ChannelResponse(
-            id=member.channel.id,
-            name=member.channel.name,
-            description=member.channel.description,
-            is_public=member.channel.is_public,
-            created_at=member.channel.created_at,
-            created_by=member.channel.created_by.username if member.channel.created_by else None
-        )
-        for member in user_channels
-    ]
+    channels = await get_user_channels(current_user.id)
+    return FastJSONResponse(model_rows(ChannelResponse, channels))
 
 
 
 @router.get("/channels/{channel_id}", response_model=ChannelDetailResponse)
-async def get_channel(channel_id: int, current_user: User = Depends(get_current_user)):
+async def get_channel(channel_id: int, request: Request, current_user: Principal = Depends(get_current_user)):
     logger.info(f"Fetching channel {channel_id} for user: {current_user.username}")
     
-    # Get the channel with all related data
-    channel = await Channel.get_or_none(id=channel_id).prefetch_related(
-        'members__user', 
-        'messages__user', 
-        'created_by'
-    )
+    # Only the channel row itself is loaded here; members and messages are
+    # fetched as bounded windows below
+    channel = await Channel.get_or_none(id=channel_id).prefetch_related('created_by')
     
     if not channel:
         logger.warning(f"Channel {channel_id} not found")
         raise HTTPException(status_code=404, detail="Channel not found")
     
     # Check if user is a member
-    is_member = await ChannelMember.exists(channel=channel, user=current_user)
+    is_member = await ChannelMember.exists(channel=channel, user_id=current_user.id)
     
     # If it's a private channel and user is not a member, deny access
     if not channel.is_public and not is_member:
@@ -165,35 +188,108 @@ async def get_channel(channel_id: int, current_user: User = Depends(get_current_
             detail="This is a private channel. You need to be a member to view details."
         )
     
-    # For public channels or if user is a member, return full details
-    members = [
-        ChannelMemberResponse(
-            user=member.user.username,
-            role=member.role
-        ) for member in channel.members
-    ]
+    # The channel row alone decides whether anything changed since the client's copy
+    etag, last_modified = channel_validators(channel, is_member)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+    
+    members, _ = await get_members_page(channel_id, RECENT_MEMBERS_LIMIT)
     
     # Only include messages if user is a member
     messages = []
     if is_member:
-        messages = [
-            MessageResponse(
-                id=msg.id,
-                content=msg.content,
-                user=msg.user.username,
-                created_at=msg.created_at
-            ) for msg in channel.messages
-        ]
+        messages, _ = await get_messages_page(channel_id, RECENT_MESSAGES_LIMIT)
     
     logger.info(f"Successfully fetched channel {channel_id} details for user {current_user.username}")
     
-    return ChannelDetailResponse(
-        id=channel.id,
-        name=channel.name,
-        description=channel.description,
-        is_public=channel.is_public,
-        created_at=channel.created_at,
-        created_by=channel.created_by.username if channel.created_by else None,
-        members=members,
-        messages=messages
+    # Same shape as ChannelDetailResponse, serialized without building a
+    # model per member and message
+    return FastJSONResponse(with_last_message({
+        "id": channel.id,
+        "name": channel.name,
+        "description": channel.description,
+        "is_public": channel.is_public,
+        "created_at": channel.created_at,
+        "created_by": channel.created_by.username if channel.created_by else None,
+        "members": model_rows(ChannelMemberResponse, members),
+        "messages": model_rows(MessageResponse, messages),
+        "member_count": channel.member_count,
+        "message_count": channel.message_count,
+        **{column: getattr(channel, column) for column in LAST_MESSAGE_COLUMNS},
+    }), headers=validator_headers(etag, last_modified))
+
+
+@router.get("/channels/{channel_id}/messages", response_model=MessagePage)
+async def get_channel_messages(
+    channel_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Query(RECENT_MESSAGES_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    current_user: Principal = Depends(get_current_user)
+):
+    logger.info(f"Fetching messages for channel {channel_id} (before={before}, after={after}, limit={limit})")
+    
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    
+    if not await Channel.exists(id=channel_id):
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    if not await ChannelMember.exists(channel_id=channel_id, user_id=current_user.id):
+        raise HTTPException(status_code=403, detail="You are not a member of this channel")
+    
+    messages, next_cursor = await get_messages_page(channel_id, limit, before=before, after=after)
+    return MessagePage(
+        messages=[MessageResponse(**msg) for msg in messages],
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/channels/{channel_id}/search", response_model=MessageSearchPage)
+async def search_channel_messages(
+    channel_id: int,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user)
+):
+    logger.info(f"Searching messages in channel {channel_id} for: {q}")
+    
+    if not await Channel.exists(id=channel_id):
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    # Message content is only visible to members, public channel or not
+    if not await ChannelMember.exists(channel_id=channel_id, user_id=current_user.id):
+        raise HTTPException(status_code=403, detail="You are not a member of this channel")
+    
+    messages, next_cursor = await search_messages(channel_id, q, limit, after)
+    return MessageSearchPage(
+        messages=[MessageResponse(**msg) for msg in messages],
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/channels/{channel_id}/members", response_model=ChannelMemberPage)
+async def get_channel_members(
+    channel_id: int,
+    after: Optional[int] = None,
+    limit: int = Query(RECENT_MEMBERS_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    current_user: Principal = Depends(get_current_user)
+):
+    logger.info(f"Fetching members for channel {channel_id} (after={after}, limit={limit})")
+    
+    channel = await Channel.get_or_none(id=channel_id)
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    
+    if not channel.is_public and not await ChannelMember.exists(channel=channel, user_id=current_user.id):
+        raise HTTPException(
+            status_code=403, 
+            detail="This is a private channel. You need to be a member to view details."
+        )
+    
+    members, next_cursor = await get_members_page(channel_id, limit, after=after)
+    return ChannelMemberPage(
+        members=[ChannelMemberResponse(**member) for member in members],
+        next_cursor=next_cursor
     )
@@ -12,6 +12,13 @@ class ChannelCreate(BaseModel):
     class Config:
         from_attributes = True
 
+class LastMessagePreview(BaseModel):
+    id: int
+    # Truncated to the first 200 characters
+    content: str
+    user: str
+    created_at: datetime
+
 class ChannelResponse(BaseModel):
     id: int
     name: str
@@ -19,6 +26,9 @@ class ChannelResponse(BaseModel):
     is_public: bool
     created_at: datetime
     created_by: str  
+    member_count: int = 0
+    message_count: int = 0
+    last_message: Optional[LastMessagePreview] = None
 
     class Config:
         from_attributes = True
@@ -46,9 +56,34 @@ class ChannelMemberResponse(BaseModel):
         from_attributes = True
 
 class ChannelDetailResponse(ChannelResponse):
+    # Only the most recent messages and first members are embedded; use the
+    # paginated history and members endpoints for the rest.
     members: List[ChannelMemberResponse]
     messages: List[MessageResponse]
 
     class Config:
         from_attributes = True
 
+class MessagePage(BaseModel):
+    messages: List[MessageResponse]
+    next_cursor: Optional[int] = None
+
+class MessageSearchPage(BaseModel):
+    messages: List[MessageResponse]
+    next_cursor: Optional[str] = None
+
+class ChannelMemberPage(BaseModel):
+    members: List[ChannelMemberResponse]
+    next_cursor: Optional[int] = None
+
+
+class MarkRead(BaseModel):
+    # Defaults to the channel's newest message
+    message_id: Optional[int] = None
+
+class ReadCursor(BaseModel):
+    channel_id: int
+    last_read_message_id: Optional[int] = None
+
+class UnreadCount(ReadCursor):
+    unread_count: int
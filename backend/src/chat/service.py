@@ -0,0 +1,343 @@
+# chat/service.py
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from tortoise import timezone
+from tortoise.expressions import F, Q
+from tortoise.transactions import in_transaction
+from .models import Channel, ChannelMember, Message
+from src.pagination import encode_rank_cursor, decode_rank_cursor
+from src.conditional import make_etag
+
+logger = logging.getLogger(__name__)
+
+# Size of the window embedded in ChannelDetailResponse; anything older is
+# fetched through the paginated history/members endpoints.
+RECENT_MESSAGES_LIMIT = 50
+RECENT_MEMBERS_LIMIT = 50
+
+MESSAGE_FIELDS = ("id", "content", "created_at")
+
+
+async def get_messages_page(
+    channel_id: int,
+    limit: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+) -> Tuple[List[dict], Optional[int]]:
+    """Return a page of a channel's messages in ascending id order.
+
+    With ``after`` the page walks forward from that id; otherwise it walks
+    backwards from ``before`` (or from the newest message). The returned
+    cursor is the id to pass as the same parameter to get the next page.
+    """
+    query = Message.filter(channel_id=channel_id)
+    if after is not None:
+        query = query.filter(id__gt=after).order_by("id")
+    else:
+        if before is not None:
+            query = query.filter(id__lt=before)
+        query = query.order_by("-id")
+
+    rows = await query.limit(limit + 1).values(*MESSAGE_FIELDS, user="user__username")
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+
+    if after is None:
+        rows.reverse()
+    return rows, next_cursor
+
+
+async def get_members_page(
+    channel_id: int, limit: int, after: Optional[int] = None
+) -> Tuple[List[dict], Optional[int]]:
+    """Return a page of channel members ordered by membership id."""
+    query = ChannelMember.filter(channel_id=channel_id)
+    if after is not None:
+        query = query.filter(id__gt=after)
+
+    rows = await query.order_by("id").limit(limit + 1).values("id", "role", user="user__username")
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    return rows, next_cursor
+
+
+def channel_validators(channel: Channel, is_member: bool) -> Tuple[str, datetime]:
+    """ETag and Last-Modified for a channel detail.
+
+    Messages are append-only and joins/leaves touch channels.updated_at, so
+    the channel row with its last message id pins down the whole payload.
+    Members and non-members get different bodies, hence different tags.
+    """
+    etag = make_etag("channel", channel.id, channel.updated_at, channel.last_message_id, is_member)
+    last_modified = max(channel.updated_at, channel.last_message_at or channel.updated_at)
+    return etag, last_modified
+
+
+# Channel counters: channels.member_count, message_count and the last message
+# columns are maintained here, in the same transaction as the write they
+# describe. Increments are relative (count = count + n) so concurrent writers
+# never lose one, and the last message only ever moves to a higher id.
+LAST_MESSAGE_PREVIEW_LENGTH = 200
+LAST_MESSAGE_COLUMNS = ("last_message_id", "last_message_at", "last_message_preview", "last_message_user")
+# ChannelResponse.last_message field -> channels column
+LAST_MESSAGE_FIELDS = dict(zip(("id", "created_at", "content", "user"), LAST_MESSAGE_COLUMNS))
+
+
+def _placeholder(dialect: str):
+    # Numbered so a parameter can be used more than once in a statement
+    return (lambda i: f"${i}") if dialect == "postgres" else (lambda i: f"?{i}")
+
+
+def _record_messages_sql(dialect: str) -> str:
+    p = _placeholder(dialect)
+    newer = f'"last_message_id" IS NULL OR "last_message_id" < {p(2)}'
+    assignments = [f'"message_count" = "message_count" + {p(1)}']
+    for i, column in enumerate(LAST_MESSAGE_COLUMNS, start=2):
+        assignments.append(f'"{column}" = CASE WHEN {newer} THEN {p(i)} ELSE "{column}" END')
+    return f'UPDATE "channels" SET {", ".join(assignments)} WHERE "id" = {p(6)}'
+
+
+async def record_messages(channel_id: int, count: int, last_id: int, last_created_at: datetime,
+                          last_content: str, last_username: str) -> None:
+    """Count ``count`` new messages in a channel, the newest being ``last_id``.
+
+    Call inside the transaction that inserted them.
+    """
+    db = Channel._meta.db
+    await db.execute_query(_record_messages_sql(db.capabilities.dialect), [
+        count, last_id, last_created_at, last_content[:LAST_MESSAGE_PREVIEW_LENGTH], last_username, channel_id,
+    ])
+
+
+async def record_membership(channel_id: int, delta: int) -> None:
+    """Adjust member_count after a join (+1) or leave (-1).
+
+    Also bumps updated_at: membership is part of the channel detail.
+    """
+    await Channel.filter(id=channel_id).update(member_count=F("member_count") + delta, updated_at=timezone.now())
+
+
+def with_last_message(row: dict) -> dict:
+    """Nest a channel row's last_message_* columns as ChannelResponse.last_message."""
+    last_message = {field: row.pop(column) for field, column in LAST_MESSAGE_FIELDS.items()}
+    row["last_message"] = last_message if last_message["id"] is not None else None
+    return row
+
+
+def _recount_sql(dialect: str) -> str:
+    p = _placeholder(dialect)
+    newest = 'FROM "messages" m WHERE m."channel_id" = "channels"."id" ORDER BY m."id" DESC LIMIT 1'
+    return f"""
+        UPDATE "channels" SET
+            "member_count" = (SELECT COUNT(*) FROM "channel_members" m WHERE m."channel_id" = "channels"."id"),
+            "message_count" = (SELECT COUNT(*) FROM "messages" m WHERE m."channel_id" = "channels"."id"),
+            "last_message_id" = (SELECT m."id" {newest}),
+            "last_message_at" = (SELECT m."created_at" {newest}),
+            "last_message_preview" = (SELECT SUBSTR(m."content", 1, {LAST_MESSAGE_PREVIEW_LENGTH}) {newest}),
+            "last_message_user" = (
+                SELECT u."username" FROM "messages" m JOIN "users" u ON u."id" = m."user_id"
+                WHERE m."channel_id" = "channels"."id" ORDER BY m."id" DESC LIMIT 1
+            )
+        WHERE "id" BETWEEN {p(1)} AND {p(2)}
+    """
+
+
+async def recount_channels(batch_size: int = 1000) -> int:
+    """Recompute every channel's counters from channel_members and messages.
+
+    Works through id ranges of ``batch_size`` channels, one transaction
+    each, so row locks are held briefly; returns the number of channels.
+    """
+    ids = await Channel.all().order_by("id").values_list("id", flat=True)
+    db = Channel._meta.db
+    sql = _recount_sql(db.capabilities.dialect)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        async with in_transaction() as connection:
+            await connection.execute_query(sql, [batch[0], batch[-1]])
+    return len(ids)
+
+
+# Read cursors: channel_members.last_read_message_id. A NULL cursor means
+# nothing was read yet, so the whole message_count is unread; otherwise the
+# unread messages are one range of the (channel_id, id) index, and a channel
+# whose last message is at or below the cursor needs no lookup at all.
+def _mark_read_sql(dialect: str) -> str:
+    p = _placeholder(dialect)
+    return f"""
+        UPDATE "channel_members" SET "last_read_message_id" = {p(1)}
+        WHERE "channel_id" = {p(2)} AND "user_id" = {p(3)}
+          AND ("last_read_message_id" IS NULL OR "last_read_message_id" < {p(1)})
+    """
+
+
+async def write_read_cursors(cursors: Dict[int, Dict[int, int]]) -> None:
+    """Store ``{user_id: {channel_id: message_id}}`` read cursors.
+
+    A cursor never moves backwards, so writes that arrive out of order (or
+    from another worker) cannot undo a later read.
+    """
+    db = ChannelMember._meta.db
+    sql = _mark_read_sql(db.capabilities.dialect)
+    for user_id, channels in cursors.items():
+        for channel_id, message_id in channels.items():
+            await db.execute_query(sql, [message_id, channel_id, user_id])
+
+
+def _unread_counts_sql(dialect: str, overrides: int) -> str:
+    p = _placeholder(dialect)
+    cursor = 'cm."last_read_message_id"'
+    if overrides:
+        # Cursors marked in this process but not written yet
+        cases = " ".join(
+            f"WHEN cm.\"channel_id\" = {p(i)} AND ({cursor} IS NULL OR {cursor} < {p(i + 1)}) THEN {p(i + 1)}"
+            for i in range(2, 2 + 2 * overrides, 2)
+        )
+        cursor = f"CASE {cases} ELSE {cursor} END"
+    return f"""
+        SELECT r."channel_id", r."last_read_message_id",
+               CASE
+                   WHEN r."last_read_message_id" IS NULL THEN r."message_count"
+                   WHEN r."last_message_id" IS NULL OR r."last_message_id" <= r."last_read_message_id" THEN 0
+                   ELSE (SELECT COUNT(*) FROM "messages" m
+                         WHERE m."channel_id" = r."channel_id" AND m."id" > r."last_read_message_id")
+               END AS "unread_count"
+        FROM (
+            SELECT cm."id", cm."channel_id", c."message_count", c."last_message_id",
+                   {cursor} AS "last_read_message_id"
+            FROM "channel_members" cm
+            JOIN "channels" c ON c."id" = cm."channel_id"
+            WHERE cm."user_id" = {p(1)}
+        ) r
+        ORDER BY r."id"
+    """
+
+
+async def get_unread_counts(user_id: int, pending: Optional[Dict[int, int]] = None) -> List[dict]:
+    """Unread message counts for every channel the user belongs to, in one query.
+
+    ``pending`` maps channel ids to read cursors not yet written (see
+    ReadCursorWriter); they count as if they were.
+    """
+    pending = pending or {}
+    db = ChannelMember._meta.db
+    params = [user_id]
+    for channel_id, message_id in pending.items():
+        params += [channel_id, message_id]
+    _, rows = await db.execute_query(_unread_counts_sql(db.capabilities.dialect, len(pending)), params)
+    return [dict(row) for row in rows]
+
+
+# Public channels plus the caller's private channels whose name matches,
+# ranked by trigram similarity. Both branches can use the pg_trgm GIN index
+# on channels.name, and they are disjoint on is_public so UNION ALL is safe.
+CHANNEL_SEARCH_SQL = """
+    SELECT c.id, c.name, c.description, c.is_public, c.created_at,
+           u.username AS created_by, c.member_count, c.message_count, c.last_message_id,
+           c.last_message_at, c.last_message_preview, c.last_message_user, similarity(c.name, $1) AS rank
+    FROM channels c
+    JOIN users u ON u.id = c.created_by_id
+    WHERE c.is_public AND c.name ILIKE $2
+    UNION ALL
+    SELECT c.id, c.name, c.description, c.is_public, c.created_at,
+           u.username AS created_by, c.member_count, c.message_count, c.last_message_id,
+           c.last_message_at, c.last_message_preview, c.last_message_user, similarity(c.name, $1) AS rank
+    FROM channels c
+    JOIN channel_members m ON m.channel_id = c.id AND m.user_id = $3
+    JOIN users u ON u.id = c.created_by_id
+    WHERE NOT c.is_public AND c.name ILIKE $2
+    ORDER BY rank DESC, id
+    LIMIT $4
+"""
+
+CHANNEL_FIELDS = ("id", "name", "description", "is_public", "created_at",
+                  "member_count", "message_count", *LAST_MESSAGE_COLUMNS)
+
+
+async def get_user_channels(user_id: int) -> List[dict]:
+    """Channels the user belongs to, in the order they were joined, in one query."""
+    rows = await ChannelMember.filter(user_id=user_id).order_by("id").values(
+        **{field: f"channel__{field}" for field in CHANNEL_FIELDS},
+        created_by="channel__created_by__username",
+    )
+    return [with_last_message(row) for row in rows]
+
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+async def search_channels(query: str, user_id: int, limit: int) -> List[dict]:
+    db = Channel._meta.db
+    if db.capabilities.dialect == "postgres":
+        _, rows = await db.execute_query(
+            CHANNEL_SEARCH_SQL, [query, _like_pattern(query), user_id, limit]
+        )
+        return [with_last_message(dict(row)) for row in rows]
+
+    # Fallback for databases without pg_trgm (SQLite in tests): same filter
+    # through the ORM, ranked exact > prefix > substring match
+    rows = await Channel.filter(
+        Q(is_public=True) | Q(members__user_id=user_id), name__icontains=query
+    ).distinct().order_by("id").values(*CHANNEL_FIELDS, created_by="created_by__username")
+    needle = query.lower()
+
+    def rank(row):
+        name = row["name"].lower()
+        return 2 if name == needle else 1 if name.startswith(needle) else 0
+
+    return [with_last_message(row) for row in sorted(rows, key=rank, reverse=True)[:limit]]
+
+
+# messages.search_vector is a stored generated tsvector with a GIN index, see
+# migrations; Postgres keeps it current on every INSERT/UPDATE.
+MESSAGE_SEARCH_SQL = """
+    SELECT m.id, m.content, m.created_at, u.username AS "user",
+           ts_rank(m.search_vector, q.query) AS rank
+    FROM messages m
+    JOIN users u ON u.id = m.user_id,
+         websearch_to_tsquery('english', $1) AS q(query)
+    WHERE m.channel_id = $2 AND m.search_vector @@ q.query {cursor_clause}
+    ORDER BY rank DESC, m.id DESC
+    LIMIT $3
+"""
+MESSAGE_SEARCH_CURSOR_CLAUSE = "AND (ts_rank(m.search_vector, q.query), m.id) < ($4::real, $5)"
+
+
+async def search_messages(
+    channel_id: int, text: str, limit: int, after: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Full-text search within one channel's messages, best matches first."""
+    db = Message._meta.db
+    if db.capabilities.dialect == "postgres":
+        values = [text, channel_id, limit + 1]
+        cursor_clause = ""
+        if after:
+            values.extend(decode_rank_cursor(after))
+            cursor_clause = MESSAGE_SEARCH_CURSOR_CLAUSE
+        _, rows = await db.execute_query(MESSAGE_SEARCH_SQL.format(cursor_clause=cursor_clause), values)
+        rows = [dict(row) for row in rows]
+    else:
+        # Fallback for databases without tsvector (SQLite in tests)
+        query = Message.filter(channel_id=channel_id, content__icontains=text)
+        if after:
+            _, message_id = decode_rank_cursor(after)
+            query = query.filter(id__lt=message_id)
+        rows = await query.order_by("-id").limit(limit + 1).values(*MESSAGE_FIELDS, user="user__username")
+        for row in rows:
+            row["rank"] = 0.0
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1]["rank"], rows[-1]["id"])
+    return rows, next_cursor
@@ -2,79 +2,852 @@
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from src.users.service import get_current_user
-from src.users.models import User
-from .models import Channel, ChannelMember, Message
-import json
+from src.users.schemas import Principal
+from .models import ChannelMember, Message
+from .broker import Broker, create_broker
+from .frames import JSON, SUBPROTOCOLS, Frame, decode, negotiate
+from .persistence import MessageWriter, ReadCursorWriter
+from .service import get_messages_page, record_messages
+from src.metrics import REGISTRY, Counter, Gauge
+from src.config import (CHAT_BROKER, CHAT_SEND_QUEUE_SIZE, CHAT_SEND_TIMEOUT,
+                        CHAT_WRITE_BEHIND, CHAT_WRITE_BATCH_SIZE, CHAT_WRITE_FLUSH_INTERVAL,
+                        CHAT_WS_MAX_SUBSCRIPTIONS, CHAT_READ_FLUSH_INTERVAL,
+                        CHAT_RESUME_BUFFER_SIZE, CHAT_RESUME_PAGE_SIZE, CHAT_RESUME_MAX_MESSAGES,
+                        CHAT_WS_MAX_CONNECTIONS, CHAT_WS_MAX_CONNECTIONS_PER_USER,
+                        CHAT_WS_PING_INTERVAL, CHAT_WS_PING_TIMEOUT, CHAT_WS_IDLE_TIMEOUT)
+from collections import deque
+from tortoise.transactions import in_transaction
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Union
 import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+MESSAGES_BROADCAST = REGISTRY.register(Counter(
+    "chat_messages_broadcast_total", "Chat messages fanned out to this worker's sockets",
+))
+# An evicted client loses the frame that triggered eviction plus its backlog
+MESSAGES_DROPPED = REGISTRY.register(Counter(
+    "chat_messages_dropped_total", "Chat frames never delivered to a client, by reason",
+    ("reason",),
+))
+# source is "buffer" (served from memory) or "database"
+RESUMES = REGISTRY.register(Counter(
+    "chat_resumes_total", "Channel subscriptions resumed from a last seen message id, by source",
+    ("source",),
+))
+# Resumes cut off at CHAT_RESUME_MAX_MESSAGES and left to the client to refetch
+RESYNCS = REGISTRY.register(Counter(
+    "chat_resume_resyncs_total", "Channel resumes that stopped at the replay cap and sent a resync",
+))
+# reason is "user_limit" or "worker_limit"
+CONNECTIONS_REFUSED = REGISTRY.register(Counter(
+    "chat_ws_refused_total", "WebSocket connections refused over a connection cap, by reason",
+    ("reason",),
+))
+# reason is "heartbeat_timeout" or "idle"
+CONNECTIONS_REAPED = REGISTRY.register(Counter(
+    "chat_ws_reaped_total", "WebSocket connections closed by the reaper, by reason",
+    ("reason",),
+))
+
+# Sent to sockets that have gone quiet; shared, so encoded once per format
+PING = Frame({"type": "ping"})
+
+class ChannelStats:
+    """Fan-out counters for one channel, kept by ConnectionManager."""
+
+    def __init__(self, samples: int = 1024):
+        self.broadcasts = 0
+        self.deliveries = 0
+        self.evictions = 0
+        # Recent enqueue-to-send latencies in seconds
+        self.latencies = deque(maxlen=samples)
+
+    def snapshot(self, connections: list["ClientConnection"]) -> dict:
+        latencies = sorted(self.latencies)
+        depths = [conn.queue.qsize() for conn in connections]
+        return {
+            "connections": len(connections),
+            "broadcasts": self.broadcasts,
+            "deliveries": self.deliveries,
+            "evictions": self.evictions,
+            "latency_p50": _percentile(latencies, 0.50),
+            "latency_p99": _percentile(latencies, 0.99),
+            "latency_max": latencies[-1] if latencies else 0.0,
+            "queue_depth_max": max(depths, default=0),
+            "queue_depth_total": sum(depths),
+        }
+
+
+class RecentMessages:
+    """Ring buffer of a channel's latest message frames, for resuming sockets.
+
+    Kept by ConnectionManager while the channel has local subscribers, since
+    only then does every broadcast reach this worker. ``complete_after`` is
+    an id such that every message above it is in the buffer or still on its
+    way here as a broadcast. It is unknown (None) until a database replay
+    establishes it, because the buffer cannot tell what it missed before
+    its first subscriber.
+    """
+
+    def __init__(self, size: int):
+        self.frames: deque = deque(maxlen=size)
+        self.complete_after: Optional[int] = None
+        # Database replay in progress: (last_seen_id it started from, done)
+        self.warming: Optional[tuple[int, asyncio.Future]] = None
+
+    def add(self, message_id: int, frame: str):
+        if len(self.frames) == self.frames.maxlen and self.complete_after is not None:
+            # Broadcasts can arrive slightly out of id order, so the oldest
+            # entry is not necessarily the smallest id
+            self.complete_after = max(self.complete_after, self.frames[0][0])
+        self.frames.append((message_id, frame))
+
+    def since(self, last_seen_id: int) -> Optional[list]:
+        """Frames after ``last_seen_id`` in id order, or None if some may be missing."""
+        if self.complete_after is None or last_seen_id < self.complete_after:
+            return None
+        return sorted((entry for entry in self.frames if entry[0] > last_seen_id), key=lambda entry: entry[0])
+
+    def merge(self, complete_after: int, frames: Iterable[tuple]):
+        """Add a replay holding every message after ``complete_after`` committed when it was read."""
+        if self.complete_after is not None and complete_after >= self.complete_after:
+            return
+        entries = {message_id: frame for message_id, frame in self.frames}
+        entries.update(frames)
+        ordered = sorted(entries.items())
+        dropped = ordered[:-self.frames.maxlen]
+        if dropped:
+            complete_after = max(complete_after, dropped[-1][0])
+        self.frames = deque(ordered[-self.frames.maxlen:], maxlen=self.frames.maxlen)
+        self.complete_after = complete_after
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class ClientConnection:
+    """A connected socket with its own bounded outbound queue.
+
+    Broadcasts only enqueue; a writer task per connection drains the queue,
+    so one slow client cannot hold up delivery to the rest of the channel.
+    On the multiplexed endpoint one connection is subscribed to many
+    channels, which share its queue and writer. The writer encodes each
+    frame in the connection's negotiated ``format``.
+    """
+
+    def __init__(self, websocket: WebSocket, user: Principal, manager: "ConnectionManager",
+                 format: str = JSON):
+        self.websocket = websocket
+        self.user = user
+        self.manager = manager
+        self.format = format
+        self.channels: set[int] = set()
+        # Channels being replayed: live frames wait here until the replay is
+        # sent, so they cannot overtake it
+        self.held: dict[int, list[tuple]] = {}
+        # Replays running beside the receive loop, by channel
+        self.replays: dict[int, asyncio.Task] = {}
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CHAT_SEND_QUEUE_SIZE)
+        self.closed = False
+        # time.monotonic() of the last frame from the client and of the last
+        # ping sent (0: none yet); idle_since is set while subscribed to no channel
+        self.last_seen = self.idle_since = time.monotonic()
+        self.pinged_at = 0.0
+        self.writer = asyncio.create_task(self._write())
+
+    def enqueue(self, frame: Frame, channel_id: Optional[int] = None) -> bool:
+        """Queue a frame; ``channel_id`` is None for replies to this client alone."""
+        try:
+            self.queue.put_nowait((frame, channel_id, time.perf_counter()))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _write(self):
+        while True:
+            frame, channel_id, enqueued_at = await self.queue.get()
+            try:
+                # Encoded at most once per format, however many sockets share the frame
+                payload = frame.encode(self.format)
+                if isinstance(payload, str):
+                    send = self.websocket.send_text(payload)
+                else:
+                    send = self.websocket.send_bytes(payload)
+                await asyncio.wait_for(send, CHAT_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Evicting slow client {self.user}: send timed out")
+                await self.manager.evict(self, "send_timeout", channel_id)
+                return
+            except Exception as e:
+                logger.info(f"Dropping connection {self.user}: {e}")
+                await self.manager.evict(self, "send_error", channel_id)
+                return
+            stats = self.manager.channel_stats.get(channel_id)
+            if stats is not None:
+                stats.deliveries += 1
+                stats.latencies.append(time.perf_counter() - enqueued_at)
+
+    def close(self):
+        self.closed = True
+        for task in [self.writer, *self.replays.values()]:
+            if task is not asyncio.current_task():
+                task.cancel()
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict[int, list[tuple[WebSocket, User]]] = {}
+    """Sockets on this worker and the channels they are subscribed to.
+
+    Besides fan-out, the manager bounds what sockets can cost: ``open``
+    refuses sockets over the per-user and per-worker caps, and a reaper
+    task closes sockets that stopped answering heartbeats or sit subscribed
+    to nothing, so memory and broadcast work follow live clients.
+    """
+
+    def __init__(self, broker: Broker = None):
+        # channel_id -> connections subscribed to it
+        self.active_connections: dict[int, list[ClientConnection]] = {}
+        self.connections: set[ClientConnection] = set()
+        # user id -> number of open connections
+        self.user_connections: dict[int, int] = {}
+        self.channel_stats: dict[int, ChannelStats] = {}
+        self.recent: dict[int, RecentMessages] = {}
         self._lock = asyncio.Lock()
+        self._reaper: Optional[asyncio.Task] = None
+        self.broker = broker or create_broker(CHAT_BROKER)
+
+    async def start(self):
+        await self.broker.start(self._deliver_remote, self._forget_recent)
+        if CHAT_WS_PING_INTERVAL > 0:
+            self._reaper = asyncio.create_task(self._reap_forever())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for conn in self.connections:
+            conn.close()
+        self.connections.clear()
+        self.user_connections.clear()
+        self.active_connections.clear()
+        self.recent.clear()
+        await self.broker.stop()
+
+    async def _reap_forever(self):
+        # Sweeping at half the shorter period keeps pings and closes within
+        # half a period of when they are due
+        period = min(CHAT_WS_PING_INTERVAL, CHAT_WS_PING_TIMEOUT) / 2
+        while True:
+            await asyncio.sleep(period)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"WebSocket reaper failed: {e}", exc_info=True)
 
-    async def connect(self, websocket: WebSocket, channel_id: int, user: User):
-        await websocket.accept()
+    async def reap(self):
+        """One heartbeat sweep: ping quiet sockets, close dead and idle ones."""
+        now = time.monotonic()
+        for conn in list(self.connections):
+            if conn.closed:
+                continue
+            # The timeout runs from the ping, so a busy worker that sends it
+            # late does not shorten the client's time to answer
+            unanswered = conn.pinged_at > conn.last_seen
+            if unanswered and now - conn.pinged_at > CHAT_WS_PING_TIMEOUT:
+                await self._reap(conn, "heartbeat_timeout", code=1008)
+            elif not conn.channels and now - conn.idle_since > CHAT_WS_IDLE_TIMEOUT:
+                await self._reap(conn, "idle", code=1000)
+            elif not unanswered and now - conn.last_seen >= CHAT_WS_PING_INTERVAL:
+                conn.pinged_at = now
+                if not conn.enqueue(PING):
+                    await self.evict(conn, "queue_full")
+
+    async def _reap(self, conn: ClientConnection, reason: str, code: int):
+        CONNECTIONS_REAPED.inc(reason)
+        if conn.queue.qsize():
+            MESSAGES_DROPPED.inc(reason, amount=conn.queue.qsize())
+        await self.close(conn)
+        try:
+            await conn.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def stats_for(self, channel_id: int) -> ChannelStats:
+        if channel_id not in self.channel_stats:
+            self.channel_stats[channel_id] = ChannelStats()
+        return self.channel_stats[channel_id]
+
+    def get_stats(self) -> dict[int, dict]:
+        return {
+            channel_id: stats.snapshot(self.active_connections.get(channel_id, []))
+            for channel_id, stats in self.channel_stats.items()
+        }
+
+    def _refusal(self, user: Principal) -> Optional[str]:
+        if len(self.connections) >= CHAT_WS_MAX_CONNECTIONS:
+            return "worker_limit"
+        if user is not None and self.user_connections.get(user.id, 0) >= CHAT_WS_MAX_CONNECTIONS_PER_USER:
+            return "user_limit"
+        return None
+
+    async def open(self, websocket: WebSocket, user: Principal,
+                   format: str = JSON) -> Optional[ClientConnection]:
+        """Accept a socket that is not subscribed to any channel yet.
+
+        A ``format`` other than JSON is confirmed to the client as the
+        accepted subprotocol. Over a connection cap the socket is closed
+        instead (1008 for the user's cap, 1013 for the worker's) and None
+        is returned.
+        """
+        refusal = self._refusal(user)
+        if refusal is not None:
+            CONNECTIONS_REFUSED.inc(refusal)
+            await websocket.close(code=1013 if refusal == "worker_limit" else 1008)
+            return None
+        conn = ClientConnection(websocket, user, self, format)
+        # Counted before accepting, so concurrent handshakes cannot overshoot
+        self.connections.add(conn)
+        if user is not None:
+            self.user_connections[user.id] = self.user_connections.get(user.id, 0) + 1
+        try:
+            await websocket.accept(subprotocol=SUBPROTOCOLS.get(format))
+        except Exception:
+            await self.close(conn)
+            raise
+        return conn
+
+    async def subscribe(self, conn: ClientConnection, channel_ids: Iterable[int], replaying: Iterable[int] = ()):
+        """Subscribe ``conn``; for channels in ``replaying``, hold live frames until ``release``."""
+        replaying = set(replaying)
         async with self._lock:
-            if channel_id not in self.active_connections:
-                self.active_connections[channel_id] = []
-            self.active_connections[channel_id].append((websocket, user))
+            for channel_id in channel_ids:
+                if conn.closed or channel_id in conn.channels:
+                    continue
+                if channel_id in replaying:
+                    conn.held[channel_id] = []
+                if channel_id not in self.active_connections:
+                    self.active_connections[channel_id] = []
+                    self.stats_for(channel_id)
+                    self.recent[channel_id] = RecentMessages(CHAT_RESUME_BUFFER_SIZE)
+                    # First local socket for this channel: start receiving its
+                    # frames from other workers
+                    await self.broker.subscribe(channel_id)
+                self.active_connections[channel_id].append(conn)
+                conn.channels.add(channel_id)
+                conn.idle_since = None
 
-    async def disconnect(self, websocket: WebSocket, channel_id: int):
+    async def unsubscribe(self, conn: ClientConnection, channel_ids: Iterable[int]):
         async with self._lock:
-            if channel_id in self.active_connections:
-                self.active_connections[channel_id] = [
-                    conn for conn in self.active_connections[channel_id]
-                    if conn[0] != websocket
-                ]
-                if not self.active_connections[channel_id]:
+            for channel_id in channel_ids:
+                if type(channel_id) is not int or channel_id not in conn.channels:
+                    continue
+                conn.channels.discard(channel_id)
+                conn.held.pop(channel_id, None)
+                if not conn.channels:
+                    conn.idle_since = time.monotonic()
+                connections = self.active_connections.get(channel_id)
+                if connections is None:
+                    continue
+                connections.remove(conn)
+                if not connections:
                     del self.active_connections[channel_id]
+                    self.channel_stats.pop(channel_id, None)
+                    self.recent.pop(channel_id, None)
+                    await self.broker.unsubscribe(channel_id)
+
+    async def close(self, conn: ClientConnection):
+        conn.close()
+        if conn in self.connections:
+            self.connections.remove(conn)
+            if conn.user is not None:
+                remaining = self.user_connections.pop(conn.user.id, 1) - 1
+                if remaining:
+                    self.user_connections[conn.user.id] = remaining
+        await self.unsubscribe(conn, list(conn.channels))
 
-    async def broadcast(self, message: str, channel_id: int, exclude: WebSocket = None):
-        if channel_id in self.active_connections:
-            for connection, _ in self.active_connections[channel_id]:
-                if connection != exclude:
-                    try:
-                        await connection.send_text(message)
-                    except WebSocketDisconnect:
-                        await self.disconnect(connection, channel_id)
-                    except Exception as e:
-                        print(f"Error broadcasting message: {e}")
+    async def connect(self, websocket: WebSocket, channel_id: int, user: Principal,
+                      format: str = JSON) -> Optional[ClientConnection]:
+        """Accept a socket for a single channel (the per-channel endpoint)."""
+        conn = await self.open(websocket, user, format)
+        if conn is not None:
+            await self.subscribe(conn, [channel_id])
+        return conn
+
+    async def disconnect(self, websocket: WebSocket, channel_id: int):
+        for conn in list(self.active_connections.get(channel_id, [])):
+            if conn.websocket is websocket:
+                await self.close(conn)
+
+    async def evict(self, conn: ClientConnection, reason: str, channel_id: Optional[int] = None):
+        """Drop a client; ``channel_id`` is the channel whose frame it failed to take."""
+        if conn.closed:
+            return
+        if channel_id in self.channel_stats:
+            self.channel_stats[channel_id].evictions += 1
+        MESSAGES_DROPPED.inc(reason, amount=1 + conn.queue.qsize())
+        await self.close(conn)
+        try:
+            await conn.websocket.close(code=1008)
+        except Exception:
+            pass
+
+    async def reply(self, conn: ClientConnection, frame: dict):
+        """Send a control frame to one client, behind anything already queued for it."""
+        if not conn.enqueue(Frame(frame)):
+            await self.evict(conn, "queue_full")
+
+    async def send_replay(self, conn: ClientConnection, frame: Frame, channel_id: int) -> bool:
+        """Queue a replayed frame, waiting for room; False once the client is gone."""
+        if conn.closed:
+            return False
+        try:
+            await asyncio.wait_for(conn.queue.put((frame, channel_id, time.perf_counter())), CHAT_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self.evict(conn, "send_timeout", channel_id)
+        return not conn.closed
+
+    async def release(self, conn: ClientConnection, channel_id: int, replayed: set):
+        """End a replay: queue the live frames held meanwhile, minus those replayed."""
+        held = conn.held.pop(channel_id, None)
+        if held is None or conn.closed:
+            return
+        for message_id, frame in held:
+            if message_id in replayed:
+                continue
+            if not conn.enqueue(frame, channel_id):
+                await self.evict(conn, "queue_full", channel_id)
+                return
+
+    async def broadcast(self, message: Union[Frame, str], channel_id: int, message_id: Optional[int] = None,
+                        exclude: WebSocket = None):
+        """Fan out a frame; a str is taken as an already encoded JSON frame."""
+        if isinstance(message, str):
+            message = Frame(json_text=message)
+        await self._deliver_local(channel_id, message, exclude, message_id)
+        # Workers relay frames to each other as JSON
+        await self.broker.publish(channel_id, message.json, message_id)
+
+    async def _deliver_remote(self, channel_id: int, message: Optional[str], message_id: Optional[int] = None):
+        if message is None:
+            # Too large to relay: load the message the other worker stored
+            if channel_id not in self.active_connections:
+                return
+            rows, _ = await get_messages_page(channel_id, 1, after=message_id - 1)
+            if not rows or rows[0]["id"] != message_id:
+                logger.error(f"Relayed message {message_id} not found in channel {channel_id}")
+                return
+            row = rows[0]
+            frame = message_frame(channel_id, row["id"], row["content"], row["user"], row["created_at"])
+        else:
+            # Other workers only send message frames; their id feeds the buffer
+            frame = Frame(json_text=message)
+            try:
+                message_id = frame.data["id"]
+            except (ValueError, KeyError, TypeError):
+                message_id = None
+        await self._deliver_local(channel_id, frame, message_id=message_id)
+
+    def _forget_recent(self):
+        # Broadcasts from other workers may have been lost, so no buffer can
+        # vouch for being complete until a database replay re-establishes it
+        for recent in self.recent.values():
+            recent.complete_after = None
+
+    async def _deliver_local(self, channel_id: int, message: Frame, exclude: WebSocket = None,
+                             message_id: Optional[int] = None):
+        if channel_id not in self.active_connections:
+            return
+        self.stats_for(channel_id).broadcasts += 1
+        MESSAGES_BROADCAST.inc()
+        if message_id is not None:
+            self.recent[channel_id].add(message_id, message)
+        overflowed = []
+        for conn in self.active_connections[channel_id]:
+            if conn.websocket == exclude:
+                continue
+            held = conn.held.get(channel_id)
+            if held is None:
+                if not conn.enqueue(message, channel_id):
+                    overflowed.append(conn)
+            elif len(held) < CHAT_SEND_QUEUE_SIZE:
+                held.append((message_id, message))
+            else:
+                overflowed.append(conn)
+        for conn in overflowed:
+            logger.warning(f"Evicting slow client {conn.user} from channel {channel_id}: send queue full")
+            await self.evict(conn, "queue_full", channel_id)
 
 manager = ConnectionManager()
+message_writer = (
+    MessageWriter(CHAT_WRITE_BATCH_SIZE, CHAT_WRITE_FLUSH_INTERVAL) if CHAT_WRITE_BEHIND else None
+)
+read_cursors = ReadCursorWriter(CHAT_READ_FLUSH_INTERVAL)
+
+
+def collect_ws_metrics():
+    connections = Gauge("chat_ws_connections", "Open WebSocket connections per channel", ("channel",))
+    for channel_id, channel_connections in manager.active_connections.items():
+        connections.set(len(channel_connections), str(channel_id))
+    sockets = Gauge("chat_ws_sockets", "Open WebSocket connections, however many channels each carries")
+    sockets.set(len(manager.connections))
+    return [connections, sockets]
+
+
+REGISTRY.add_collector(collect_ws_metrics)
+
+
+@router.get("/ws/stats")
+async def get_ws_stats(current_user: Principal = Depends(get_current_user)):
+    """This worker's socket stats for the channels the caller belongs to."""
+    stats = manager.get_stats()
+    if stats:
+        member_of = set(await ChannelMember.filter(
+            user_id=current_user.id, channel_id__in=list(stats)
+        ).values_list("channel_id", flat=True))
+        stats = {channel_id: channel_stats for channel_id, channel_stats in stats.items() if channel_id in member_of}
+    return {"channels": stats}
+
+
+def message_frame(channel_id: int, message_id: int, content: str, username: str, created_at: datetime) -> Frame:
+    """The frame broadcast for a chat message.
+
+    Frames carry their channel_id so clients of the multiplexed endpoint can
+    route them; the same frame goes to per-channel sockets, encoded once
+    per wire format. JSON frames carry the id as a string and an ISO
+    timestamp, MessagePack frames an integer and a timestamp extension.
+    """
+    return Frame({
+        "type": "message",
+        "channel_id": channel_id,
+        "id": message_id,
+        "content": content,
+        "user": username,
+        "created_at": created_at,
+    })
+
+
+async def save_message(channel_id: int, user: Principal, content: str) -> tuple[int, Frame]:
+    """Store a message sent over a socket; return its id and the frame to broadcast."""
+    if message_writer is not None:
+        message_id, created_at = await message_writer.submit(channel_id, user.id, content, user.username)
+    else:
+        async with in_transaction():
+            new_message = await Message.create(channel_id=channel_id, user_id=user.id, content=content)
+            await record_messages(channel_id, 1, new_message.id, new_message.created_at,
+                                  new_message.content, user.username)
+        message_id, created_at = new_message.id, new_message.created_at
+    read_cursors.mark(channel_id, user.id, message_id)
+    return message_id, message_frame(channel_id, message_id, content, user.username, created_at)
+
+
+async def replay(conn: ClientConnection, channel_id: int, last_seen_id: int):
+    """Send ``conn`` the messages after ``last_seen_id``, then switch it to live frames.
+
+    The connection is already subscribed with live frames held back (see
+    ConnectionManager.subscribe), so nothing committed after the replay is
+    read can be missed, and held frames that the replay already covered are
+    dropped by id. Short gaps come from the channel's ring buffer; longer
+    ones are read from the database a page at a time, each page queued only
+    as the client makes room for it. After CHAT_RESUME_MAX_MESSAGES the
+    replay stops with ``{"type": "resync", "channel_id": ...}``: live frames
+    follow, and the client refetches the history in between over REST.
+    """
+    replayed = set()
+    try:
+        recent = manager.recent.get(channel_id)
+        frames = recent.since(last_seen_id) if recent is not None else None
+        if frames is None and recent is not None and recent.warming is not None:
+            # In a reconnect storm, wait for the replay already reading the
+            # database: if it started at or before our position, it leaves
+            # the buffer covering us too
+            started_from, warmed = recent.warming
+            if started_from <= last_seen_id:
+                try:
+                    await asyncio.wait_for(asyncio.shield(warmed), CHAT_SEND_TIMEOUT)
+                except asyncio.TimeoutError:
+                    pass
+                frames = recent.since(last_seen_id)
+        if frames is not None:
+            RESUMES.inc("buffer")
+            for message_id, frame in frames:
+                if not await manager.send_replay(conn, frame, channel_id):
+                    return
+                replayed.add(message_id)
+            return
+
+        RESUMES.inc("database")
+        await replay_from_database(conn, channel_id, last_seen_id, recent, replayed)
+    finally:
+        await manager.release(conn, channel_id, replayed)
+
+
+def start_replay(conn: ClientConnection, channel_id: int, last_seen_id: int):
+    """Run ``replay`` as a task, so the receive loop keeps reading pongs meanwhile."""
+    task = asyncio.create_task(_run_replay(conn, channel_id, last_seen_id))
+    conn.replays[channel_id] = task
+
+
+async def stop_replays(conn: ClientConnection, channel_ids: Iterable[int]):
+    """Cancel the replays running for ``channel_ids`` and wait for them to end."""
+    tasks = [conn.replays[channel_id] for channel_id in channel_ids if channel_id in conn.replays]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _run_replay(conn: ClientConnection, channel_id: int, last_seen_id: int):
+    try:
+        await replay(conn, channel_id, last_seen_id)
+    except Exception as e:
+        logger.error(f"Error replaying channel {channel_id} for {conn.user}: {e}", exc_info=True)
+        await manager.close(conn)
+        try:
+            await conn.websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        if conn.replays.get(channel_id) is asyncio.current_task():
+            del conn.replays[channel_id]
+
+
+async def replay_from_database(conn: ClientConnection, channel_id: int, last_seen_id: int,
+                               recent: Optional[RecentMessages], replayed: set):
+    warming = None
+    if recent is not None and recent.warming is None:
+        warming = asyncio.get_running_loop().create_future()
+        recent.warming = (last_seen_id, warming)
+    try:
+        # The newest frames sent, to seed the buffer for the next resume
+        newest = deque(maxlen=CHAT_RESUME_BUFFER_SIZE)
+        complete_after = after = last_seen_id
+        while True:
+            rows, next_cursor = await get_messages_page(channel_id, CHAT_RESUME_PAGE_SIZE, after=after)
+            for row in rows:
+                if len(replayed) >= CHAT_RESUME_MAX_MESSAGES:
+                    # The frames sent are not the newest, so nothing is merged
+                    # into the buffer
+                    RESYNCS.inc()
+                    await manager.send_replay(conn, Frame({"type": "resync", "channel_id": channel_id}), channel_id)
+                    return
+                frame = message_frame(channel_id, row["id"], row["content"], row["user"], row["created_at"])
+                if not await manager.send_replay(conn, frame, channel_id):
+                    return
+                replayed.add(row["id"])
+                if len(newest) == newest.maxlen:
+                    complete_after = newest[0][0]
+                newest.append((row["id"], frame))
+            if next_cursor is None:
+                break
+            after = next_cursor
+        if recent is not None and manager.recent.get(channel_id) is recent:
+            recent.merge(complete_after, newest)
+    finally:
+        if warming is not None:
+            recent.warming = None
+            warming.set_result(None)
+
 
 @router.websocket("/ws/{channel_id}")
-async def websocket_endpoint(websocket: WebSocket, channel_id: int, token: str):
+async def websocket_endpoint(websocket: WebSocket, channel_id: int, token: str, last_seen_id: Optional[int] = None):
+    """Socket for one channel. With ``last_seen_id``, messages after it are sent first.
+
+    Frames are JSON text unless the client offers one of the subprotocols
+    in frames.FORMATS, as for the multiplexed endpoint. Clients answer
+    ``{"type": "ping"}`` with ``{"type": "pong"}``, as there.
+    """
     try:
         user = await get_current_user(token)
-        channel = await Channel.get_or_none(id=channel_id)
-        if not channel or not await ChannelMember.exists(channel=channel, user=user):
+        # Only members of existing channels have a membership row
+        if not await ChannelMember.exists(channel_id=channel_id, user_id=user.id):
             await websocket.close(code=1008)
             return
 
-        await manager.connect(websocket, channel_id, user)
+        conn = await manager.open(websocket, user, negotiate(websocket.scope.get("subprotocols", [])))
+        if conn is None:
+            return
         try:
+            if last_seen_id is None:
+                await manager.subscribe(conn, [channel_id])
+            else:
+                await manager.subscribe(conn, [channel_id], replaying=[channel_id])
+                # Beside the receive loop, so pongs are read during a long replay
+                start_replay(conn, channel_id, last_seen_id)
             while True:
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
-                new_message = await Message.create(
-                    channel=channel,
-                    user=user,
-                    content=message_data['content']
-                )
-                response = json.dumps({
-                    "id": str(new_message.id),
-                    "content": new_message.content,
-                    "user": user.username,
-                    "created_at": new_message.created_at.isoformat()
-                })
-                await manager.broadcast(response, channel_id)
+                message_data = decode(conn.format, await receive(conn))
+                if message_data.get("type") == "pong":
+                    continue
+                message_id, response = await save_message(channel_id, user, message_data['content'])
+                await manager.broadcast(response, channel_id, message_id)
         except WebSocketDisconnect:
-            await manager.disconnect(websocket, channel_id)
+            pass
         except Exception as e:
             print(f"Error in websocket connection: {e}")
-            await manager.disconnect(websocket, channel_id)
+        finally:
+            await stop_replays(conn, list(conn.replays))
+            await manager.close(conn)
     except Exception as e:
         print(f"Error establishing websocket connection: {e}")
-        await websocket.close(code=1008) 
\ No newline at end of file
+        await websocket.close(code=1008)
+
+
+async def receive(conn: ClientConnection) -> Union[str, bytes]:
+    """The next frame from the client, undecoded (see frames.decode).
+
+    Any frame counts as a heartbeat, so only quiet clients are pinged.
+    """
+    if conn.format == JSON:
+        data = await conn.websocket.receive_text()
+    else:
+        message = await conn.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        data = message["text"] if message.get("text") is not None else message["bytes"]
+    conn.last_seen = time.monotonic()
+    return data
+
+
+class FrameError(ValueError):
+    """A client frame the multiplexed endpoint cannot act on."""
+
+
+def _channel_ids(frame: dict) -> List[int]:
+    channels = frame.get("channels")
+    if not isinstance(channels, list) or not all(type(c) is int for c in channels):
+        raise FrameError("channels must be a list of channel ids")
+    return list(dict.fromkeys(channels))
+
+
+def _last_seen_ids(frame: dict) -> Dict[int, int]:
+    # JSON object keys are strings: {"12": 340}; MessagePack ones may be ints
+    last_seen = frame.get("last_seen_ids", {})
+    try:
+        if not isinstance(last_seen, dict) or not all(type(v) is int for v in last_seen.values()):
+            raise ValueError
+        return {int(channel_id): message_id for channel_id, message_id in last_seen.items()}
+    except ValueError:
+        raise FrameError("last_seen_ids must map channel ids to message ids") from None
+
+
+async def subscribe_channels(conn: ClientConnection, channel_ids: List[int], last_seen: Dict[int, int]):
+    """Subscribe to the channels among ``channel_ids`` the user is a member of.
+
+    Membership for the whole frame is one query; unknown channels and
+    channels the user does not belong to are rejected alike. The reply goes
+    out first, then the replay for each channel given in ``last_seen``,
+    which runs as its own task (see start_replay).
+    """
+    new = [channel_id for channel_id in channel_ids if channel_id not in conn.channels]
+    if len(conn.channels) + len(new) > CHAT_WS_MAX_SUBSCRIPTIONS:
+        raise FrameError(f"At most {CHAT_WS_MAX_SUBSCRIPTIONS} channels per connection")
+    member_of = set(await ChannelMember.filter(
+        user_id=conn.user.id, channel_id__in=new
+    ).values_list("channel_id", flat=True)) if new else set()
+    allowed = [channel_id for channel_id in new if channel_id in member_of]
+    resuming = {channel_id: last_seen[channel_id] for channel_id in allowed if channel_id in last_seen}
+    await manager.subscribe(conn, allowed, replaying=resuming)
+    await manager.reply(conn, {
+        "type": "subscribed",
+        "channels": [channel_id for channel_id in channel_ids if channel_id in conn.channels],
+        "rejected": [channel_id for channel_id in new if channel_id not in member_of],
+    })
+    for channel_id, last_seen_id in resuming.items():
+        start_replay(conn, channel_id, last_seen_id)
+
+
+async def handle_frame(conn: ClientConnection, frame: dict) -> Optional[dict]:
+    """Act on one client frame; returns the reply, if any."""
+    kind = frame.get("type")
+    if kind == "message":
+        channel_id = frame.get("channel_id")
+        if type(channel_id) is not int or channel_id not in conn.channels:
+            raise FrameError("Subscribe to a channel before sending to it")
+        content = frame.get("content")
+        if not isinstance(content, str):
+            raise FrameError("content must be a string")
+        message_id, response = await save_message(channel_id, conn.user, content)
+        await manager.broadcast(response, channel_id, message_id)
+        return None
+    if kind == "subscribe":
+        await subscribe_channels(conn, _channel_ids(frame), _last_seen_ids(frame))
+        return None
+    if kind == "unsubscribe":
+        channel_ids = _channel_ids(frame)
+        await stop_replays(conn, channel_ids)
+        await manager.unsubscribe(conn, channel_ids)
+        return {"type": "unsubscribed", "channels": channel_ids}
+    if kind == "pong":
+        return None
+    raise FrameError(f"Unknown frame type: {kind}")
+
+
+@router.websocket("/ws")
+async def multiplexed_websocket_endpoint(websocket: WebSocket, token: str):
+    """One socket for any number of channels.
+
+    Client frames are JSON objects with a ``type``:
+
+    * ``{"type": "subscribe", "channels": [1, 2]}``, answered with
+      ``{"type": "subscribed", "channels": [...], "rejected": [...]}``.
+      Adding ``"last_seen_ids": {"1": 340}`` first replays channel 1's
+      messages after id 340, with no gap or duplicate before live ones
+    * ``{"type": "unsubscribe", "channels": [1]}``
+    * ``{"type": "message", "channel_id": 1, "content": "hi"}``
+    * ``{"type": "pong"}``, the answer to the server's ``{"type": "ping"}``.
+      A socket that sends no frame at all within CHAT_WS_PING_TIMEOUT of a
+      ping is closed, as is one subscribed to no channel for
+      CHAT_WS_IDLE_TIMEOUT
+
+    Messages arrive as ``{"type": "message", "channel_id": ..., ...}``.
+    A frame that cannot be handled is answered with ``{"type": "error"}``
+    and the connection stays open.
+
+    By default every frame is JSON text. A client may instead offer one of
+    these subprotocols (``Sec-WebSocket-Protocol``), and the first one it
+    lists is accepted:
+
+    * ``flux.msgpack``: binary MessagePack frames, with integer ids and
+      timestamp-extension ``created_at``
+    * ``flux.msgpack+deflate`` and ``flux.json+deflate``: binary frames in
+      that encoding, compressed with raw DEFLATE (no zlib header) one frame
+      at a time
+
+    Each broadcast is encoded and compressed once per format, not once per
+    subscriber. The client may send either JSON text or binary frames in
+    its negotiated format.
+    """
+    try:
+        user = await get_current_user(token)
+    except Exception:
+        await websocket.close(code=1008)
+        return
+
+    conn = await manager.open(websocket, user, negotiate(websocket.scope.get("subprotocols", [])))
+    if conn is None:
+        return
+    try:
+        while True:
+            data = await receive(conn)
+            try:
+                frame = decode(conn.format, data)
+                if not isinstance(frame, dict):
+                    raise FrameError("Frames must be objects")
+                reply = await handle_frame(conn, frame)
+            except ValueError as e:
+                reply = {"type": "error", "detail": str(e)}
+            if reply is not None:
+                await manager.reply(conn, reply)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error in multiplexed websocket connection for {user.username}: {e}", exc_info=True)
+    finally:
+        await stop_replays(conn, list(conn.replays))
+        await manager.close(conn)
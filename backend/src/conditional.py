@@ -0,0 +1,73 @@
+# global conditional GET helpers (ETag / Last-Modified / 304)
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag from the values that determine a representation."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Naive datetimes from the database are UTC (TORTOISE_ORM timezone)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when it is absent (RFC 7232 section 6)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [_opaque(tag) for tag in if_none_match.split(",")]
+        return "*" in tags or _opaque(etag) in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    return headers
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def representation(body: str, etag: str, last_modified: datetime) -> dict:
+    """A rendered JSON body with its validators, in a cacheable (JSON-safe) form."""
+    return {"body": body, "etag": etag, "last_modified": _as_utc(last_modified).isoformat()}
+
+
+def conditional_response(request: Request, representation: dict) -> Response:
+    """Answer with a 304 when the client's copy is current, else the stored body."""
+    etag = representation["etag"]
+    last_modified = datetime.fromisoformat(representation["last_modified"])
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+    return Response(
+        representation["body"], media_type="application/json", headers=validator_headers(etag, last_modified)
+    )
@@ -20,8 +20,102 @@ DB_PORT = get_env_variable("DB_PORT")
 DB_NAME = get_env_variable("DB_NAME")
 DB_SSL_MODE = get_env_variable("DB_SSL_MODE")
 
+# Connection pool, per worker process. Connections idle longer than
+# DB_CONNECTION_LIFETIME seconds are closed (0 keeps them forever); requests
+# waiting longer than DB_POOL_ACQUIRE_TIMEOUT seconds for one get a 503
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_CONNECTION_LIFETIME = float(os.getenv("DB_CONNECTION_LIFETIME", "300"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+
+# Debug mode: adds X-DB-Query-Count / X-DB-Query-Time headers to every response
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
 # CORS configuration
 CORS_ALLOW_ORIGINS = os.getenv("CORS_ALLOW_ORIGINS").split(",")
 
+# Cache of verified access tokens -> principal used by get_current_user.
+# Entries live for at most TOKEN_CACHE_TTL seconds and never past the token's exp
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+
+# Read-through cache for profile details and single posts: a per-process
+# LRU of CACHE_SIZE entries that live CACHE_TTL seconds. CACHE_BACKEND
+# "postgres" adds a tier shared by all workers (cache_entries table); the
+# process tier then keeps entries CACHE_LOCAL_TTL seconds, which bounds how
+# stale another worker's copy can be after a write. With the default
+# "memory", a write only invalidates the worker that handled it and the
+# others serve the old entry (and answer 304 to its ETag) for up to
+# CACHE_TTL: deployments running more than one worker must set
+# CACHE_BACKEND=postgres
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", "5"))
+
+# Bulk post import/delete: at most POSTS_BULK_MAX_ITEMS posts per request,
+# written POSTS_BULK_CHUNK_SIZE rows per INSERT
+POSTS_BULK_MAX_ITEMS = int(os.getenv("POSTS_BULK_MAX_ITEMS", "100000"))
+POSTS_BULK_CHUNK_SIZE = int(os.getenv("POSTS_BULK_CHUNK_SIZE", "1000"))
+
+# bcrypt runs on a dedicated thread pool; requests beyond the pool plus
+# PASSWORD_HASH_MAX_PENDING waiters are rejected with 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# Refresh token store: "memory" (per process, bounded) or "postgres"
+# (refresh_tokens table). Expired tokens are swept every interval seconds
+REFRESH_TOKEN_STORE = os.getenv("REFRESH_TOKEN_STORE", "memory")
+REFRESH_TOKEN_STORE_SIZE = int(os.getenv("REFRESH_TOKEN_STORE_SIZE", "100000"))
+REFRESH_TOKEN_SWEEP_INTERVAL = float(os.getenv("REFRESH_TOKEN_SWEEP_INTERVAL", "60"))
+
+# Chat fan-out between workers: "memory" (single process) or "postgres"
+CHAT_BROKER = os.getenv("CHAT_BROKER", "memory")
+
+# Per-connection outbound queue: clients that overflow it, or take longer
+# than the timeout (seconds) to accept a frame, are disconnected
+CHAT_SEND_QUEUE_SIZE = int(os.getenv("CHAT_SEND_QUEUE_SIZE", "256"))
+CHAT_SEND_TIMEOUT = float(os.getenv("CHAT_SEND_TIMEOUT", "5"))
+
+# Channels one connection to the multiplexed /api/chat/ws may subscribe to
+CHAT_WS_MAX_SUBSCRIPTIONS = int(os.getenv("CHAT_WS_MAX_SUBSCRIPTIONS", "500"))
+
+# Sockets one user may keep open on a worker, and sockets per worker; over
+# either cap new sockets are refused
+CHAT_WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("CHAT_WS_MAX_CONNECTIONS_PER_USER", "20"))
+CHAT_WS_MAX_CONNECTIONS = int(os.getenv("CHAT_WS_MAX_CONNECTIONS", "10000"))
+
+# Heartbeats: a socket that has sent nothing for CHAT_WS_PING_INTERVAL
+# seconds is sent {"type": "ping"} and closed if it still sends nothing
+# within CHAT_WS_PING_TIMEOUT (0 turns heartbeats off). Sockets subscribed
+# to no channel are closed after CHAT_WS_IDLE_TIMEOUT seconds
+CHAT_WS_PING_INTERVAL = float(os.getenv("CHAT_WS_PING_INTERVAL", "30"))
+CHAT_WS_PING_TIMEOUT = float(os.getenv("CHAT_WS_PING_TIMEOUT", "30"))
+CHAT_WS_IDLE_TIMEOUT = float(os.getenv("CHAT_WS_IDLE_TIMEOUT", "300"))
+
+# Sockets resuming from a last seen message id are replayed from a ring
+# buffer of the last CHAT_RESUME_BUFFER_SIZE frames per channel when it
+# covers the gap, otherwise from the database CHAT_RESUME_PAGE_SIZE at a time.
+# A gap longer than CHAT_RESUME_MAX_MESSAGES is not replayed past that many:
+# the client is sent {"type": "resync"} and refetches history over REST
+CHAT_RESUME_BUFFER_SIZE = int(os.getenv("CHAT_RESUME_BUFFER_SIZE", "200"))
+CHAT_RESUME_PAGE_SIZE = int(os.getenv("CHAT_RESUME_PAGE_SIZE", "100"))
+CHAT_RESUME_MAX_MESSAGES = int(os.getenv("CHAT_RESUME_MAX_MESSAGES", "1000"))
+
+# zlib level for the flux.*+deflate WebSocket subprotocols; each frame is
+# compressed once per broadcast, whatever the number of subscribers
+CHAT_WS_DEFLATE_LEVEL = int(os.getenv("CHAT_WS_DEFLATE_LEVEL", "6"))
+
+# Write-behind persistence for WebSocket messages: buffer and insert in
+# batches of up to CHAT_WRITE_BATCH_SIZE every CHAT_WRITE_FLUSH_INTERVAL seconds
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "100"))
+CHAT_WRITE_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "0.01"))
+
+# Read cursors marked through POST /channels/{id}/read are held in memory
+# and written at most once per member every CHAT_READ_FLUSH_INTERVAL seconds
+CHAT_READ_FLUSH_INTERVAL = float(os.getenv("CHAT_READ_FLUSH_INTERVAL", "5"))
+
 
 DATABASE_URL = f"postgres://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
\ No newline at end of file
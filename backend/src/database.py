@@ -1,6 +1,14 @@
 from tortoise import Tortoise
+from tortoise import connections
 from src.config import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME, DB_SSL_MODE
+from src.config import (
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_STATEMENT_CACHE_SIZE,
+    DB_CONNECTION_LIFETIME, DB_POOL_ACQUIRE_TIMEOUT,
+)
+from src.db_pool import InstrumentedPool
+from src.metrics import REGISTRY, Gauge, HistogramMetric
 import ssl
+from typing import Optional
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -15,7 +23,8 @@ ssl_context.verify_mode = ssl.CERT_NONE
 TORTOISE_ORM = {
     "connections": {
         "default": {
-            "engine": "tortoise.backends.asyncpg",
+            # asyncpg with acquire metrics, see src/db_pool.py
+            "engine": "src.db_pool",
             "credentials": {
                 "user": DB_USER,
                 "password": DB_PASSWORD,
@@ -23,12 +32,17 @@ TORTOISE_ORM = {
                 "host": DB_HOST,
                 "port": int(DB_PORT),
                 "ssl": ssl_context if DB_SSL_MODE.lower() == "require" else None,
+                "minsize": DB_POOL_MIN_SIZE,
+                "maxsize": DB_POOL_MAX_SIZE,
+                "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+                "max_inactive_connection_lifetime": DB_CONNECTION_LIFETIME,
+                "acquire_timeout": DB_POOL_ACQUIRE_TIMEOUT,
             }
         }
     },
     "apps": {
         "models": {
-            "models": ["src.posts.models", "src.users.models", "src.chat.models" ,"aerich.models"],  # Include aerich models
+            "models": ["src.models", "src.posts.models", "src.users.models", "src.chat.models" ,"aerich.models"],  # Include aerich models
             "default_connection": "default",
         },
     },
@@ -49,5 +63,37 @@ async def close_db():
     logger.info("Closing database connections...")
     await Tortoise.close_connections()
     logger.info("Database connections closed.")
-    
 
+
+def get_pool_stats() -> Optional[dict]:
+    """Pool usage for the default connection, or None when it is not pooled."""
+    pool = getattr(connections.get("default"), "_pool", None)
+    if isinstance(pool, InstrumentedPool):
+        return pool.stats()
+    return None
+
+
+POOL_GAUGES = {
+    "size": "Open connections in the database pool",
+    "in_use": "Pool connections checked out",
+    "idle": "Pool connections available",
+    "waiters": "Tasks waiting to acquire a pool connection",
+}
+
+
+def collect_pool_metrics():
+    pool = getattr(connections.get("default"), "_pool", None)
+    if not isinstance(pool, InstrumentedPool):
+        return []
+    stats = pool.stats()
+    gauges = []
+    for key, help in POOL_GAUGES.items():
+        gauge = Gauge(f"db_pool_{key}", help)
+        gauge.set(stats[key])
+        gauges.append(gauge)
+    acquire_wait = HistogramMetric("db_pool_acquire_wait_seconds", "Time spent waiting for a pool connection")
+    acquire_wait.children[()] = pool.acquire_wait
+    return gauges + [acquire_wait]
+
+
+REGISTRY.add_collector(collect_pool_metrics)
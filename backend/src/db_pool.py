@@ -0,0 +1,79 @@
+# Tortoise engine wrapping the asyncpg pool with acquire metrics.
+# Referenced by "engine" in TORTOISE_ORM; Tortoise loads ``client_class`` from here.
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import asyncpg
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+
+from src.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(asyncio.TimeoutError):
+    """No connection became free within the pool's acquire timeout."""
+
+
+class InstrumentedPool:
+    """Proxy for an ``asyncpg.Pool`` that times every acquire.
+
+    Tortoise only calls ``acquire``/``release`` on the hot path; everything
+    else (close, terminate, expire_connections) is passed straight through.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, acquire_timeout: Optional[float] = None):
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.waiters = 0
+        self.acquire_timeouts = 0
+        self.acquire_wait = Histogram()
+
+    async def acquire(self) -> asyncpg.Connection:
+        self.waiters += 1
+        start = time.perf_counter()
+        try:
+            return await self._pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            logger.warning(f"Timed out after {self.acquire_timeout}s waiting for a database connection")
+            raise PoolTimeoutError(f"No database connection available within {self.acquire_timeout}s")
+        finally:
+            self.waiters -= 1
+            self.acquire_wait.observe(time.perf_counter() - start)
+
+    async def release(self, connection: asyncpg.Connection) -> None:
+        await self._pool.release(connection)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    def stats(self) -> dict:
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "waiters": self.waiters,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_wait_seconds": self.acquire_wait.snapshot(),
+        }
+
+
+class InstrumentedAsyncpgDBClient(AsyncpgDBClient):
+    def __init__(self, acquire_timeout: Optional[float] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.acquire_timeout = acquire_timeout
+
+    async def create_pool(self, **kwargs) -> InstrumentedPool:
+        pool = await asyncpg.create_pool(None, **kwargs)
+        return InstrumentedPool(pool, self.acquire_timeout)
+
+
+client_class = InstrumentedAsyncpgDBClient
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status
+from tortoise import connections
+from src.database import get_pool_stats
+from src.users.service import get_current_user
+from src.users.schemas import Principal
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Keep probes well inside a load balancer's check interval
+READINESS_TIMEOUT = 2.0
+
+
+@router.get("/ready")
+async def readiness():
+    """Ready once the database answers; 503 otherwise so the worker is taken out of rotation."""
+    try:
+        await asyncio.wait_for(connections.get("default").execute_query("SELECT 1"), READINESS_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Readiness check failed: {e!r}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database unavailable")
+    return {"status": "ready"}
+
+
+@router.get("/pool")
+async def get_pool(current_user: Principal = Depends(get_current_user)):
+    return {"pool": get_pool_stats()}
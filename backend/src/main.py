@@ -1,16 +1,23 @@
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from tortoise.contrib.fastapi import register_tortoise
 from src.database import init_db, close_db, TORTOISE_ORM
+from src.db_pool import PoolTimeoutError
+from src.metrics import REGISTRY, MetricsMiddleware
+from src.query_counter import QueryCountMiddleware
 
 # routers import
 from src.posts.router import router as posts_router
 from src.users.router import router as users_router
 from src.chat import router as chat_router
 from src.chat import ws_router as chat_ws_router
+from src.health.router import router as health_router
 
-from src.config import CORS_ALLOW_ORIGINS
+from src.users.service import password_hasher, refresh_token_store
+
+from src.config import CORS_ALLOW_ORIGINS, DEBUG
 
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 
@@ -27,8 +34,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+if DEBUG:
+    app.add_middleware(QueryCountMiddleware)
+
+# Outermost, so the recorded latency covers every other middleware
+app.add_middleware(MetricsMiddleware)
+
 # Setup database
 register_tortoise(
     app,
@@ -49,6 +63,17 @@ app.include_router(posts_router, prefix="/api/posts", tags=["posts"])
 app.include_router(users_router, prefix="/api/users", tags=["users"])
 app.include_router(chat_router.router, prefix="/api/chat", tags=["chat"])
 app.include_router(chat_ws_router.router, prefix="/api/chat", tags=["chat"])
+app.include_router(health_router, prefix="/api/health", tags=["health"])
+
+
+# Pool exhaustion is back-pressure, not a server bug: tell the client to retry
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, try again shortly"},
+        headers={"Retry-After": "1"},
+    )
 
 
 # Setup events
@@ -56,13 +81,29 @@ app.include_router(chat_ws_router.router, prefix="/api/chat", tags=["chat"])
 async def startup_event():
     logger.info("Starting up the application")
     await init_db()
+    await chat_ws_router.manager.start()
+    await chat_ws_router.read_cursors.start()
+    await refresh_token_store.start()
+    if chat_ws_router.message_writer is not None:
+        await chat_ws_router.message_writer.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down the application")
+    if chat_ws_router.message_writer is not None:
+        await chat_ws_router.message_writer.stop()
+    await chat_ws_router.manager.stop()
+    await chat_ws_router.read_cursors.stop()
+    await refresh_token_store.stop()
+    password_hasher.shutdown()
     await close_db()
 
 @app.get("/api")
 async def root():
     logger.info("Root endpoint accessed")
     return {"message": "Welcome to the Flux"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
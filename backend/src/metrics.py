@@ -0,0 +1,193 @@
+# global metrics primitives
+
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, List, Sequence, Tuple
+
+# Upper bounds in seconds, from sub-millisecond pool hits up to timeouts
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram in the Prometheus style.
+
+    ``observe`` is a bisect and two additions, cheap enough for hot paths.
+    Bucket counts are stored per bucket and made cumulative in ``snapshot``.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bound plus the +Inf overflow slot
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = self.count
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """A named metric family with one child per combination of label values."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children: dict = {}
+
+    def samples(self) -> Iterable[Tuple[str, dict, float]]:
+        for labelvalues, value in self.children.items():
+            yield self.name, dict(zip(self.labelnames, labelvalues)), value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self.children[labelvalues] = self.children.get(labelvalues, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self.children[labelvalues] = value
+
+
+class HistogramMetric(Metric):
+    """Labelled family of ``Histogram`` children."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        histogram = self.children.get(labelvalues)
+        if histogram is None:
+            histogram = self.children[labelvalues] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def samples(self) -> Iterable[Tuple[str, dict, float]]:
+        for labelvalues, histogram in self.children.items():
+            labels = dict(zip(self.labelnames, labelvalues))
+            for le, count in histogram.snapshot()["buckets"].items():
+                yield f"{self.name}_bucket", {**labels, "le": le}, count
+            yield f"{self.name}_sum", labels, histogram.sum
+            yield f"{self.name}_count", labels, histogram.count
+
+
+class Registry:
+    """Metrics exposed on /metrics.
+
+    Metrics updated on the hot path are registered once; collectors are
+    called at scrape time for values that are cheaper to read than to track
+    (connection counts, pool usage).
+    """
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Metric]]) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status code",
+    ("method", "route", "status"),
+))
+HTTP_REQUEST_DURATION = REGISTRY.register(HistogramMetric(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route"),
+))
+
+# Requests that matched no route share one label value, so scanners probing
+# random paths cannot blow up the number of series
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request count and latency per route.
+
+    Labels use the route template (``/api/posts/{post_id}``) that FastAPI
+    leaves in the scope after routing, never the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method, template)
+            HTTP_REQUESTS.inc(method, template, str(status_code))
@@ -6,3 +6,15 @@ class TimestampMixin:
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
+
+
+class CacheEntry(Model):
+    # Shared tier of src.cache (PostgresCacheBackend); value is JSON text
+    key = fields.CharField(max_length=255, pk=True)
+    value = fields.TextField()
+    expires_at = fields.DatetimeField()
+    # Bumped by every invalidation; loads only store over the version they read
+    version = fields.IntField(default=0)
+
+    class Meta:
+        table = "cache_entries"
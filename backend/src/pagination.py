@@ -0,0 +1,49 @@
+# global pagination helpers
+
+import base64
+from datetime import datetime
+from typing import Tuple
+
+from src.exceptions import BadRequestError
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _encode(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> Tuple[str, int]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    key, id = raw.rsplit("|", 1)
+    return key, int(id)
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor string."""
+    return _encode(f"{created_at.isoformat()}|{id}")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by ``encode_cursor``."""
+    try:
+        created_at, id = _decode(cursor)
+        return datetime.fromisoformat(created_at), id
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequestError("Invalid cursor")
+
+
+def encode_rank_cursor(rank: float, id: int) -> str:
+    """Encode a (rank, id) position in a relevance-ordered result set."""
+    return _encode(f"{rank!r}|{id}")
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode a cursor produced by ``encode_rank_cursor``."""
+    try:
+        rank, id = _decode(cursor)
+        return float(rank), id
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequestError("Invalid cursor")
@@ -34,6 +34,10 @@ class Post(Model, TimestampMixin):
 
     class Meta:
         table = "posts"
+        # Keyset pagination of the feed walks (created_at, id)
+        indexes = (("created_at", "id"),)
+        # The search_vector tsvector column is generated by Postgres and is
+        # deliberately not mapped here, see the full text search migration
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1,94 +1,188 @@
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from tortoise import timezone
 from src.posts.models import Post
-from src.posts.schemas import PostCreate, PostUpdate, PostInDB, PostWithUser
+from src.posts.schemas import (PostCreate, PostUpdate, PostInDB, PostWithUser,
+                               BulkCreateResult, BulkDelete, BulkDeleteResult)
 from src.posts.exceptions import PostNotFoundError
-from src.users.service import get_current_user
-from src.users.models import User
+from src.posts.service import (get_post, get_posts_page, search_posts, invalidate_posts,
+                               validate_bulk_posts, bulk_create_posts, bulk_delete_posts)
+from src.users.models import Profile
+from src.conditional import conditional_response
+from src.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.exceptions import BadRequestError
+from src.config import POSTS_BULK_MAX_ITEMS
+from src.responses import FastJSONResponse, model_rows
+from src.users.service import get_current_user, invalidate_profile
+from src.users.schemas import Principal
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/", response_model=PostInDB)
-async def create_post_route(post: PostCreate, current_user: User = Depends(get_current_user)):
+async def create_post_route(post: PostCreate, current_user: Principal = Depends(get_current_user)):
     logger.info(f"Creating new post: {post.title}")
     post_dict = post.dict()
-    post_dict['user'] = current_user
-    return await Post.create(**post_dict)
+    post_dict['user_id'] = current_user.id
+    new_post = await Post.create(**post_dict)
+    # The author's profile embeds their recent posts
+    await invalidate_profile(current_user.username)
+    return new_post
+
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl")
+
+BULK_CREATE_BODY = {
+    "required": True,
+    "content": {
+        "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/PostCreate"}}},
+        "application/x-ndjson": {"schema": {"type": "string", "description": "One PostCreate object per line"}},
+    },
+}
+
+
+def _too_many_items() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"At most {POSTS_BULK_MAX_ITEMS} posts per request")
+
+
+async def read_bulk_items(request: Request) -> list:
+    """Decoded items of a JSON array body, or of an NDJSON body read as it streams in."""
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type not in NDJSON_MEDIA_TYPES:
+        try:
+            items = orjson.loads(await request.body())
+        except orjson.JSONDecodeError:
+            raise BadRequestError("Body is not valid JSON")
+        if not isinstance(items, list):
+            raise BadRequestError("Body must be a JSON array of posts")
+        if len(items) > POSTS_BULK_MAX_ITEMS:
+            raise _too_many_items()
+        return items
+
+    items, buffer = [], b""
+    async for chunk in request.stream():
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            if line.strip():
+                items.append(_ndjson_item(line, len(items)))
+        if len(items) > POSTS_BULK_MAX_ITEMS:
+            raise _too_many_items()
+    if buffer.strip():
+        items.append(_ndjson_item(buffer, len(items)))
+    if len(items) > POSTS_BULK_MAX_ITEMS:
+        raise _too_many_items()
+    return items
+
+
+def _ndjson_item(line: bytes, index: int):
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError:
+        raise BadRequestError(f"Line for item {index} is not valid JSON")
+
+
+@router.post("/bulk", response_model=BulkCreateResult, openapi_extra={"requestBody": BULK_CREATE_BODY})
+async def bulk_create_posts_route(request: Request, current_user: Principal = Depends(get_current_user)):
+    items = await read_bulk_items(request)
+    logger.info(f"Bulk importing {len(items)} posts for user: {current_user.username}")
+    
+    # Invalid items are reported back by index; the rest go in in one transaction
+    posts, errors = validate_bulk_posts(items)
+    ids = await bulk_create_posts(current_user.id, posts) if posts else []
+    if ids:
+        await invalidate_profile(current_user.username)
+    return {"created": len(ids), "ids": ids, "errors": errors}
+
+
+@router.post("/bulk/delete", response_model=BulkDeleteResult)
+async def bulk_delete_posts_route(bulk: BulkDelete, current_user: Principal = Depends(get_current_user)):
+    logger.info(f"Bulk deleting {len(bulk.ids)} posts for user: {current_user.username}")
+    if len(bulk.ids) > POSTS_BULK_MAX_ITEMS:
+        raise _too_many_items()
+    
+    deleted = await bulk_delete_posts(current_user.id, bulk.ids)
+    if deleted:
+        await Profile.filter(user_id=current_user.id).update(updated_at=timezone.now())
+        await invalidate_posts(*deleted)
+        await invalidate_profile(current_user.username)
+    deleted_ids = set(deleted)
+    not_found = [post_id for post_id in dict.fromkeys(bulk.ids) if post_id not in deleted_ids]
+    return {"deleted": len(deleted), "not_found": not_found}
+
+
+# Declared before /{post_id} so "search" is not parsed as a post id
+@router.get("/search", response_model=list[PostWithUser])
+async def search_posts_route(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
+    logger.info(f"Searching posts for: {q}")
+    
+    posts, next_cursor = await search_posts(q, limit, after)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return posts
 
 
 @router.get("/{post_id}", response_model=PostWithUser)
-async def get_post_route(post_id: int):
+async def get_post_route(post_id: int, request: Request):
     logger.info(f"Fetching post with id: {post_id}")
     
-    # Fetch the post by ID
-    post = await Post.get_or_none(id=post_id)
+    # Rendered post and validators, from the cache or one query
+    post = await get_post(post_id)
     
     if not post:
         logger.warning(f"Post with id {post_id} not found")
         raise PostNotFoundError(post_id)
     
-    # Fetch the user associated with the post
-    user = await User.get(id=post.user_id)
-    
-    # Return the post data along with the username
-    return {
-        "id": post.id,
-        "title": post.title,
-        "content": post.content,
-        "username": user.username,  
-        "created_at": post.created_at,
-        "updated_at": post.updated_at,
-    }
-
-
+    return conditional_response(request, post)
 
 
 @router.get("/", response_model=list[PostWithUser])
-async def get_all_posts():
-    logger.info("Fetching all posts")
-    
-    # Fetch all posts
-    posts = await Post.all()
+async def get_all_posts(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
+    logger.info(f"Fetching posts page (limit={limit}, after={after})")
     
-    # Create a list to store the response data
-    result = []
+    posts, next_cursor = await get_posts_page(limit, after)
     
-    # Loop through each post and fetch the corresponding username from the User table
-    for post in posts:
-        # Fetch the user using the user_id from the post
-        user = await User.get(id=post.user_id)
-        
-        # Append the post data with the username to the result
-        result.append({
-            "id": post.id,
-            "title": post.title,
-            "content": post.content,
-            "username": user.username,  # Get username from User table
-            "created_at": post.created_at,
-            "updated_at": post.updated_at,
-        })
+    # The cursor for the following page travels in a header so the body
+    # stays a plain list of posts
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
     
-    return result
+    # Rows come straight from the ORM in PostWithUser's shape
+    return FastJSONResponse(model_rows(PostWithUser, posts), headers=headers)
 
 
 @router.put("/{post_id}", response_model=PostInDB)
-async def update_post_route(post_id: int, post_update: PostUpdate, current_user: User = Depends(get_current_user)):
+async def update_post_route(post_id: int, post_update: PostUpdate, current_user: Principal = Depends(get_current_user)):
     logger.info(f"Updating post with id: {post_id}")
-    post = await Post.get_or_none(id=post_id, user=current_user)
+    post = await Post.get_or_none(id=post_id, user_id=current_user.id)
     if not post:
         logger.warning(f"Post with id {post_id} not found or doesn't belong to the current user")
         raise PostNotFoundError(post_id)
     await post.update_from_dict(post_update.dict(exclude_unset=True)).save()
+    await invalidate_posts(post_id)
+    await invalidate_profile(current_user.username)
     return post
 
 @router.delete("/{post_id}")
-async def delete_post_route(post_id: int, current_user: User = Depends(get_current_user)):
+async def delete_post_route(post_id: int, current_user: Principal = Depends(get_current_user)):
     logger.info(f"Deleting post with id: {post_id}")
-    post = await Post.get_or_none(id=post_id, user=current_user)
+    post = await Post.get_or_none(id=post_id, user_id=current_user.id)
     if not post:
         logger.warning(f"Post with id {post_id} not found or doesn't belong to the current user")
         raise PostNotFoundError(post_id)
     await post.delete()
+    # The author's profile lists recent posts; move its Last-Modified forward
+    await Profile.filter(user_id=current_user.id).update(updated_at=timezone.now())
+    await invalidate_posts(post_id)
+    await invalidate_profile(current_user.username)
     return {"message": "Post deleted successfully"}
@@ -35,7 +35,7 @@
 
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class PostCreate(BaseModel):
     title: Optional[str] = None
@@ -65,4 +65,24 @@ class PostWithUser(BaseModel):
     updated_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class BulkItemError(BaseModel):
+    # Position of the rejected item in the submitted array / NDJSON lines
+    index: int
+    error: str
+
+class BulkCreateResult(BaseModel):
+    created: int
+    # Ids of the created posts, in submission order
+    ids: List[int]
+    errors: List[BulkItemError]
+
+class BulkDelete(BaseModel):
+    ids: List[int]
+
+class BulkDeleteResult(BaseModel):
+    deleted: int
+    # Ids that do not exist or belong to another user
+    not_found: List[int]
@@ -1 +1,202 @@
 # src/posts/service.py
+
+import logging
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Iterable, Optional, Tuple, List
+from pydantic import ValidationError
+from tortoise import timezone
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+from src.posts.models import Post
+from src.posts.schemas import PostCreate, PostWithUser
+from src.pagination import encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor
+from src.conditional import make_etag, representation
+from src.cache import create_cache
+from src.config import CACHE_BACKEND, CACHE_SIZE, CACHE_TTL, CACHE_LOCAL_TTL, POSTS_BULK_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Columns returned for PostWithUser; the author's username is pulled through
+# the posts -> users join so a page of posts costs a single query.
+POST_WITH_USER_FIELDS = ("id", "title", "content", "created_at", "updated_at")
+
+
+async def get_post_with_user(post_id: int) -> Optional[dict]:
+    return await Post.filter(id=post_id).first().values(
+        *POST_WITH_USER_FIELDS, username="user__username"
+    )
+
+
+def post_etag(post_id: int, updated_at: datetime) -> str:
+    return make_etag("post", post_id, updated_at)
+
+
+# Rendered single posts (PostWithUser), see src.cache
+post_cache = create_cache("posts", CACHE_BACKEND, CACHE_SIZE, CACHE_TTL, CACHE_LOCAL_TTL)
+
+
+async def _load_post(post_id: int) -> Optional[dict]:
+    post = await get_post_with_user(post_id)
+    if not post:
+        return None
+    return representation(PostWithUser(**post).model_dump_json(), post_etag(post_id, post["updated_at"]),
+                          post["updated_at"])
+
+
+async def get_post(post_id: int) -> Optional[dict]:
+    """The post rendered as JSON with its ETag and Last-Modified, read through the cache."""
+    return await post_cache.get_or_load(f"post:{post_id}", lambda: _load_post(post_id))
+
+
+async def invalidate_posts(*post_ids: int) -> None:
+    await post_cache.invalidate(*[f"post:{post_id}" for post_id in post_ids])
+
+
+async def get_posts_page(limit: int, after: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of the feed, newest first, and the cursor for the next page.
+
+    Pages are keyed on ``(created_at, id)`` so each request is an index range
+    scan no matter how deep into the feed the client is.
+    """
+    query = Post.all()
+    if after:
+        created_at, post_id = decode_cursor(after)
+        query = query.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id)
+        )
+
+    # Fetch one extra row to know whether another page exists
+    rows = await query.order_by("-created_at", "-id").limit(limit + 1).values(
+        *POST_WITH_USER_FIELDS, username="user__username"
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+
+    logger.info(f"Fetched {len(rows)} posts (next cursor: {next_cursor})")
+    return rows, next_cursor
+
+
+# posts.search_vector is a stored generated tsvector (title weighted above
+# content) with a GIN index, see migrations; Postgres keeps it current on
+# every INSERT/UPDATE.
+POST_SEARCH_SQL = """
+    SELECT p.id, p.title, p.content, p.created_at, p.updated_at,
+           u.username, ts_rank(p.search_vector, q.query) AS rank
+    FROM posts p
+    JOIN users u ON u.id = p.user_id,
+         websearch_to_tsquery('english', $1) AS q(query)
+    WHERE p.search_vector @@ q.query {cursor_clause}
+    ORDER BY rank DESC, p.id DESC
+    LIMIT $2
+"""
+POST_SEARCH_CURSOR_CLAUSE = "AND (ts_rank(p.search_vector, q.query), p.id) < ($3::real, $4)"
+
+
+async def search_posts(text: str, limit: int, after: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Full-text search over post titles and content, best matches first."""
+    db = Post._meta.db
+    if db.capabilities.dialect == "postgres":
+        values = [text, limit + 1]
+        cursor_clause = ""
+        if after:
+            values.extend(decode_rank_cursor(after))
+            cursor_clause = POST_SEARCH_CURSOR_CLAUSE
+        _, rows = await db.execute_query(POST_SEARCH_SQL.format(cursor_clause=cursor_clause), values)
+        rows = [dict(row) for row in rows]
+    else:
+        # Fallback for databases without tsvector (SQLite in tests): substring
+        # match, newest first, every row ranked equally
+        query = Post.filter(Q(title__icontains=text) | Q(content__icontains=text))
+        if after:
+            _, post_id = decode_rank_cursor(after)
+            query = query.filter(id__lt=post_id)
+        rows = await query.order_by("-id").limit(limit + 1).values(
+            *POST_WITH_USER_FIELDS, username="user__username"
+        )
+        for row in rows:
+            row["rank"] = 0.0
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1]["rank"], rows[-1]["id"])
+    return rows, next_cursor
+
+
+# Bulk import writes rows directly: no Post instances (and their per-instance
+# logging), one multi-row INSERT per chunk, all chunks in one transaction
+BULK_COLUMNS = ("title", "content", "user_id", "created_at", "updated_at")
+TITLE_MAX_LENGTH = Post._meta.fields_map["title"].max_length
+
+
+@lru_cache(maxsize=16)
+def _bulk_insert_sql(dialect: str, rows: int) -> str:
+    width = len(BULK_COLUMNS)
+    if dialect == "postgres":
+        placeholder = lambda i: f"${i + 1}"
+    else:
+        placeholder = lambda i: "?"
+    values_sql = ", ".join(
+        "(" + ", ".join(placeholder(r * width + c) for c in range(width)) + ")"
+        for r in range(rows)
+    )
+    columns_sql = ", ".join(f'"{column}"' for column in BULK_COLUMNS)
+    return f'INSERT INTO "{Post._meta.db_table}" ({columns_sql}) VALUES {values_sql} RETURNING "id"'
+
+
+def _item_error(error: ValidationError) -> str:
+    first = error.errors(include_url=False)[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+def validate_bulk_posts(items: Iterable[Any]) -> Tuple[List[PostCreate], List[dict]]:
+    """Split submitted items into valid posts and per-item errors (by index)."""
+    posts, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            post = PostCreate.model_validate(item)
+        except ValidationError as e:
+            errors.append({"index": index, "error": _item_error(e)})
+            continue
+        if post.title is not None and len(post.title) > TITLE_MAX_LENGTH:
+            errors.append({"index": index, "error": f"title: longer than {TITLE_MAX_LENGTH} characters"})
+            continue
+        posts.append(post)
+    return posts, errors
+
+
+async def bulk_create_posts(user_id: int, posts: List[PostCreate]) -> List[int]:
+    """Insert ``posts`` for ``user_id`` in chunks, atomically; return their ids in order."""
+    now = timezone.now()
+    ids: List[int] = []
+    async with in_transaction() as connection:
+        for start in range(0, len(posts), POSTS_BULK_CHUNK_SIZE):
+            chunk = posts[start:start + POSTS_BULK_CHUNK_SIZE]
+            values = [value for post in chunk for value in (post.title, post.content, user_id, now, now)]
+            sql = _bulk_insert_sql(connection.capabilities.dialect, len(chunk))
+            _, result = await connection.execute_query(sql, values)
+            # Serial ids are drawn in VALUES order; sort in case RETURNING is not
+            ids.extend(sorted(record["id"] for record in result))
+    logger.info(f"Bulk created {len(ids)} posts for user {user_id}")
+    return ids
+
+
+async def bulk_delete_posts(user_id: int, post_ids: List[int]) -> List[int]:
+    """Delete the given posts owned by ``user_id``; return the ids actually deleted."""
+    post_ids = list(dict.fromkeys(post_ids))
+    deleted: List[int] = []
+    async with in_transaction():
+        for start in range(0, len(post_ids), POSTS_BULK_CHUNK_SIZE):
+            chunk = post_ids[start:start + POSTS_BULK_CHUNK_SIZE]
+            owned = await Post.filter(id__in=chunk, user_id=user_id).values_list("id", flat=True)
+            if owned:
+                await Post.filter(id__in=owned).delete()
+                deleted.extend(owned)
+    logger.info(f"Bulk deleted {len(deleted)} posts for user {user_id}")
+    return deleted
@@ -0,0 +1,96 @@
+# request-scoped database query accounting
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Iterator, List, Optional
+
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+from tortoise.backends.asyncpg.client import TransactionWrapper as AsyncpgTransactionWrapper
+from tortoise.backends.sqlite.client import SqliteClient
+from tortoise.backends.sqlite.client import TransactionWrapper as SqliteTransactionWrapper
+
+# Every statement the ORM issues goes through one of these client methods
+QUERY_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+
+class QueryStats:
+    """Number of statements and total time spent in the database."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: List[str] = []
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements.append(statement)
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Count every query issued by the current task (and tasks it spawns) inside the block."""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def _counted(method):
+    @wraps(method)
+    async def wrapper(self, query, *args, **kwargs):
+        stats = _current_stats.get()
+        if stats is None:
+            return await method(self, query, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        finally:
+            stats.record(query, time.perf_counter() - start)
+
+    wrapper.counts_queries = True
+    return wrapper
+
+
+def instrument_client(client_class) -> None:
+    """Wrap the query methods a Tortoise client class defines itself."""
+    for name in QUERY_METHODS:
+        method = client_class.__dict__.get(name)
+        if method is not None and not getattr(method, "counts_queries", False):
+            setattr(client_class, name, _counted(method))
+
+
+# Transaction wrappers override some methods, so they are wrapped separately;
+# src.db_pool's client inherits from AsyncpgDBClient
+for _client_class in (AsyncpgDBClient, AsyncpgTransactionWrapper, SqliteClient, SqliteTransactionWrapper):
+    instrument_client(_client_class)
+
+
+class QueryCountMiddleware:
+    """Debug-only ASGI middleware reporting each request's queries in response headers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-query-count", str(stats.count).encode()))
+                    headers.append((b"x-db-query-time", f"{stats.duration * 1000:.2f}ms".encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
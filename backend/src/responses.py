@@ -0,0 +1,31 @@
+# global response helpers
+
+from typing import Iterable, List, Type
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    List routes return it directly with rows from ``QuerySet.values()``.
+    FastAPI passes a returned Response through untouched, so the rows are
+    not validated and re-serialized one model at a time; the route's
+    ``response_model`` still documents it in OpenAPI. Datetimes render as
+    Pydantic renders them (UTC as ``Z``).
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def model_rows(model: Type[BaseModel], rows: Iterable[dict]) -> List[dict]:
+    """Project trusted rows onto ``model``'s fields, without validation.
+
+    Only use this for rows the ORM produced with the right types; a missing
+    column raises KeyError rather than being filled with a default.
+    """
+    fields = tuple(model.model_fields)
+    return [{name: row[name] for name in fields} for row in rows]
@@ -34,4 +34,16 @@ class Profile(Model, TimestampMixin):
         return f"Profile for {self.user.username}" 
 
 
+class RefreshTokenEntry(Model):
+    # Issued refresh tokens for DatabaseRefreshTokenStore; only the SHA-256
+    # of the JWT is stored
+    token_hash = fields.CharField(max_length=64, pk=True)
+    username = fields.CharField(max_length=50)
+    expires_at = fields.DatetimeField(index=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "refresh_tokens"
+
+
 # class Device
\ No newline at end of file
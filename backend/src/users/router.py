@@ -1,15 +1,16 @@
 # users/router.py
 
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from .schemas import UserCreate, UserResponse, Token, RefreshToken, ProfileDetailResponse, ProfileResponse, ProfileUpdate
+from .schemas import UserCreate, UserResponse, Token, RefreshToken, ProfileDetailResponse, ProfileResponse, ProfileUpdate, Principal
 from .service import (
     create_user, authenticate_user, create_access_token, create_refresh_token,
     get_current_user, verify_refresh_token, revoke_refresh_token,
     get_user_profile, update_user_profile
     
 )
+from src.conditional import conditional_response
 from datetime import timedelta
 from .models import User
 
@@ -39,7 +40,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
-    refresh_token = create_refresh_token(data={"sub": user.username})
+    refresh_token = await create_refresh_token(data={"sub": user.username})
     logger.info(f"Successful login for user: {user.username}")
     return {
         "access_token": access_token,
@@ -52,14 +53,19 @@ async def refresh_token(refresh_token: RefreshToken):
     logger.info("Token refresh attempt")
     try:
         username = await verify_refresh_token(refresh_token.refresh_token)
+        # Claim the old refresh token before minting new ones: of concurrent
+        # refreshes (or a refresh racing a logout) only one revokes it
+        if await revoke_refresh_token(refresh_token.refresh_token) is None:
+            logger.warning(f"Refresh token for user {username} was already used or revoked")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired refresh token"
+            )
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         new_access_token = create_access_token(
             data={"sub": username}, expires_delta=access_token_expires
         )
-        new_refresh_token = create_refresh_token(data={"sub": username})
-        
-        # Revoke the old refresh token
-        revoke_refresh_token(refresh_token.refresh_token)
+        new_refresh_token = await create_refresh_token(data={"sub": username})
         
         logger.info(f"Successfully refreshed tokens for user: {username}")
         return {
@@ -80,20 +86,20 @@ async def refresh_token(refresh_token: RefreshToken):
 @router.post("/logout")
 async def logout(refresh_token: RefreshToken):
     logger.info("Logout attempt")
-    revoke_refresh_token(refresh_token.refresh_token)
+    await revoke_refresh_token(refresh_token.refresh_token)
     logger.info("Successfully logged out")
     return {"message": "Successfully logged out"}
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: Principal = Depends(get_current_user)):
     logger.info(f"Fetching user info for: {current_user.username}")
-    return current_user
+    return await User.get(id=current_user.id)
 
 
 # profile
 
 @router.get("/profile/{username}", response_model=ProfileDetailResponse)
-async def get_profile(username: str):
+async def get_profile(username: str, request: Request):
     logger.info(f"Fetching profile for user: {username}")
     profile = await get_user_profile(username)
     if not profile:
@@ -101,14 +107,14 @@ async def get_profile(username: str):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    return profile
+    return conditional_response(request, profile)
 
 
 @router.put("/profile/{username}", response_model=ProfileResponse)
 async def update_profile(
     username: str,
     profile_data: ProfileUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # Check if the current user is updating their own profile
     if current_user.username != username:
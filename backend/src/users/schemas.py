@@ -52,6 +52,18 @@ class TokenData(BaseModel):
     token_type: str 
 
 
+class Principal(BaseModel):
+    # Authenticated caller as resolved by get_current_user; carries just
+    # enough of the user row to authorize a request without reloading it
+    id: int
+    username: str
+    role: str
+    is_active: bool
+
+    def __str__(self):
+        return self.username
+
+
 class RefreshToken(BaseModel):
     refresh_token: str
 
@@ -66,7 +78,7 @@ class ProfileUpdate(BaseModel):
 
 class PostResponse(BaseModel):
     id: int
-    title: str
+    title: Optional[str] = None
     content: str
     created_at: datetime
     updated_at: datetime
@@ -5,33 +5,66 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from .models import User, Profile
 from .schemas import (UserCreate, UserResponse, 
-                        TokenData, PostResponse, 
+                        TokenData, Principal, PostResponse, 
                         ProfileDetailResponse, ProfileResponse,
                         ProfileUpdate )
 from fastapi.security import OAuth2PasswordBearer
 import uuid
-from typing import Optional
+from typing import Optional, Tuple
 from tortoise.transactions import in_transaction
+from tortoise.signals import post_save, post_delete
 from src.posts.models import Post 
+from src.conditional import make_etag, representation
+from src.cache import create_cache
+from src.metrics import REGISTRY, Counter, Gauge
 
-from src.config import SECRET_KEY
+from src.config import (SECRET_KEY, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL,
+                        PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING,
+                        REFRESH_TOKEN_STORE, REFRESH_TOKEN_STORE_SIZE,
+                        REFRESH_TOKEN_SWEEP_INTERVAL,
+                        CACHE_BACKEND, CACHE_SIZE, CACHE_TTL, CACHE_LOCAL_TTL)
+from .utils import PrincipalCache, PasswordHasher
+from .token_store import create_refresh_token_store
 
 logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(pwd_context, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
 
 SECRET_KEY = SECRET_KEY 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 5
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
-# Store for refresh tokens (In production, use Redis or database)
-refresh_tokens = {}
+# Store for issued refresh tokens, see token_store
+refresh_token_store = create_refresh_token_store(
+    REFRESH_TOKEN_STORE, REFRESH_TOKEN_STORE_SIZE, REFRESH_TOKEN_SWEEP_INTERVAL
+)
+
+# Verified access tokens -> principal, see PrincipalCache
+principal_cache = PrincipalCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+
+def collect_principal_cache_metrics():
+    stats = principal_cache.stats()
+    hits = Counter("principal_cache_hits_total", "Access tokens resolved from the principal cache")
+    hits.inc(amount=stats["hits"])
+    misses = Counter("principal_cache_misses_total", "Access tokens decoded and looked up")
+    misses.inc(amount=stats["misses"])
+    size = Gauge("principal_cache_entries", "Verified access tokens in this worker's principal cache")
+    size.set(stats["size"])
+    return [hits, misses, size]
+
+
+REGISTRY.add_collector(collect_principal_cache_metrics)
+
+# Rendered profile details by username, see src.cache
+profile_cache = create_cache("profiles", CACHE_BACKEND, CACHE_SIZE, CACHE_TTL, CACHE_LOCAL_TTL)
 
 
 async def create_user(user: UserCreate) -> UserResponse:
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     user_dict = user.dict()
     user_dict['password'] = hashed_password
     
@@ -45,7 +78,7 @@ async def create_user(user: UserCreate) -> UserResponse:
 
 async def authenticate_user(username: str, password: str) -> Optional[User]:
     user = await User.get_or_none(username=username)
-    if not user or not pwd_context.verify(password, user.password):
+    if not user or not await password_hasher.verify(password, user.password):
         logger.warning(f"Failed authentication attempt for username: {username}")
         return None
     logger.info(f"Successful authentication for username: {username}")
@@ -63,29 +96,32 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     logger.info(f"Created access token for user: {data['sub']}")
     return encoded_jwt
 
-def create_refresh_token(data: dict) -> str:
+async def create_refresh_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({
         "token_type": "refresh",
-        "exp": expire
+        "exp": expire,
+        # Unique id so tokens issued in the same second hash differently
+        "jti": uuid.uuid4().hex
     })
     refresh_token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     
     # Store refresh token with metadata
-    refresh_tokens[refresh_token] = {
-        "username": data["sub"],
-        "expires": expire
-    }
+    await refresh_token_store.add(refresh_token, data["sub"], expire)
     logger.info(f"Created refresh token for user: {data['sub']}")
     return refresh_token
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -106,16 +142,37 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         logger.error("Failed to decode JWT token", exc_info=True)
         raise credentials_exception
         
-    user = await User.get_or_none(username=token_data.username)
+    user = await User.get_or_none(username=token_data.username).values(
+        "id", "username", "role", "is_active"
+    )
     if user is None:
         logger.warning(f"User not found: {token_data.username}")
         raise credentials_exception
-    return user
+    principal = Principal(**user)
+    if not principal.is_active:
+        logger.warning(f"Inactive user: {token_data.username}")
+        raise credentials_exception
+
+    principal_cache.set(token, principal, exp)
+    return principal
+
+
+@post_save(User)
+async def _invalidate_saved_user(sender, instance: User, created, using_db, update_fields) -> None:
+    principal_cache.invalidate_user(instance.id)
+    await invalidate_profile(instance.username)
+
+
+@post_delete(User)
+async def _invalidate_deleted_user(sender, instance: User, using_db) -> None:
+    principal_cache.invalidate_user(instance.id)
+    await invalidate_profile(instance.username)
+
 
 async def verify_refresh_token(refresh_token: str) -> str:
     try:
         # Check if refresh token exists in storage
-        if refresh_token not in refresh_tokens:
+        if await refresh_token_store.get(refresh_token) is None:
             logger.warning("Invalid refresh token: not found in storage")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -138,7 +195,7 @@ async def verify_refresh_token(refresh_token: str) -> str:
         # Check if token is expired
         if datetime.fromtimestamp(exp) < datetime.utcnow():
             # Remove expired token from storage
-            del refresh_tokens[refresh_token]
+            await refresh_token_store.revoke(refresh_token)
             logger.warning(f"Expired refresh token for user: {username}")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -153,24 +210,54 @@ async def verify_refresh_token(refresh_token: str) -> str:
             detail="Invalid refresh token"
         )
 
-def revoke_refresh_token(refresh_token: str) -> None:
-    if refresh_token in refresh_tokens:
-        username = refresh_tokens[refresh_token]["username"]
-        del refresh_tokens[refresh_token]
+async def revoke_refresh_token(refresh_token: str) -> Optional[str]:
+    """Revoke a refresh token; the username only for the caller that revoked it.
+
+    Of concurrent revokes of one token, the rest get None, so a refresh can
+    use this to claim the token it is about to replace.
+    """
+    username = await refresh_token_store.revoke(refresh_token)
+    if username is not None:
         logger.info(f"Revoked refresh token for user: {username}")
+    return username
 
 
 
 # profile 
-async def get_user_profile(username: str) -> Optional[ProfileDetailResponse]:
-    user = await User.get_or_none(username=username).prefetch_related('profile', 'posts')
+
+# Number of posts embedded in ProfileDetailResponse
+RECENT_POSTS_LIMIT = 5
+
+
+def profile_validators(user_updated_at: datetime, profile_updated_at: datetime, posts: list) -> Tuple[str, datetime]:
+    """ETag and Last-Modified for a profile detail.
+
+    ``posts`` are the (id, updated_at) pairs of the embedded recent posts, so
+    a new, edited or deleted recent post changes the ETag.
+    """
+    etag = make_etag("profile", user_updated_at, profile_updated_at, posts)
+    last_modified = max([user_updated_at, profile_updated_at, *(updated_at for _, updated_at in posts)])
+    return etag, last_modified
+
+
+async def get_user_profile(username: str) -> Optional[dict]:
+    """The profile detail rendered as JSON with its ETag and Last-Modified, read through the cache."""
+    return await profile_cache.get_or_load(f"profile:{username}", lambda: _load_user_profile(username))
+
+
+async def invalidate_profile(username: str) -> None:
+    await profile_cache.invalidate(f"profile:{username}")
+
+
+async def _load_user_profile(username: str) -> Optional[dict]:
+    user = await User.get_or_none(username=username).prefetch_related('profile')
     if not user:
         return None
         
     # Get recent posts with all details
-    recent_posts = await Post.filter(user=user).order_by('-created_at').limit(5)
+    recent_posts = await Post.filter(user=user).order_by('-created_at').limit(RECENT_POSTS_LIMIT)
     
-    return ProfileDetailResponse(
+    profile = ProfileDetailResponse(
         username=user.username,
         email=user.email,
         first_name=user.profile.first_name,
@@ -179,6 +266,10 @@ async def get_user_profile(username: str) -> Optional[ProfileDetailResponse]:
         dob=user.profile.dob,
         recent_posts=[PostResponse.from_orm(post) for post in recent_posts]
     )
+    etag, last_modified = profile_validators(
+        user.updated_at, user.profile.updated_at, [(post.id, post.updated_at) for post in recent_posts]
+    )
+    return representation(profile.model_dump_json(), etag, last_modified)
 
 
 async def update_user_profile(username: str, profile_data: ProfileUpdate) -> Optional[ProfileResponse]:
@@ -188,6 +279,7 @@ async def update_user_profile(username: str, profile_data: ProfileUpdate) -> Opt
         
     # Update profile
     await user.profile.update_from_dict(profile_data.dict(exclude_unset=True)).save()
+    await invalidate_profile(username)
     
     # Refresh the profile data
     await user.profile.refresh_from_db()
@@ -0,0 +1,151 @@
+# users/token_store.py
+
+import abc
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from tortoise import timezone
+
+from .models import RefreshTokenEntry
+
+logger = logging.getLogger(__name__)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class RefreshTokenStore(abc.ABC):
+    """Issued refresh tokens, keyed by the SHA-256 of the JWT.
+
+    ``get`` returns the username a live token was issued to, or None when the
+    token is unknown, revoked or expired. A background task periodically
+    drops expired entries so the store does not grow with abandoned tokens.
+    """
+
+    def __init__(self, sweep_interval: float = 60):
+        self.sweep_interval = sweep_interval
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self) -> None:
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await self.sweep()
+                if removed:
+                    logger.info(f"Swept {removed} expired refresh tokens")
+            except Exception as e:
+                logger.error(f"Error sweeping refresh tokens: {e}", exc_info=True)
+
+    @abc.abstractmethod
+    async def add(self, token: str, username: str, expires_at: datetime) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def get(self, token: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    async def revoke(self, token: str) -> Optional[str]:
+        ...
+
+    @abc.abstractmethod
+    async def sweep(self) -> int:
+        ...
+
+
+class InMemoryRefreshTokenStore(RefreshTokenStore):
+    """Per-process store bounded to ``maxsize`` tokens.
+
+    All tokens share the same lifetime, so insertion order is expiry order:
+    the sweep only looks at the head of the dict, and when the store is full
+    the token closest to expiry is dropped first.
+    """
+
+    def __init__(self, maxsize: int = 100_000, sweep_interval: float = 60):
+        super().__init__(sweep_interval)
+        self.maxsize = maxsize
+        self._tokens: "OrderedDict[str, tuple[str, datetime]]" = OrderedDict()
+
+    async def add(self, token: str, username: str, expires_at: datetime) -> None:
+        self._tokens[hash_token(token)] = (username, expires_at)
+        while len(self._tokens) > self.maxsize:
+            self._tokens.popitem(last=False)
+
+    async def get(self, token: str) -> Optional[str]:
+        entry = self._tokens.get(hash_token(token))
+        if entry is None:
+            return None
+        username, expires_at = entry
+        if expires_at <= datetime.utcnow():
+            return None
+        return username
+
+    async def revoke(self, token: str) -> Optional[str]:
+        entry = self._tokens.pop(hash_token(token), None)
+        return entry[0] if entry else None
+
+    async def sweep(self) -> int:
+        now = datetime.utcnow()
+        removed = 0
+        while self._tokens:
+            key, (_, expires_at) = next(iter(self._tokens.items()))
+            if expires_at > now:
+                break
+            del self._tokens[key]
+            removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+
+class DatabaseRefreshTokenStore(RefreshTokenStore):
+    """Store backed by the ``refresh_tokens`` table, shared by all workers."""
+
+    async def add(self, token: str, username: str, expires_at: datetime) -> None:
+        await RefreshTokenEntry.create(
+            token_hash=hash_token(token),
+            username=username,
+            expires_at=timezone.make_aware(expires_at, "UTC"),
+        )
+
+    async def get(self, token: str) -> Optional[str]:
+        return await RefreshTokenEntry.filter(
+            token_hash=hash_token(token), expires_at__gt=timezone.now()
+        ).first().values_list("username", flat=True)
+
+    async def revoke(self, token: str) -> Optional[str]:
+        token_hash = hash_token(token)
+        username = await RefreshTokenEntry.filter(token_hash=token_hash).first().values_list(
+            "username", flat=True
+        )
+        if username is None:
+            return None
+        # Of several concurrent revokes (say, a refresh racing a logout) only
+        # the one whose DELETE removed the row reports the username
+        deleted = await RefreshTokenEntry.filter(token_hash=token_hash).delete()
+        return username if deleted else None
+
+    async def sweep(self) -> int:
+        return await RefreshTokenEntry.filter(expires_at__lte=timezone.now()).delete()
+
+
+def create_refresh_token_store(backend: str, maxsize: int, sweep_interval: float) -> RefreshTokenStore:
+    if backend == "postgres":
+        return DatabaseRefreshTokenStore(sweep_interval)
+    if backend == "memory":
+        return InMemoryRefreshTokenStore(maxsize, sweep_interval)
+    raise ValueError(f"Unknown refresh token store backend: {backend}")
@@ -0,0 +1,178 @@
+# users/utils.py
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.metrics import REGISTRY, Counter, HistogramMetric
+
+from .schemas import Principal
+
+PASSWORD_HASH_QUEUE_WAIT = REGISTRY.register(HistogramMetric(
+    "password_hash_queue_wait_seconds", "Time bcrypt calls waited for a hashing thread",
+))
+PASSWORD_HASH_REJECTED = REGISTRY.register(Counter(
+    "password_hash_rejected_total", "bcrypt calls refused with a 503 because the queue was full",
+))
+
+
+class PrincipalCache:
+    """Bounded LRU cache of verified access tokens.
+
+    Maps a token (by its SHA-256 digest) to the principal it resolved to, so
+    repeat requests skip both ``jwt.decode`` and the user lookup. An entry
+    expires after ``ttl`` seconds or at the token's own ``exp``, whichever
+    comes first. Entries are also dropped through ``invalidate_user`` when the
+    user row changes; that only reaches this process, so the TTL bounds how
+    long other workers can serve a stale principal.
+
+    Invalidation hangs off User's post_save and post_delete signals, which
+    ``QuerySet.update()`` and ``QuerySet.delete()`` do not send. Code that
+    deactivates or re-roles users in bulk must call ``invalidate_user`` for
+    each of them, or accept up to ``ttl`` seconds of stale principals.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[Principal, float]]" = OrderedDict()
+        self._keys_by_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.time():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return principal
+
+    def set(self, token: str, principal: Principal, exp: float) -> None:
+        key = self._key(token)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (principal, min(time.time() + self.ttl, exp))
+        self._keys_by_user.setdefault(principal.id, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        for key in self._keys_by_user.pop(user_id, set()):
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def _remove(self, key: str) -> None:
+        principal, _ = self._entries.pop(key)
+        keys = self._keys_by_user.get(principal.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[principal.id]
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a dedicated thread pool.
+
+    bcrypt releases the GIL, so a small pool keeps 100ms+ hashes off the event
+    loop. At most ``max_workers`` hashes run at once and at most
+    ``max_pending`` more may wait for a slot; beyond that callers get a 503
+    instead of piling up behind a login storm.
+    """
+
+    def __init__(self, context: CryptContext, max_workers: int, max_pending: int):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+        self.run_time_total = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self.context.verify, password, hashed)
+
+    async def _run(self, func, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if self._slots.locked() and self._waiting >= self.max_pending:
+            self.rejected += 1
+            PASSWORD_HASH_REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            started_at = time.perf_counter()
+            queue_time = started_at - queued_at
+            self.queue_time_total += queue_time
+            self.queue_time_max = max(self.queue_time_max, queue_time)
+            PASSWORD_HASH_QUEUE_WAIT.observe(queue_time)
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            self.run_time_total += time.perf_counter() - started_at
+            self.completed += 1
+            return result
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "waiting": self._waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_time_avg": self.queue_time_total / self.completed if self.completed else 0.0,
+            "queue_time_max": self.queue_time_max,
+            "run_time_avg": self.run_time_total / self.completed if self.completed else 0.0,
+        }
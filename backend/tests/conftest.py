@@ -0,0 +1,192 @@
+import asyncio
+import importlib
+import json
+import os
+import uuid
+from contextlib import contextmanager
+
+import pytest
+import pytest_asyncio
+from fastapi import WebSocketDisconnect
+from httpx import AsyncClient, ASGITransport
+from tortoise import Tortoise
+from tortoise.backends.base import executor
+from tortoise.backends.base.config_generator import expand_db_url
+
+from src.cache import CACHES
+from src.chat import ws_router
+from src.chat.broker import InProcessBroker
+from src.database import TORTOISE_ORM
+from src.query_counter import track_queries
+
+PASSWORD = "Passw0rd!"
+# Postgres-only tests are skipped unless this points at a server
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+@pytest_asyncio.fixture
+async def db():
+    await Tortoise.init(
+        db_url="sqlite://:memory:",
+        modules={"models": TORTOISE_ORM["apps"]["models"]["models"]},
+    )
+    await Tortoise.generate_schemas()
+    # Every test starts from an empty database, so nothing cached may survive
+    for cache in CACHES.values():
+        cache.clear()
+    yield
+    await Tortoise.close_connections()
+
+
+async def migrate(db, migration: str):
+    module = importlib.import_module(f"migrations.models.{migration}")
+    await db.execute_script(await module.upgrade(db))
+
+
+@pytest_asyncio.fixture
+async def postgres(monkeypatch):
+    """The app's tables, search columns included, in a throwaway Postgres schema."""
+    schema = f"test_{uuid.uuid4().hex[:8]}"
+    credentials = expand_db_url(TEST_POSTGRES_URL)["credentials"]
+    await Tortoise.init(db_url=TEST_POSTGRES_URL, modules={"models": []})
+    await Tortoise.get_connection("default").execute_script(f'CREATE SCHEMA "{schema}"')
+    await Tortoise.close_connections()
+    # Tortoise caches SQL per connection name, and other tests have built
+    # SQLite statements for "default"
+    monkeypatch.setattr(executor, "EXECUTOR_CACHE", {})
+    await Tortoise.init(config={
+        "connections": {"default": {
+            "engine": "tortoise.backends.asyncpg",
+            "credentials": {**credentials, "schema": schema},
+        }},
+        "apps": {"models": {"models": TORTOISE_ORM["apps"]["models"]["models"], "default_connection": "default"}},
+    })
+    db = Tortoise.get_connection("default")
+    try:
+        await Tortoise.generate_schemas()
+        # generate_schemas knows nothing of the generated tsvector columns
+        await migrate(db, "8_20261018180000_full_text_search")
+        yield db
+    finally:
+        await db.execute_script(f'DROP SCHEMA "{schema}" CASCADE')
+        await Tortoise.close_connections()
+
+
+@pytest_asyncio.fixture
+async def api(db):
+    from src.main import app
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+def auth_headers(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def register(api):
+    """``await register("alice")`` signs a user up and returns their access token."""
+
+    async def register(username: str) -> str:
+        response = await api.post("/api/users/register", json={
+            "username": username, "email": f"{username}@example.com", "password": PASSWORD,
+        })
+        assert response.status_code == 200, response.text
+        response = await api.post("/api/users/token", data={"username": username, "password": PASSWORD})
+        return response.json()["access_token"]
+
+    return register
+
+
+class FakeWebSocket:
+    """Stands in for a Starlette WebSocket.
+
+    The client side "sends" ``frames`` (dicts as JSON text, str and bytes
+    as given) and then whatever ``send_from_client`` adds, until
+    ``hang_up``. Frames sent to the socket are kept undecoded in ``sent``;
+    each send takes ``delay`` seconds.
+    """
+
+    def __init__(self, frames=(), subprotocols=(), delay: float = 0):
+        self.scope = {"subprotocols": list(subprotocols)}
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        for frame in frames:
+            self.send_from_client(frame)
+        self.delay = delay
+        self.subprotocol = None
+        self.sent = []
+        self.close_code = None
+
+    def send_from_client(self, frame):
+        self.incoming.put_nowait(json.dumps(frame) if isinstance(frame, dict) else frame)
+
+    def hang_up(self):
+        self.incoming.put_nowait(None)
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def receive(self) -> dict:
+        frame = await self.incoming.get()
+        if frame is None:
+            return {"type": "websocket.disconnect", "code": 1000}
+        if isinstance(frame, str):
+            return {"type": "websocket.receive", "text": frame}
+        return {"type": "websocket.receive", "bytes": frame}
+
+    async def receive_text(self) -> str:
+        message = await self.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect()
+        return message["text"]
+
+    async def send_text(self, message: str):
+        await self._send(message)
+
+    async def send_bytes(self, message: bytes):
+        await self._send(message)
+
+    async def _send(self, message):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+    def received(self) -> list:
+        """The JSON frames sent to this socket, decoded."""
+        return [json.loads(message) for message in self.sent]
+
+    def message_ids(self) -> list:
+        return [int(frame["id"]) for frame in self.received() if frame["type"] == "message"]
+
+
+@pytest_asyncio.fixture
+async def manager(monkeypatch):
+    """A fresh ConnectionManager in place of the app's."""
+    manager = ws_router.ConnectionManager(broker=InProcessBroker())
+    monkeypatch.setattr(ws_router, "manager", manager)
+    await manager.start()
+    yield manager
+    await manager.stop()
+
+
+@pytest.fixture
+def query_budget():
+    """Fail the test when the block issues more than ``max_queries`` statements.
+
+    Budgets should not depend on how many rows a route returns; exceeding one
+    usually means a per-row lookup (N+1) crept in.
+    """
+
+    @contextmanager
+    def budget(max_queries: int):
+        with track_queries() as stats:
+            yield stats
+        assert stats.count <= max_queries, (
+            f"{stats.count} queries exceed the budget of {max_queries}:\n"
+            + "\n".join(stats.statements)
+        )
+
+    return budget
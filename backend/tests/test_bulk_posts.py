@@ -0,0 +1,74 @@
+import orjson
+import pytest
+
+from conftest import auth_headers
+from src.posts import router as posts_router
+from src.posts import service as posts_service
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_reports_item_errors(api, query_budget, monkeypatch, register):
+    monkeypatch.setattr(posts_service, "POSTS_BULK_CHUNK_SIZE", 10)
+    alice = auth_headers(await register("alice"))
+    items = [{"title": f"post {i}", "content": "body"} for i in range(25)]
+    items[3] = {"title": "no content"}
+    items[7] = {"title": "x" * 300, "content": "too long"}
+
+    # 23 valid rows in chunks of 10: three INSERTs
+    with query_budget(4):
+        response = await api.post("/api/posts/bulk", json=items, headers=alice)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["created"] == 23
+    assert [error["index"] for error in result["errors"]] == [3, 7]
+    assert result["errors"][0]["error"] == "content: Field required"
+
+    post = (await api.get(f"/api/posts/{result['ids'][-1]}")).json()
+    assert post["title"] == "post 24"
+    assert post["username"] == "alice"
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_accepts_ndjson(api, register):
+    alice = auth_headers(await register("alice"))
+    body = b"\n".join(orjson.dumps({"content": f"line {i}"}) for i in range(5)) + b"\n"
+    response = await api.post(
+        "/api/posts/bulk", content=body, headers={**alice, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["created"] == 5
+
+    response = await api.post(
+        "/api/posts/bulk", content=b'{"content": "ok"}\n{broken', headers={**alice, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 400
+    assert "item 1" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_rejects_oversized_requests(api, monkeypatch, register):
+    monkeypatch.setattr(posts_router, "POSTS_BULK_MAX_ITEMS", 3)
+    alice = auth_headers(await register("alice"))
+    response = await api.post("/api/posts/bulk", json=[{"content": "x"}] * 4, headers=alice)
+    assert response.status_code == 413
+    response = await api.post("/api/posts/bulk", json={"content": "x"}, headers=alice)
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_only_touches_own_posts(api, register):
+    alice = auth_headers(await register("alice"))
+    bob = auth_headers(await register("bob"))
+    alice_ids = (await api.post("/api/posts/bulk", json=[{"content": "a"}] * 3, headers=alice)).json()["ids"]
+    bob_ids = (await api.post("/api/posts/bulk", json=[{"content": "b"}] * 2, headers=bob)).json()["ids"]
+    await api.get(f"/api/posts/{alice_ids[0]}")
+
+    response = await api.post(
+        "/api/posts/bulk/delete", json={"ids": alice_ids[:2] + bob_ids + [999]}, headers=alice,
+    )
+    assert response.json() == {"deleted": 2, "not_found": bob_ids + [999]}
+    # The cached copy is gone too
+    assert (await api.get(f"/api/posts/{alice_ids[0]}")).status_code == 404
+    assert (await api.get(f"/api/posts/{bob_ids[0]}")).status_code == 200
+    profile = (await api.get("/api/users/profile/alice")).json()
+    assert [post["id"] for post in profile["recent_posts"]] == [alice_ids[2]]
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from conftest import TEST_POSTGRES_URL, auth_headers
+from src.cache import CACHE_REQUESTS, Cache, InMemorySharedBackend, PostgresCacheBackend
+
+
+def loader_for(calls: list, value, delay: float = 0):
+    async def load():
+        calls.append(value)
+        await asyncio.sleep(delay)
+        return value
+    return load
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_and_ttl():
+    cache = Cache("test_lru", maxsize=2, ttl=60)
+    calls = []
+    for key in ("a", "b", "a", "c", "a", "b"):
+        await cache.get_or_load(key, loader_for(calls, key))
+    # "b" was least recently used when "c" came in
+    assert calls == ["a", "b", "c", "b"]
+    assert len(cache) == 2
+
+    expired = Cache("test_ttl", maxsize=10, ttl=0)
+    await expired.get_or_load("a", loader_for(calls, "a"))
+    await expired.get_or_load("a", loader_for(calls, "a"))
+    assert calls[-2:] == ["a", "a"]
+
+
+@pytest.mark.asyncio
+async def test_none_is_not_cached():
+    cache = Cache("test_none", maxsize=10, ttl=60)
+    calls = []
+    assert await cache.get_or_load("missing", loader_for(calls, None)) is None
+    assert await cache.get_or_load("missing", loader_for(calls, None)) is None
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load():
+    cache = Cache("test_single_flight", maxsize=10, ttl=60)
+    calls = []
+    results = await asyncio.gather(*[
+        cache.get_or_load("hot", loader_for(calls, {"n": 1}, delay=0.01)) for _ in range(20)
+    ])
+    assert calls == [{"n": 1}]
+    assert all(result == {"n": 1} for result in results)
+    assert CACHE_REQUESTS.children[("test_single_flight", "miss")] == 1
+    assert CACHE_REQUESTS.children[("test_single_flight", "coalesced")] == 19
+
+
+@pytest.mark.asyncio
+async def test_invalidate_discards_load_in_flight():
+    cache = Cache("test_invalidate", maxsize=10, ttl=60)
+    calls = []
+    stale = asyncio.create_task(cache.get_or_load("key", loader_for(calls, "stale", delay=0.01)))
+    await asyncio.sleep(0)
+    await cache.invalidate("key")
+    assert await stale == "stale"
+    assert await cache.get_or_load("key", loader_for(calls, "fresh")) == "fresh"
+    assert calls == ["stale", "fresh"]
+
+
+@pytest.mark.asyncio
+async def test_shared_tier_fills_other_workers():
+    shared = InMemorySharedBackend()
+    first = Cache("test_shared", maxsize=10, ttl=60, shared=shared, local_ttl=0)
+    second = Cache("test_shared", maxsize=10, ttl=60, shared=shared, local_ttl=0)
+    calls = []
+    await first.get_or_load("key", loader_for(calls, {"v": 1}))
+    assert await second.get_or_load("key", loader_for(calls, {"v": 2})) == {"v": 1}
+    assert calls == [{"v": 1}]
+
+    await first.invalidate("key")
+    assert await second.get_or_load("key", loader_for(calls, {"v": 2})) == {"v": 2}
+
+
+async def check_stale_load_loses_to_other_workers_write(shared):
+    first = Cache("test_race", maxsize=10, ttl=60, shared=shared, local_ttl=0)
+    second = Cache("test_race", maxsize=10, ttl=60, shared=shared, local_ttl=0)
+    read_done, write_done = asyncio.Event(), asyncio.Event()
+
+    async def read_before_write():
+        # The first worker reads the database, then stalls ...
+        read_done.set()
+        await write_done.wait()
+        return {"v": "stale"}
+
+    stale = asyncio.create_task(first.get_or_load("key", read_before_write))
+    await read_done.wait()
+    # ... while the second writes and invalidates the key
+    await second.invalidate("key")
+    write_done.set()
+    assert await stale == {"v": "stale"}
+
+    # The stale read must not land in the shared tier after the invalidation
+    assert (await shared.get("key"))[0] is None
+    calls = []
+    assert await second.get_or_load("key", loader_for(calls, {"v": "fresh"})) == {"v": "fresh"}
+    assert await first.get_or_load("key", loader_for(calls, {"v": "other"})) == {"v": "fresh"}
+    assert calls == [{"v": "fresh"}]
+
+
+@pytest.mark.asyncio
+async def test_stale_load_loses_to_other_workers_write():
+    await check_stale_load_loses_to_other_workers_write(InMemorySharedBackend())
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+@pytest.mark.asyncio
+async def test_stale_load_loses_to_other_workers_write_on_postgres(postgres):
+    await check_stale_load_loses_to_other_workers_write(PostgresCacheBackend())
+
+
+@pytest.mark.asyncio
+async def test_routes_serve_cached_reads_until_a_write(api, query_budget, register):
+    alice = auth_headers(await register("alice"))
+    await api.post("/api/posts/", json={"title": "hello", "content": "world"}, headers=alice)
+    first = await api.get("/api/posts/1")
+    await api.get("/api/users/profile/alice")
+
+    with query_budget(0):
+        cached = await api.get("/api/posts/1")
+        await api.get("/api/users/profile/alice")
+    assert cached.json() == first.json()
+    assert cached.headers["etag"] == first.headers["etag"]
+
+    await api.put("/api/posts/1", json={"title": "edited"}, headers=alice)
+    assert (await api.get("/api/posts/1")).json()["title"] == "edited"
+    profile = await api.get("/api/users/profile/alice")
+    assert profile.json()["recent_posts"][0]["title"] == "edited"
+
+    await api.put("/api/users/profile/alice", json={"bio": "hi"}, headers=alice)
+    assert (await api.get("/api/users/profile/alice")).json()["bio"] == "hi"
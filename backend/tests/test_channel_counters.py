@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from conftest import auth_headers
+from src.chat.models import Channel
+from src.chat.persistence import MessageWriter
+from src.chat.service import recount_channels, record_messages
+
+
+async def channel_summary(api, auth: dict) -> dict:
+    (channel,) = (await api.get("/api/chat/channels", headers=auth)).json()
+    return channel
+
+
+@pytest.mark.asyncio
+async def test_counters_follow_messages_and_membership(api, register):
+    owner = auth_headers(await register("owner"))
+    member = auth_headers(await register("member"))
+    response = await api.post("/api/chat/channels", json={"name": "general"}, headers=owner)
+    assert response.json()["member_count"] == 1
+    channel_id = response.json()["id"]
+
+    await api.post(f"/api/chat/channels/{channel_id}/join", headers=member)
+    await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": "first"}, headers=owner)
+    long_message = "x" * 500
+    await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": long_message}, headers=member)
+
+    channel = await channel_summary(api, owner)
+    assert channel["member_count"] == 2
+    assert channel["message_count"] == 2
+    assert channel["last_message"]["user"] == "member"
+    assert channel["last_message"]["content"] == long_message[:200]
+
+    await api.delete(f"/api/chat/channels/{channel_id}/leave", headers=member)
+    detail = (await api.get(f"/api/chat/channels/{channel_id}", headers=owner)).json()
+    assert (detail["member_count"], detail["message_count"]) == (1, 2)
+    assert detail["last_message"] == channel["last_message"]
+
+    search = (await api.get("/api/chat/channels/search", params={"query": "gen"}, headers=owner)).json()
+    assert search[0]["last_message"] == channel["last_message"]
+
+
+@pytest.mark.asyncio
+async def test_last_message_never_moves_backwards(api, register):
+    owner = auth_headers(await register("owner"))
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=owner)).json()["id"]
+    await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": "newest"}, headers=owner)
+    channel = await Channel.get(id=channel_id)
+
+    # A writer that inserted an older message but commits late
+    await record_messages(channel_id, 1, channel.last_message_id - 1, channel.last_message_at, "older", "owner")
+    channel = await channel_summary(api, owner)
+    assert channel["message_count"] == 2
+    assert channel["last_message"]["content"] == "newest"
+
+
+@pytest.mark.asyncio
+async def test_write_behind_batches_update_counters(api, register):
+    owner = auth_headers(await register("owner"))
+    first = (await api.post("/api/chat/channels", json={"name": "first"}, headers=owner)).json()["id"]
+    second = (await api.post("/api/chat/channels", json={"name": "second"}, headers=owner)).json()["id"]
+    channel = await Channel.get(id=first)
+
+    writer = MessageWriter(batch_size=100, flush_interval=0.01)
+    await writer.start()
+    await asyncio.gather(*[
+        writer.submit(first if i % 3 else second, channel.created_by_id, f"m{i}", "owner") for i in range(9)
+    ])
+    await writer.stop()
+
+    counts = {
+        row["id"]: (row["message_count"], row["last_message_preview"])
+        for row in await Channel.all().values("id", "message_count", "last_message_preview")
+    }
+    assert counts == {first: (6, "m8"), second: (3, "m6")}
+
+
+@pytest.mark.asyncio
+async def test_recount_repairs_drift(api, register):
+    owner = auth_headers(await register("owner"))
+    member = auth_headers(await register("member"))
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=owner)).json()["id"]
+    await api.post(f"/api/chat/channels/{channel_id}/join", headers=member)
+    await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": "hello"}, headers=member)
+    expected = await channel_summary(api, owner)
+
+    await Channel.filter(id=channel_id).update(
+        member_count=0, message_count=7, last_message_id=None, last_message_preview=None,
+    )
+    assert await recount_channels(batch_size=1) == 1
+    assert await channel_summary(api, owner) == expected
@@ -0,0 +1,193 @@
+import asyncio
+import multiprocessing
+
+import pytest
+from tortoise import Tortoise
+
+from conftest import TEST_POSTGRES_URL, FakeWebSocket, auth_headers
+from src.chat.broker import InProcessBroker, PostgresBroker
+from src.chat.ws_router import ConnectionManager
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_other_workers():
+    hub = {}
+    worker_a = ConnectionManager(broker=InProcessBroker(hub))
+    worker_b = ConnectionManager(broker=InProcessBroker(hub))
+    await worker_a.start()
+    await worker_b.start()
+
+    ws_a, ws_b, ws_other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await worker_a.connect(ws_a, 1, None)
+    await worker_b.connect(ws_b, 1, None)
+    await worker_b.connect(ws_other, 2, None)
+
+    await worker_a.broadcast("hello", 1)
+    await asyncio.sleep(0.01)
+
+    assert ws_a.sent == ["hello"]
+    assert ws_b.sent == ["hello"]
+    assert ws_other.sent == []
+    await worker_a.stop()
+    await worker_b.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_unsubscribes_when_last_socket_leaves():
+    hub = {}
+    worker_a = ConnectionManager(broker=InProcessBroker(hub))
+    worker_b = ConnectionManager(broker=InProcessBroker(hub))
+    await worker_a.start()
+    await worker_b.start()
+
+    ws_b = FakeWebSocket()
+    await worker_b.connect(ws_b, 1, None)
+    assert worker_b.broker in hub[1]
+
+    await worker_b.disconnect(ws_b, 1)
+    assert 1 not in hub
+
+    await worker_a.broadcast("hello", 1)
+    await asyncio.sleep(0.01)
+    assert ws_b.sent == []
+    await worker_a.stop()
+
+
+@pytest.mark.asyncio
+async def test_oversized_frame_is_loaded_by_receiving_worker(api, register):
+    alice = await register("alice")
+    auth = auth_headers(alice)
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=auth)).json()["id"]
+    message_id = (await api.post(
+        f"/api/chat/channels/{channel_id}/messages", json={"content": "x" * 10000}, headers=auth,
+    )).json()["id"]
+
+    worker = ConnectionManager(broker=InProcessBroker())
+    await worker.start()
+    ws = FakeWebSocket()
+    await worker.connect(ws, channel_id, None)
+    # What a PostgresBroker hands over for a frame too large to NOTIFY
+    await worker._deliver_remote(channel_id, None, message_id)
+    await asyncio.sleep(0.01)
+
+    frame, = ws.received()
+    assert frame["id"] == str(message_id)
+    assert frame["content"] == "x" * 10000
+    assert frame["user"] == "alice"
+    assert worker.recent[channel_id].frames[-1][0] == message_id
+    await worker.stop()
+
+
+def _postgres_worker(ready, received, count):
+    async def run():
+        await Tortoise.init(db_url=TEST_POSTGRES_URL, modules={"models": []})
+        manager = ConnectionManager(broker=PostgresBroker())
+        await manager.start()
+        ws = FakeWebSocket()
+        await manager.connect(ws, 1, None)
+        ready.set()
+        while len(ws.sent) < count:
+            await asyncio.sleep(0.01)
+        received.put(ws.sent)
+        await manager.stop()
+        await Tortoise.close_connections()
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+@pytest.mark.asyncio
+async def test_postgres_broker_fans_out_across_processes():
+    ctx = multiprocessing.get_context("spawn")
+    received = ctx.Queue()
+    workers = []
+    for _ in range(3):
+        ready = ctx.Event()
+        process = ctx.Process(target=_postgres_worker, args=(ready, received, 5))
+        process.start()
+        workers.append((process, ready))
+    for _, ready in workers:
+        assert ready.wait(timeout=30)
+
+    await Tortoise.init(db_url=TEST_POSTGRES_URL, modules={"models": []})
+    try:
+        publisher = ConnectionManager(broker=PostgresBroker())
+        await publisher.start()
+        for i in range(5):
+            await publisher.broadcast(f"message {i}", 1)
+
+        results = [received.get(timeout=30) for _ in workers]
+        await publisher.stop()
+    finally:
+        await Tortoise.close_connections()
+
+    for process, _ in workers:
+        process.join(timeout=10)
+    expected = [f"message {i}" for i in range(5)]
+    assert results == [expected] * len(workers)
+
+
+class _Received:
+    def __init__(self):
+        self.frames = []
+        self.gaps = 0
+
+    async def handler(self, channel_id, message, message_id):
+        self.frames.append((channel_id, message, message_id))
+
+    def on_gap(self):
+        self.gaps += 1
+
+
+async def _wait_for(condition, timeout: float = 10):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.05)
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+@pytest.mark.asyncio
+async def test_postgres_broker_sends_oversized_frames_by_id():
+    await Tortoise.init(db_url=TEST_POSTGRES_URL, modules={"models": []})
+    publisher, listener, received = PostgresBroker(), PostgresBroker(), _Received()
+    try:
+        await publisher.start(_Received().handler)
+        await listener.start(received.handler)
+        await listener.subscribe(1)
+        await publisher.publish(1, "small", 1)
+        await publisher.publish(1, "x" * PostgresBroker.MAX_PAYLOAD_SIZE, 2)
+        await _wait_for(lambda: len(received.frames) == 2)
+        assert received.frames == [(1, "small", None), (1, None, 2)]
+    finally:
+        await publisher.stop()
+        await listener.stop()
+        await Tortoise.close_connections()
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+@pytest.mark.asyncio
+async def test_postgres_broker_relistens_after_losing_its_connection(monkeypatch):
+    monkeypatch.setattr(PostgresBroker, "RECONNECT_DELAY", 0.05)
+    await Tortoise.init(db_url=TEST_POSTGRES_URL, modules={"models": []})
+    publisher, listener, received = PostgresBroker(), PostgresBroker(), _Received()
+    try:
+        await publisher.start(_Received().handler)
+        await listener.start(received.handler, received.on_gap)
+        await listener.subscribe(1)
+        await listener.subscribe(2)
+
+        client = Tortoise.get_connection("default")
+        dropped = listener._listen_conn
+        await client.execute_query("SELECT pg_terminate_backend($1)", [dropped.get_server_pid()])
+        await _wait_for(lambda: listener._listen_conn not in (None, dropped))
+        assert received.gaps == 1
+
+        await publisher.publish(1, "one")
+        await publisher.publish(2, "two")
+        await _wait_for(lambda: len(received.frames) == 2)
+        assert received.frames == [(1, "one", None), (2, "two", None)]
+    finally:
+        await publisher.stop()
+        await listener.stop()
+        await Tortoise.close_connections()
@@ -0,0 +1,76 @@
+import pytest
+
+from conftest import auth_headers
+
+
+async def walk(api, url: str, key: str, cursor_param: str, params: dict, headers: dict) -> list:
+    """Follow next_cursor from the first page to the last; one list per page."""
+    pages, cursor = [], None
+    while True:
+        page_params = {**params, **({cursor_param: cursor} if cursor is not None else {})}
+        response = await api.get(url, params=page_params, headers=headers)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        pages.append(body[key])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.asyncio
+async def test_message_history_pages_both_ways(api, register):
+    alice = auth_headers(await register("alice"))
+    bob = auth_headers(await register("bob"))
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=alice)).json()["id"]
+    ids = [
+        (await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": f"m{i}"}, headers=alice)).json()["id"]
+        for i in range(7)
+    ]
+    url = f"/api/chat/channels/{channel_id}/messages"
+
+    # Backwards from the newest message, each page in ascending order
+    pages = await walk(api, url, "messages", "before", {"limit": 3}, alice)
+    assert [[message["id"] for message in page] for page in pages] == [ids[4:], ids[1:4], ids[:1]]
+    assert (pages[0][-1]["content"], pages[0][-1]["user"]) == ("m6", "alice")
+
+    # Forwards from a message already seen
+    pages = await walk(api, url, "messages", "after", {"limit": 3, "after": ids[0]}, alice)
+    assert [[message["id"] for message in page] for page in pages] == [ids[1:4], ids[4:]]
+
+    response = await api.get(url, params={"before": ids[3], "limit": 2}, headers=alice)
+    assert [message["id"] for message in response.json()["messages"]] == ids[1:3]
+    assert response.json()["next_cursor"] == ids[1]
+
+    response = await api.get(url, params={"before": ids[3], "after": ids[0]}, headers=alice)
+    assert response.status_code == 400
+    response = await api.get(url, headers=bob)
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_members_page_in_join_order(api, register):
+    alice = auth_headers(await register("alice"))
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=alice)).json()["id"]
+    private_id = (await api.post(
+        "/api/chat/channels", json={"name": "secret", "is_public": False}, headers=alice,
+    )).json()["id"]
+    names = ["alice"]
+    for name in ("bob", "carol", "dave", "erin", "frank"):
+        token = await register(name)
+        response = await api.post(f"/api/chat/channels/{channel_id}/join", headers=auth_headers(token))
+        assert response.status_code == 200, response.text
+        names.append(name)
+    url = f"/api/chat/channels/{channel_id}/members"
+
+    pages = await walk(api, url, "members", "after", {"limit": 2}, alice)
+    assert [[member["user"] for member in page] for page in pages] == [names[:2], names[2:4], names[4:]]
+    assert pages[0][0] == {"user": "alice", "role": "admin"}
+
+    response = await api.get(url, params={"limit": 4}, headers=alice)
+    assert len(response.json()["members"]) == 4
+    response = await api.get(url, params={"limit": 0}, headers=alice)
+    assert response.status_code == 422
+
+    # Anyone may list a public channel's members, only members a private one's
+    response = await api.get(f"/api/chat/channels/{private_id}/members", headers=auth_headers(await register("grace")))
+    assert response.status_code == 403
@@ -0,0 +1,79 @@
+import pytest
+
+from conftest import auth_headers
+
+
+async def assert_revalidates(api, url: str, **kwargs) -> str:
+    """Fetch ``url``, then check both validators yield a bodiless 304; return the ETag."""
+    response = await api.get(url, **kwargs)
+    assert response.status_code == 200, response.text
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    headers = kwargs.pop("headers", {})
+    for validator in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+        cached = await api.get(url, headers={**headers, **validator}, **kwargs)
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+    return etag
+
+
+@pytest.mark.asyncio
+async def test_post_etag_changes_on_update(api, register):
+    alice = auth_headers(await register("alice"))
+    await api.post("/api/posts/", json={"title": "hello", "content": "world"}, headers=alice)
+
+    etag = await assert_revalidates(api, "/api/posts/1")
+    await api.put("/api/posts/1", json={"title": "edited"}, headers=alice)
+    response = await api.get("/api/posts/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "edited"
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_profile_etag_follows_bio_and_posts(api, register):
+    alice = auth_headers(await register("alice"))
+
+    etag = await assert_revalidates(api, "/api/users/profile/alice")
+    await api.put("/api/users/profile/alice", json={"bio": "hi"}, headers=alice)
+    response = await api.get("/api/users/profile/alice", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["bio"] == "hi"
+
+    etag = response.headers["etag"]
+    await api.post("/api/posts/", json={"title": "hello", "content": "world"}, headers=alice)
+    response = await api.get("/api/users/profile/alice", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()["recent_posts"]) == 1
+
+    etag = response.headers["etag"]
+    await api.delete("/api/posts/1", headers=alice)
+    response = await api.get("/api/users/profile/alice", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["recent_posts"] == []
+
+
+@pytest.mark.asyncio
+async def test_channel_etag_follows_messages_and_members(api, register):
+    owner = auth_headers(await register("owner"))
+    member = auth_headers(await register("member"))
+    response = await api.post("/api/chat/channels", json={"name": "general", "is_public": True}, headers=owner)
+    url = f"/api/chat/channels/{response.json()['id']}"
+
+    etag = await assert_revalidates(api, url, headers=owner)
+    await api.post(f"{url}/join", headers=member)
+    response = await api.get(url, headers={**owner, "If-None-Match": etag})
+    assert response.status_code == 200
+
+    etag = response.headers["etag"]
+    await api.post(f"{url}/messages", json={"content": "hi"}, headers=member)
+    response = await api.get(url, headers={**owner, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["message_count"] == 1
+
+    # Members and outsiders see different payloads, so they never share a tag
+    outsider = auth_headers(await register("outsider"))
+    response = await api.get(url, headers={**outsider, "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 200
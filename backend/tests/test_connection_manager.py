@@ -0,0 +1,156 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeWebSocket, auth_headers
+from src.chat import ws_router
+from src.chat.broker import InProcessBroker
+from src.chat.ws_router import ConnectionManager
+
+
+@pytest.mark.asyncio
+async def test_stalled_client_does_not_block_others(monkeypatch):
+    monkeypatch.setattr(ws_router, "CHAT_SEND_TIMEOUT", 0.05)
+    manager = ConnectionManager(broker=InProcessBroker())
+    fast, stalled = FakeWebSocket(), FakeWebSocket(delay=10)
+    await manager.connect(fast, 1, None)
+    await manager.connect(stalled, 1, None)
+
+    for i in range(3):
+        await manager.broadcast(f"m{i}", 1)
+    await asyncio.sleep(0.01)
+    assert fast.sent == ["m0", "m1", "m2"]
+
+    # The stalled client is dropped once its send times out
+    await asyncio.sleep(0.1)
+    assert stalled.close_code == 1008
+    assert [conn.websocket for conn in manager.active_connections[1]] == [fast]
+    assert manager.get_stats()[1]["evictions"] == 1
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_client_evicted_when_queue_overflows(monkeypatch):
+    monkeypatch.setattr(ws_router, "CHAT_SEND_QUEUE_SIZE", 2)
+    manager = ConnectionManager(broker=InProcessBroker())
+    slow = FakeWebSocket(delay=10)
+    await manager.connect(slow, 1, None)
+
+    for i in range(4):
+        await manager.broadcast(f"m{i}", 1)
+
+    assert slow.close_code == 1008
+    assert 1 not in manager.active_connections
+
+
+@pytest.mark.asyncio
+async def test_stats_report_latency_and_queue_depth():
+    manager = ConnectionManager(broker=InProcessBroker())
+    await manager.connect(FakeWebSocket(), 1, None)
+    await manager.broadcast("hello", 1)
+
+    stats = manager.get_stats()[1]
+    assert stats["queue_depth_total"] == 1
+    await asyncio.sleep(0.01)
+
+    stats = manager.get_stats()[1]
+    assert stats["connections"] == 1
+    assert stats["broadcasts"] == 1
+    assert stats["deliveries"] == 1
+    assert stats["queue_depth_total"] == 0
+    assert stats["latency_max"] > 0
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_stats_only_cover_the_callers_channels(api, manager, register):
+    alice = auth_headers(await register("alice"))
+    bob = auth_headers(await register("bob"))
+    public_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=alice)).json()["id"]
+    private_id = (await api.post(
+        "/api/chat/channels", json={"name": "secret", "is_public": False}, headers=bob,
+    )).json()["id"]
+    for channel_id in (public_id, private_id):
+        await manager.connect(FakeWebSocket(), channel_id, None)
+
+    response = await api.get("/api/chat/ws/stats", headers=alice)
+    assert list(response.json()["channels"]) == [str(public_id)]
+    response = await api.get("/api/chat/ws/stats", headers=bob)
+    assert list(response.json()["channels"]) == [str(private_id)]
+
+    await api.post(f"/api/chat/channels/{public_id}/join", headers=bob)
+    response = await api.get("/api/chat/ws/stats", headers=bob)
+    assert sorted(response.json()["channels"]) == sorted([str(public_id), str(private_id)])
+
+
+@pytest.mark.asyncio
+async def test_reaper_pings_quiet_clients_and_closes_dead_ones(monkeypatch):
+    monkeypatch.setattr(ws_router, "CHAT_WS_PING_INTERVAL", 10)
+    monkeypatch.setattr(ws_router, "CHAT_WS_PING_TIMEOUT", 5)
+    manager = ConnectionManager(broker=InProcessBroker())
+    alive, dead = FakeWebSocket(), FakeWebSocket()
+    alive_conn = await manager.connect(alive, 1, None)
+    dead_conn = await manager.connect(dead, 1, None)
+
+    # Both went quiet 11s ago: both are pinged, once
+    for conn in (alive_conn, dead_conn):
+        conn.last_seen -= 11
+    await manager.reap()
+    await manager.reap()
+    await asyncio.sleep(0.01)
+    assert [json.loads(frame) for frame in alive.sent] == [{"type": "ping"}]
+    assert dead.sent == alive.sent
+
+    # Only one answers; 6s after its ping the other is closed
+    alive_conn.last_seen = alive_conn.pinged_at + 1
+    dead_conn.pinged_at -= 6
+    await manager.reap()
+    assert dead.close_code == 1008
+    assert alive.close_code is None
+    assert [conn.websocket for conn in manager.active_connections[1]] == [alive]
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_reaper_closes_connections_without_channels(monkeypatch):
+    monkeypatch.setattr(ws_router, "CHAT_WS_IDLE_TIMEOUT", 60)
+    manager = ConnectionManager(broker=InProcessBroker())
+    idle = FakeWebSocket()
+    conn = await manager.open(idle, None)
+    await manager.subscribe(conn, [1])
+    await manager.unsubscribe(conn, [1])
+
+    await manager.reap()
+    assert idle.close_code is None
+    conn.idle_since -= 61
+    await manager.reap()
+    assert idle.close_code == 1000
+    assert manager.connections == set()
+
+
+@pytest.mark.asyncio
+async def test_connection_caps(monkeypatch):
+    monkeypatch.setattr(ws_router, "CHAT_WS_MAX_CONNECTIONS_PER_USER", 2)
+    monkeypatch.setattr(ws_router, "CHAT_WS_MAX_CONNECTIONS", 3)
+    manager = ConnectionManager(broker=InProcessBroker())
+    alice, bob, carol = (SimpleNamespace(id=i) for i in (1, 2, 3))
+
+    first = await manager.connect(FakeWebSocket(), 1, alice)
+    assert await manager.connect(FakeWebSocket(), 1, alice) is not None
+    refused = FakeWebSocket()
+    assert await manager.connect(refused, 1, alice) is None
+    assert refused.close_code == 1008
+
+    assert await manager.connect(FakeWebSocket(), 1, bob) is not None
+    full = FakeWebSocket()
+    assert await manager.connect(full, 1, carol) is None
+    assert full.close_code == 1013
+
+    # Closing a socket frees its slot under both caps
+    await manager.close(first)
+    assert manager.user_connections == {1: 1, 2: 1}
+    assert await manager.connect(FakeWebSocket(), 1, alice) is not None
+    assert len(manager.active_connections[1]) == 3
+    await manager.stop()
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from tortoise import Tortoise, connections
+from tortoise.backends.base.config_generator import expand_db_url
+
+from conftest import TEST_POSTGRES_URL
+from src.db_pool import InstrumentedPool, PoolTimeoutError
+from src.metrics import Histogram
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"0.1": 2, "1.0": 3, "+Inf": 4}
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == pytest.approx(2.65)
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+@pytest.mark.asyncio
+async def test_exhausted_pool_times_out_and_is_reported():
+    credentials = expand_db_url(TEST_POSTGRES_URL)["credentials"]
+    await Tortoise.init(config={
+        "connections": {"default": {
+            "engine": "src.db_pool",
+            "credentials": {**credentials, "minsize": 1, "maxsize": 1, "acquire_timeout": 0.2},
+        }},
+        "apps": {"models": {"models": [], "default_connection": "default"}},
+    })
+    try:
+        db = connections.get("default")
+        holder = asyncio.create_task(db.execute_query("SELECT pg_sleep(0.5)"))
+        await asyncio.sleep(0.1)
+
+        pool = db._pool
+        assert isinstance(pool, InstrumentedPool)
+        assert pool.stats()["in_use"] == 1
+        with pytest.raises(PoolTimeoutError):
+            await db.execute_query("SELECT 1")
+
+        await holder
+        stats = pool.stats()
+        assert stats["in_use"] == 0
+        assert stats["waiters"] == 0
+        assert stats["acquire_timeouts"] == 1
+        assert stats["acquire_wait_seconds"]["count"] == 2
+    finally:
+        await Tortoise.close_connections()
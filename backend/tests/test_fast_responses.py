@@ -0,0 +1,49 @@
+import pytest
+from pydantic import TypeAdapter
+
+from conftest import auth_headers
+from src.chat.schemas import ChannelDetailResponse, ChannelMemberResponse, ChannelResponse
+from src.posts.schemas import PostWithUser
+from src.responses import model_rows
+
+
+def test_model_rows_projects_onto_schema_fields():
+    rows = [{"id": 1, "content": "hi", "user": "alice", "created_at": None, "rank": 0.5}]
+    assert model_rows(ChannelMemberResponse, [{"id": 3, "user": "alice", "role": "admin"}]) == [
+        {"user": "alice", "role": "admin"}
+    ]
+    with pytest.raises(KeyError):
+        model_rows(PostWithUser, rows)
+
+
+def assert_matches_schema(adapter: TypeAdapter, body):
+    # Whatever the fast path writes must survive a round trip through the
+    # response model unchanged
+    assert adapter.dump_python(adapter.validate_python(body), mode="json") == body
+
+
+@pytest.mark.asyncio
+async def test_fast_list_routes_match_response_models(api, register):
+    auth = auth_headers(await register("alice"))
+    for i in range(3):
+        await api.post("/api/posts/", json={"title": f"post {i}", "content": "hello"}, headers=auth)
+    response = await api.post("/api/chat/channels", json={"name": "general"}, headers=auth)
+    channel_id = response.json()["id"]
+    await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": "hi"}, headers=auth)
+
+    response = await api.get("/api/posts/", params={"limit": 2})
+    assert len(response.json()) == 2
+    assert response.headers["X-Next-Cursor"]
+    assert_matches_schema(TypeAdapter(list[PostWithUser]), response.json())
+
+    response = await api.get("/api/chat/channels", headers=auth)
+    assert [channel["name"] for channel in response.json()] == ["general"]
+    assert_matches_schema(TypeAdapter(list[ChannelResponse]), response.json())
+
+    response = await api.get("/api/chat/channels/search", params={"query": "gen"}, headers=auth)
+    assert [channel["name"] for channel in response.json()] == ["general"]
+    assert_matches_schema(TypeAdapter(list[ChannelResponse]), response.json())
+
+    response = await api.get(f"/api/chat/channels/{channel_id}", headers=auth)
+    assert [message["content"] for message in response.json()["messages"]] == ["hi"]
+    assert_matches_schema(TypeAdapter(ChannelDetailResponse), response.json())
@@ -0,0 +1,48 @@
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import auth_headers
+from src.posts.models import Post
+
+
+@pytest.mark.asyncio
+async def test_feed_walk_visits_every_post_once(api, register):
+    auth = auth_headers(await register("alice"))
+    ids = [
+        (await api.post("/api/posts/", json={"title": f"post {i}", "content": "hello"}, headers=auth)).json()["id"]
+        for i in range(7)
+    ]
+    # Most posts share one timestamp, so pages have to break ties by id,
+    # including across a page boundary
+    tied = datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+    await Post.filter(id__in=ids[1:6]).update(created_at=tied)
+    await Post.filter(id=ids[0]).update(created_at=tied - timedelta(minutes=1))
+    await Post.filter(id=ids[6]).update(created_at=tied + timedelta(minutes=1))
+
+    pages, after = [], None
+    while True:
+        response = await api.get("/api/posts/", params={"limit": 2, **({"after": after} if after else {})})
+        assert response.status_code == 200, response.text
+        pages.append([post["id"] for post in response.json()])
+        after = response.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+
+    expected = [ids[6], *reversed(ids[1:6]), ids[0]]
+    assert pages == [expected[0:2], expected[2:4], expected[4:6], expected[6:]]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b"no separator").decode(),
+    base64.urlsafe_b64encode(b"yesterday|1").decode(),
+    base64.urlsafe_b64encode(b"2026-10-18T12:00:00+00:00|one").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+async def test_feed_rejects_malformed_cursor(api, cursor):
+    response = await api.get("/api/posts/", params={"after": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from tortoise import Tortoise
+from tortoise.exceptions import IntegrityError
+
+from src.chat.models import Channel, Message
+from src.chat.persistence import MessageWriter
+from src.database import TORTOISE_ORM
+from src.users.models import User
+
+
+@pytest_asyncio.fixture
+async def channel():
+    await Tortoise.init(
+        db_url="sqlite://:memory:",
+        modules={"models": TORTOISE_ORM["apps"]["models"]["models"]},
+    )
+    await Tortoise.generate_schemas()
+    user = await User.create(username="writer", password="x")
+    yield await Channel.create(name="general", created_by=user)
+    await Tortoise.close_connections()
+
+
+@pytest.mark.asyncio
+async def test_messages_are_batched_in_order(channel):
+    writer = MessageWriter(batch_size=10, flush_interval=0.05)
+    await writer.start()
+
+    results = await asyncio.gather(*[
+        writer.submit(channel.id, channel.created_by_id, f"m{i}", "writer") for i in range(25)
+    ])
+    await writer.stop()
+
+    ids = [message_id for message_id, _ in results]
+    assert ids == sorted(ids)
+    stored = await Message.filter(channel=channel).order_by("id").values_list("id", "content")
+    assert stored == [(ids[i], f"m{i}") for i in range(25)]
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_buffered_messages(channel):
+    writer = MessageWriter(batch_size=100, flush_interval=60)
+    await writer.start()
+
+    pending = asyncio.ensure_future(writer.submit(channel.id, channel.created_by_id, "late", "writer"))
+    await asyncio.sleep(0)
+    await writer.stop()
+
+    message_id, _ = await pending
+    assert await Message.get(id=message_id).values_list("content", flat=True) == "late"
+
+
+@pytest.mark.asyncio
+async def test_bad_row_fails_only_its_own_submit(channel):
+    writer = MessageWriter(batch_size=10, flush_interval=0.05)
+    await writer.start()
+
+    results = await asyncio.gather(*[
+        writer.submit(channel_id, channel.created_by_id, content, "writer")
+        for channel_id, content in [(channel.id, "before"), (channel.id + 1, "deleted"), (channel.id, "after")]
+    ], return_exceptions=True)
+    await writer.stop()
+
+    assert isinstance(results[1], IntegrityError)
+    (before, _), (after, _) = results[0], results[2]
+    stored = await Message.filter(channel=channel).order_by("id").values_list("id", "content")
+    assert stored == [(before, "before"), (after, "after")]
+    channel = await Channel.get(id=channel.id)
+    assert (channel.message_count, channel.last_message_id) == (2, after)
+
+
+@pytest.mark.asyncio
+async def test_submit_after_stop_writes_directly(channel):
+    writer = MessageWriter(batch_size=10, flush_interval=0.01)
+    await writer.start()
+    first, _ = await asyncio.wait_for(writer.submit(channel.id, channel.created_by_id, "first", "writer"), 1)
+    await writer.stop()
+
+    second, _ = await asyncio.wait_for(writer.submit(channel.id, channel.created_by_id, "late", "writer"), 1)
+    assert second > first
+    assert await Message.get(id=second).values_list("content", flat=True) == "late"
@@ -0,0 +1,40 @@
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+
+from src.metrics import Counter, HistogramMetric, MetricsMiddleware, Registry, HTTP_REQUESTS
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests", ("route",)))
+    latency = registry.register(HistogramMetric("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    requests.inc('/a"b')
+    requests.inc('/a"b')
+    latency.observe(0.5)
+
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/a\\"b"} 2' in text
+    assert 'latency_seconds_bucket{le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 1' in text
+    assert 'latency_seconds_count 1' in text
+
+
+@pytest.mark.asyncio
+async def test_middleware_labels_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        await client.get("/items/1")
+        await client.get("/items/2")
+        await client.get("/missing/3")
+
+    assert HTTP_REQUESTS.children[("GET", "/items/{item_id}", "200")] == 2
+    assert HTTP_REQUESTS.children[("GET", "<unmatched>", "404")] == 1
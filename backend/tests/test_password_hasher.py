@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from src.users import service
+from src.users.utils import PASSWORD_HASH_QUEUE_WAIT, PASSWORD_HASH_REJECTED, PasswordHasher
+
+
+class BlockingContext:
+    """A CryptContext whose hashes run until ``release`` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = 0
+
+    def hash(self, password: str) -> str:
+        self.started += 1
+        self.release.wait(5)
+        return f"hashed:{password}"
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self.hash(password) == hashed
+
+
+def rejected_count() -> float:
+    return PASSWORD_HASH_REJECTED.children.get((), 0)
+
+
+def queue_wait_count() -> int:
+    histogram = PASSWORD_HASH_QUEUE_WAIT.children.get(())
+    return histogram.count if histogram is not None else 0
+
+
+@pytest.mark.asyncio
+async def test_saturated_hasher_queues_then_rejects():
+    context = BlockingContext()
+    hasher = PasswordHasher(context, max_workers=1, max_pending=2)
+    rejected, waits = rejected_count(), queue_wait_count()
+
+    # One hash runs, two wait for the single thread, the fourth is refused
+    admitted = [asyncio.create_task(hasher.hash(f"p{i}")) for i in range(3)]
+    await asyncio.sleep(0.05)
+    assert context.started == 1
+    assert hasher.stats()["waiting"] == 2
+    with pytest.raises(HTTPException) as refused:
+        await hasher.hash("p3")
+    assert refused.value.status_code == 503
+    assert refused.value.headers == {"Retry-After": "1"}
+
+    await asyncio.sleep(0.1)
+    context.release.set()
+    assert await asyncio.gather(*admitted) == ["hashed:p0", "hashed:p1", "hashed:p2"]
+    hasher.shutdown()
+
+    stats = hasher.stats()
+    assert (stats["completed"], stats["rejected"], stats["waiting"]) == (3, 1, 0)
+    # The waiters queued behind the first hash for at least the 0.15s it ran
+    assert stats["queue_time_max"] >= 0.15
+    assert 0.05 <= stats["queue_time_avg"] < stats["queue_time_max"]
+    assert rejected_count() == rejected + 1
+    assert queue_wait_count() == waits + 3
+
+
+@pytest.mark.asyncio
+async def test_login_storm_gets_503_and_shows_on_metrics(api, monkeypatch, register):
+    await register("alice")
+    context = BlockingContext()
+    monkeypatch.setattr(service, "password_hasher", PasswordHasher(context, max_workers=1, max_pending=0))
+    credentials = {"username": "alice", "password": "wrong"}
+
+    first = asyncio.create_task(api.post("/api/users/token", data=credentials))
+    await asyncio.sleep(0.05)
+    response = await api.post("/api/users/token", data=credentials)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    context.release.set()
+    assert (await first).status_code == 401
+    service.password_hasher.shutdown()
+
+    metrics = (await api.get("/metrics")).text
+    assert "# TYPE password_hash_rejected_total counter" in metrics
+    assert "password_hash_queue_wait_seconds_count" in metrics
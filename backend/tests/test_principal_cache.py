@@ -0,0 +1,62 @@
+import time
+
+from src.metrics import REGISTRY
+from src.users import service
+from src.users.schemas import Principal
+from src.users.utils import PrincipalCache
+
+
+def make_principal(id: int) -> Principal:
+    return Principal(id=id, username=f"user{id}", role="member", is_active=True)
+
+
+def test_hit_miss_and_ratio():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    assert cache.get("token") is None
+    cache.set("token", make_principal(1), exp=time.time() + 300)
+    assert cache.get("token").username == "user1"
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+def test_entry_never_outlives_token_exp():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    cache.set("token", make_principal(1), exp=time.time() - 1)
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PrincipalCache(maxsize=2, ttl=60)
+    exp = time.time() + 300
+    cache.set("a", make_principal(1), exp)
+    cache.set("b", make_principal(2), exp)
+    cache.get("a")
+    cache.set("c", make_principal(3), exp)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_invalidate_user_drops_all_their_tokens():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    exp = time.time() + 300
+    cache.set("a", make_principal(1), exp)
+    cache.set("b", make_principal(1), exp)
+    cache.set("c", make_principal(2), exp)
+    cache.invalidate_user(1)
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_stats_are_exported(monkeypatch):
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    monkeypatch.setattr(service, "principal_cache", cache)
+    cache.set("token", make_principal(1), exp=time.time() + 300)
+    cache.get("token")
+    cache.get("token")
+    cache.get("other")
+
+    text = REGISTRY.render()
+    assert "principal_cache_hits_total 2" in text
+    assert "principal_cache_misses_total 1" in text
+    assert "principal_cache_entries 1" in text
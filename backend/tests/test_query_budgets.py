@@ -0,0 +1,86 @@
+import pytest
+
+from conftest import PASSWORD, auth_headers
+from src.users.service import principal_cache
+
+
+@pytest.fixture
+def call(api, query_budget):
+    """Issue one request within a query budget, with a cold principal cache."""
+
+    async def request(max_queries: int, method: str, url: str, expected: int = 200, **kwargs):
+        principal_cache.clear()
+        with query_budget(max_queries):
+            response = await api.request(method, url, **kwargs)
+        assert response.status_code == expected, response.text
+        return response
+
+    return request
+
+
+@pytest.mark.asyncio
+async def test_posts_routes(api, call, register):
+    alice = auth_headers(await register("alice"))
+    bob = auth_headers(await register("bob"))
+    for author in (alice, bob) * 5:
+        await api.post("/api/posts/", json={"title": "hello", "content": "world"}, headers=author)
+
+    await call(2, "POST", "/api/posts/", json={"title": "hello", "content": "there"}, headers=alice)
+    await call(1, "GET", "/api/posts/")
+    await call(1, "GET", "/api/posts/search", params={"q": "hello"})
+    await call(1, "GET", "/api/posts/1")
+    await call(3, "PUT", "/api/posts/1", json={"title": "edited"}, headers=alice)
+    await call(4, "DELETE", "/api/posts/1", headers=alice)
+
+    # Budgets for bulk writes hold for 5 rows and for 50 alike
+    ids = []
+    for count in (5, 50):
+        posts = [{"title": f"bulk {i}", "content": "world"} for i in range(count)]
+        response = await call(2, "POST", "/api/posts/bulk", json=posts, headers=alice)
+        ids.append(response.json()["ids"])
+    for created in ids:
+        await call(4, "POST", "/api/posts/bulk/delete", json={"ids": created}, headers=alice)
+
+
+@pytest.mark.asyncio
+async def test_users_routes(api, call, register):
+    alice = auth_headers(await register("alice"))
+    for _ in range(5):
+        await api.post("/api/posts/", json={"title": "hello", "content": "world"}, headers=alice)
+
+    await call(2, "POST", "/api/users/register", json={
+        "username": "carol", "email": "carol@example.com", "password": PASSWORD,
+    })
+    response = await call(1, "POST", "/api/users/token", data={"username": "carol", "password": PASSWORD})
+    refresh_token = response.json()["refresh_token"]
+    response = await call(0, "POST", "/api/users/refresh", json={"refresh_token": refresh_token})
+    await call(0, "POST", "/api/users/logout", json={"refresh_token": response.json()["refresh_token"]})
+    await call(2, "GET", "/api/users/me", headers=alice)
+    await call(3, "GET", "/api/users/profile/alice")
+    await call(5, "PUT", "/api/users/profile/alice", json={"bio": "hi"}, headers=alice)
+
+
+@pytest.mark.asyncio
+async def test_chat_routes(api, call, register):
+    owner = auth_headers(await register("owner"))
+    members = [auth_headers(await register(f"member{i}")) for i in range(4)]
+    response = await api.post("/api/chat/channels", json={"name": "general", "is_public": True}, headers=owner)
+    channel_id = response.json()["id"]
+    for member in members:
+        await api.post(f"/api/chat/channels/{channel_id}/join", headers=member)
+        await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": "hello"}, headers=member)
+
+    newcomer = auth_headers(await register("newcomer"))
+    await call(3, "POST", "/api/chat/channels", json={"name": "random", "is_public": True}, headers=owner)
+    await call(5, "POST", f"/api/chat/channels/{channel_id}/join", headers=newcomer)
+    await call(5, "POST", f"/api/chat/channels/{channel_id}/messages", json={"content": "hi"}, headers=newcomer)
+    await call(5, "DELETE", f"/api/chat/channels/{channel_id}/leave", headers=newcomer)
+    await call(2, "GET", "/api/chat/channels", headers=owner)
+    await call(2, "GET", "/api/chat/channels/search", params={"query": "gen"}, headers=owner)
+    await call(6, "GET", f"/api/chat/channels/{channel_id}", headers=owner)
+    await call(4, "GET", f"/api/chat/channels/{channel_id}/messages", headers=owner)
+    await call(4, "GET", f"/api/chat/channels/{channel_id}/search", params={"q": "hello"}, headers=owner)
+    await call(3, "GET", f"/api/chat/channels/{channel_id}/members", headers=owner)
+    await call(2, "POST", f"/api/chat/channels/{channel_id}/read", headers=members[0])
+    await call(2, "GET", "/api/chat/channels/unread", headers=members[0])
+    await call(1, "GET", "/api/chat/ws/stats", headers=owner)
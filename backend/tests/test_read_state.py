@@ -0,0 +1,86 @@
+import pytest
+
+from conftest import auth_headers
+from src.chat.models import ChannelMember
+from src.chat.ws_router import read_cursors
+
+
+@pytest.fixture(autouse=True)
+def clear_pending_cursors():
+    read_cursors._pending.clear()
+    yield
+    read_cursors._pending.clear()
+
+
+async def unread(api, auth: dict) -> dict:
+    rows = (await api.get("/api/chat/channels/unread", headers=auth)).json()
+    return {row["channel_id"]: row["unread_count"] for row in rows}
+
+
+async def post_messages(api, channel_id: int, auth: dict, count: int) -> list:
+    return [
+        (await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": f"m{i}"}, headers=auth)).json()["id"]
+        for i in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_unread_counts_follow_read_cursor(api, query_budget, register):
+    owner = auth_headers(await register("owner"))
+    reader = auth_headers(await register("reader"))
+    first = (await api.post("/api/chat/channels", json={"name": "first"}, headers=owner)).json()["id"]
+    second = (await api.post("/api/chat/channels", json={"name": "second"}, headers=owner)).json()["id"]
+    await post_messages(api, first, owner, 2)
+    # Joining starts caught up with the history
+    for channel_id in (first, second):
+        await api.post(f"/api/chat/channels/{channel_id}/join", headers=reader)
+    first_ids = await post_messages(api, first, owner, 3)
+    await post_messages(api, second, owner, 4)
+
+    await api.get("/api/chat/channels/unread", headers=reader)
+    with query_budget(1):
+        assert await unread(api, reader) == {first: 3, second: 4}
+    # The sender has read everything they sent
+    assert await unread(api, owner) == {first: 0, second: 0}
+
+    response = await api.post(f"/api/chat/channels/{first}/read", json={"message_id": first_ids[0]}, headers=reader)
+    assert response.json() == {"channel_id": first, "last_read_message_id": first_ids[0]}
+    assert await unread(api, reader) == {first: 2, second: 4}
+
+    # No body reads up to the newest message; ids past it are clamped
+    await api.post(f"/api/chat/channels/{first}/read", headers=reader)
+    response = await api.post(f"/api/chat/channels/{second}/read", json={"message_id": 10**6}, headers=reader)
+    assert response.json()["last_read_message_id"] < 10**6
+    assert await unread(api, reader) == {first: 0, second: 0}
+
+
+@pytest.mark.asyncio
+async def test_marks_are_coalesced_and_never_move_backwards(api, query_budget, register):
+    owner = auth_headers(await register("owner"))
+    reader = auth_headers(await register("reader"))
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=owner)).json()["id"]
+    await api.post(f"/api/chat/channels/{channel_id}/join", headers=reader)
+    ids = await post_messages(api, channel_id, owner, 5)
+    await read_cursors.flush()
+
+    for message_id in ids[:4]:
+        await api.post(f"/api/chat/channels/{channel_id}/read", json={"message_id": message_id}, headers=reader)
+    response = await api.post(f"/api/chat/channels/{channel_id}/read", json={"message_id": ids[1]}, headers=reader)
+    assert response.json()["last_read_message_id"] == ids[3]
+    membership = await ChannelMember.get(channel_id=channel_id, user__username="reader")
+    assert membership.last_read_message_id is None
+
+    with query_budget(1):
+        await read_cursors.flush()
+    await membership.refresh_from_db()
+    assert membership.last_read_message_id == ids[3]
+    assert await unread(api, reader) == {channel_id: 1}
+
+
+@pytest.mark.asyncio
+async def test_mark_read_requires_membership(api, register):
+    owner = auth_headers(await register("owner"))
+    outsider = auth_headers(await register("outsider"))
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=owner)).json()["id"]
+    assert (await api.post(f"/api/chat/channels/{channel_id}/read", headers=outsider)).status_code == 403
+    assert (await api.post("/api/chat/channels/999/read", headers=outsider)).status_code == 404
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import PASSWORD, TEST_POSTGRES_URL
+from src.users import service
+from src.users.models import RefreshTokenEntry
+from src.users.token_store import DatabaseRefreshTokenStore, InMemoryRefreshTokenStore, hash_token
+
+
+@pytest.mark.asyncio
+async def test_get_and_revoke():
+    store = InMemoryRefreshTokenStore()
+    await store.add("token", "alice", datetime.utcnow() + timedelta(days=1))
+    assert await store.get("token") == "alice"
+    assert await store.revoke("token") == "alice"
+    assert await store.get("token") is None
+    assert await store.revoke("token") is None
+
+
+@pytest.mark.asyncio
+async def test_expired_tokens_are_not_returned_and_get_swept():
+    store = InMemoryRefreshTokenStore()
+    await store.add("old", "alice", datetime.utcnow() - timedelta(seconds=1))
+    await store.add("new", "bob", datetime.utcnow() + timedelta(days=1))
+    assert await store.get("old") is None
+    assert await store.sweep() == 1
+    assert len(store) == 1
+    assert await store.get("new") == "bob"
+
+
+@pytest.mark.asyncio
+async def test_store_is_bounded():
+    store = InMemoryRefreshTokenStore(maxsize=2)
+    expires = datetime.utcnow() + timedelta(days=1)
+    for token in ("a", "b", "c"):
+        await store.add(token, "alice", expires)
+    assert len(store) == 2
+    assert await store.get("a") is None
+    assert await store.get("c") == "alice"
+
+
+@pytest.mark.asyncio
+async def test_database_store_get_and_revoke(db):
+    store = DatabaseRefreshTokenStore()
+    await store.add("token", "alice", datetime.utcnow() + timedelta(days=1))
+    # Only the hash of the token is stored
+    assert await RefreshTokenEntry.filter(token_hash=hash_token("token")).count() == 1
+    assert await store.get("token") == "alice"
+    assert await store.get("other") is None
+
+    assert await store.revoke("token") == "alice"
+    assert await store.get("token") is None
+    assert await store.revoke("token") is None
+
+
+async def check_revoke_has_one_winner():
+    store = DatabaseRefreshTokenStore()
+    await store.add("token", "alice", datetime.utcnow() + timedelta(days=1))
+    results = await asyncio.gather(*[store.revoke("token") for _ in range(5)])
+    assert (results.count("alice"), results.count(None)) == (1, 4)
+
+
+@pytest.mark.asyncio
+async def test_database_store_revoke_has_one_winner(db):
+    await check_revoke_has_one_winner()
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+@pytest.mark.asyncio
+async def test_database_store_revoke_has_one_winner_on_postgres(postgres):
+    await check_revoke_has_one_winner()
+
+
+@pytest.mark.asyncio
+async def test_database_store_expiry_and_sweep(db):
+    store = DatabaseRefreshTokenStore()
+    await store.add("old", "alice", datetime.utcnow() - timedelta(seconds=1))
+    await store.add("new", "bob", datetime.utcnow() + timedelta(days=1))
+    assert await store.get("old") is None
+    assert await store.sweep() == 1
+    assert await RefreshTokenEntry.all().count() == 1
+    assert await store.get("new") == "bob"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store", [InMemoryRefreshTokenStore, DatabaseRefreshTokenStore])
+async def test_concurrent_refreshes_with_one_token_mint_one_pair(api, monkeypatch, register, store):
+    monkeypatch.setattr(service, "refresh_token_store", store())
+    await register("alice")
+    response = await api.post("/api/users/token", data={"username": "alice", "password": PASSWORD})
+    refresh = {"refresh_token": response.json()["refresh_token"]}
+
+    responses = await asyncio.gather(*[api.post("/api/users/refresh", json=refresh) for _ in range(2)])
+    assert sorted(response.status_code for response in responses) == [200, 401]
+    # The token is spent: replaying it later is refused too
+    assert (await api.post("/api/users/refresh", json=refresh)).status_code == 401
@@ -0,0 +1,173 @@
+import asyncpg
+import pytest
+
+from conftest import TEST_POSTGRES_URL, auth_headers, migrate
+from src.chat.models import Channel, ChannelMember, Message
+from src.chat.service import _like_pattern, search_channels, search_messages
+from src.posts.models import Post
+from src.posts.service import search_posts
+from src.users.models import User
+
+
+async def walk(api, url: str, cursor_of, params: dict, headers: dict = None) -> list:
+    """Every page of a search, following its cursor; one list per page."""
+    pages, after = [], None
+    while True:
+        response = await api.get(url, params={**params, **({"after": after} if after else {})}, headers=headers)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        page, after = cursor_of(response, body)
+        pages.append(page)
+        if not after:
+            return pages
+
+
+@pytest.mark.asyncio
+async def test_post_search_pages_through_matches(api, register):
+    auth = auth_headers(await register("alice"))
+    titles = ["apple pie", "banana bread", "apple crumble", "cherry tart", "toffee apple", "apple jam", "plum"]
+    ids = {}
+    for title in titles:
+        response = await api.post("/api/posts/", json={"title": title, "content": "a recipe"}, headers=auth)
+        ids[title] = response.json()["id"]
+
+    # Without tsvector every match ranks the same, so newest comes first
+    pages = await walk(
+        api, "/api/posts/search",
+        lambda response, body: ([post["title"] for post in body], response.headers.get("X-Next-Cursor")),
+        {"q": "apple", "limit": 3},
+    )
+    assert pages == [["apple jam", "toffee apple", "apple crumble"], ["apple pie"]]
+
+    response = await api.get("/api/posts/search", params={"q": "recipe", "limit": 10})
+    assert [post["id"] for post in response.json()] == sorted(ids.values(), reverse=True)
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_post_search_rejects_bad_cursor(api):
+    response = await api.get("/api/posts/search", params={"q": "apple", "after": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_message_search_is_for_members_and_pages(api, register):
+    alice = auth_headers(await register("alice"))
+    bob = auth_headers(await register("bob"))
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=alice)).json()["id"]
+    contents = ["deploy at noon", "lunch?", "deploy failed", "rolling back", "deploy again", "deploy ok"]
+    for content in contents:
+        await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": content}, headers=alice)
+
+    url = f"/api/chat/channels/{channel_id}/search"
+    # Even in a public channel, message content is for members only
+    response = await api.get(url, params={"q": "deploy"}, headers=bob)
+    assert response.status_code == 403
+    response = await api.get("/api/chat/channels/999/search", params={"q": "deploy"}, headers=alice)
+    assert response.status_code == 404
+
+    pages = await walk(
+        api, url,
+        lambda response, body: ([message["content"] for message in body["messages"]], body["next_cursor"]),
+        {"q": "DEPLOY", "limit": 2}, alice,
+    )
+    assert pages == [["deploy ok", "deploy again"], ["deploy failed", "deploy at noon"]]
+
+    response = await api.get(url, params={"q": "deploy", "after": "not-a-cursor"}, headers=alice)
+    assert response.status_code == 400
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+@pytest.mark.asyncio
+async def test_full_text_search_ranks_and_pages_on_postgres(postgres):
+    user = await User.create(username="alice", email="alice@example.com", password="x")
+    # Title matches are weighted above content matches
+    content_match = await Post.create(title="dessert", content="apple", user=user)
+    title_match = await Post.create(title="apple", content="dessert", user=user)
+    both = await Post.create(title="apple", content="apple apple", user=user)
+    await Post.create(title="plum", content="plum", user=user)
+
+    rows, cursor = await search_posts("apple", 10)
+    assert [row["id"] for row in rows] == [both.id, title_match.id, content_match.id]
+    assert cursor is None
+
+    walked, cursor = [], None
+    while True:
+        rows, cursor = await search_posts("apple", 1, cursor)
+        walked.extend(row["id"] for row in rows)
+        if cursor is None:
+            break
+    assert walked == [both.id, title_match.id, content_match.id]
+
+    channel = await Channel.create(name="general", created_by=user)
+    once = await Message.create(channel=channel, user=user, content="deploy now")
+    twice = await Message.create(channel=channel, user=user, content="deploy, deploy again")
+    await Message.create(channel=channel, user=user, content="lunch")
+    rows, cursor = await search_messages(channel.id, "deploy", 1)
+    assert [row["id"] for row in rows] == [twice.id]
+    rows, cursor = await search_messages(channel.id, "deploy", 1, cursor)
+    assert [row["id"] for row in rows] == [once.id]
+    assert cursor is None
+
+
+def test_like_pattern_escapes_wildcards():
+    assert _like_pattern("dev") == "%dev%"
+    assert _like_pattern("100%_sure") == "%100\\%\\_sure%"
+    assert _like_pattern("back\\slash") == "%back\\\\slash%"
+
+
+async def create_channels(owner: User, member: User, outsider: User) -> dict:
+    """Channels named for how they should match a search for "dev"."""
+    channels = {}
+    for name, is_public, creator in [
+        ("frontend-dev", True, owner),       # substring
+        ("dev", True, owner),                # exact
+        ("developers", True, owner),         # prefix
+        ("DEV-private", False, owner),       # prefix, private, member joined
+        ("dev-secret", False, outsider),     # prefix, private, not a member
+        ("random", True, owner),
+        ("100%_dev", True, owner),           # has LIKE wildcards in its name
+        ("100x-dev", True, owner),
+    ]:
+        channels[name] = await Channel.create(name=name, is_public=is_public, created_by=creator)
+        await ChannelMember.create(channel=channels[name], user=creator, role="admin")
+    await ChannelMember.create(channel=channels["DEV-private"], user=member, role="member")
+    return channels
+
+
+async def check_channel_search():
+    owner = await User.create(username="owner", email="owner@example.com", password="x")
+    member = await User.create(username="member", email="member@example.com", password="x")
+    outsider = await User.create(username="outsider", email="outsider@example.com", password="x")
+    await create_channels(owner, member, outsider)
+
+    names = [row["name"] for row in await search_channels("dev", member.id, 20)]
+    # Only the private channel the caller belongs to; exact, then prefix
+    # matches, then substrings
+    assert "dev-secret" not in names
+    assert names[0] == "dev"
+    assert set(names[1:3]) == {"developers", "DEV-private"}
+    assert set(names[3:]) == {"frontend-dev", "100%_dev", "100x-dev"}
+    assert "dev-secret" in [row["name"] for row in await search_channels("dev", outsider.id, 20)]
+
+    assert [row["name"] for row in await search_channels("dev", member.id, 2)] == names[:2]
+
+    # % and _ match themselves, not any characters
+    assert [row["name"] for row in await search_channels("100%_", member.id, 20)] == ["100%_dev"]
+    assert [row["name"] for row in await search_channels("0_d", member.id, 20)] == []
+
+
+@pytest.mark.asyncio
+async def test_channel_search_ranks_and_filters(db):
+    await check_channel_search()
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+@pytest.mark.asyncio
+async def test_channel_search_ranks_and_filters_on_postgres(postgres):
+    try:
+        # Installs pg_trgm into the throwaway schema
+        await migrate(postgres, "7_20261018174500_channel_name_trgm_index")
+    except asyncpg.FeatureNotSupportedError as e:
+        pytest.skip(f"pg_trgm is not available: {e}")
+    await check_channel_search()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import zlib
+from datetime import datetime, timezone
+
+import msgpack
+import pytest
+
+from conftest import FakeWebSocket, auth_headers
+from src.chat import frames
+from src.chat.frames import Frame, decode, negotiate
+from src.chat.ws_router import message_frame, multiplexed_websocket_endpoint
+
+
+def inflate(payload: bytes) -> bytes:
+    return zlib.decompress(payload, -zlib.MAX_WBITS)
+
+
+def test_negotiate_picks_first_known_subprotocol():
+    assert negotiate([]) == "json"
+    assert negotiate(["chat", "flux.msgpack", "flux.json+deflate"]) == "msgpack"
+    assert negotiate(["flux.json+deflate", "flux.msgpack"]) == "json+deflate"
+
+
+def test_message_frame_formats():
+    created_at = datetime(2026, 10, 18, 12, 30, tzinfo=timezone.utc)
+    frame = message_frame(7, 42, "hi", "alice", created_at)
+
+    assert json.loads(frame.json) == {
+        "type": "message", "channel_id": 7, "id": "42", "content": "hi",
+        "user": "alice", "created_at": "2026-10-18T12:30:00+00:00",
+    }
+    packed = msgpack.unpackb(frame.encode("msgpack"), timestamp=3)
+    assert packed["id"] == 42
+    assert packed["created_at"] == created_at
+    assert inflate(frame.encode("msgpack+deflate")) == frame.encode("msgpack")
+    assert inflate(frame.encode("json+deflate")).decode() == frame.json
+
+    # A frame relayed from another worker as JSON converts the same way
+    relayed = Frame(json_text=frame.json)
+    assert relayed.encode("msgpack") == frame.encode("msgpack")
+
+    assert decode("msgpack+deflate", frame.encode("msgpack+deflate"))["id"] == 42
+    with pytest.raises(ValueError):
+        decode("msgpack+deflate", b"not deflate")
+
+
+@pytest.mark.asyncio
+async def test_broadcast_encodes_once_per_format(manager, monkeypatch):
+    calls = {"msgpack": 0, "deflate": 0}
+
+    def counting(name, encode):
+        def wrapper(payload):
+            calls[name] += 1
+            return encode(payload)
+        return wrapper
+
+    monkeypatch.setattr(frames, "_encode_msgpack", counting("msgpack", frames._encode_msgpack))
+    monkeypatch.setattr(frames, "_deflate", counting("deflate", frames._deflate))
+
+    sockets = {fmt: [FakeWebSocket() for _ in range(5)] for fmt in ("json", "msgpack", "msgpack+deflate")}
+    for fmt, fmt_sockets in sockets.items():
+        for socket in fmt_sockets:
+            conn = await manager.open(socket, None, fmt)
+            await manager.subscribe(conn, [1])
+
+    frame = message_frame(1, 10, "hello " * 50, "alice", datetime.now(timezone.utc))
+    await manager.broadcast(frame, 1, 10)
+    await asyncio.sleep(0.05)
+
+    assert calls == {"msgpack": 1, "deflate": 1}
+    assert [socket.subprotocol for socket in sockets["msgpack"]] == ["flux.msgpack"] * 5
+    assert sockets["json"][0].subprotocol is None
+    for socket in sockets["json"]:
+        assert socket.sent == [frame.json]
+    for socket in sockets["msgpack+deflate"]:
+        payload, = socket.sent
+        assert payload is sockets["msgpack+deflate"][0].sent[0]
+        assert len(payload) < len(frame.json)
+        assert msgpack.unpackb(inflate(payload), timestamp=3)["id"] == 10
+
+
+@pytest.mark.asyncio
+async def test_multiplexed_socket_speaks_negotiated_format(api, manager, register):
+    alice = await register("alice")
+    channel_id = (await api.post(
+        "/api/chat/channels", json={"name": "general"}, headers=auth_headers(alice),
+    )).json()["id"]
+
+    def pack(frame: dict) -> bytes:
+        return msgpack.packb(frame)
+
+    socket = FakeWebSocket([
+        pack({"type": "subscribe", "channels": [channel_id]}),
+        # Text frames are still read as JSON
+        {"type": "message", "channel_id": channel_id, "content": "from text"},
+        pack({"type": "message", "channel_id": channel_id, "content": "from msgpack"}),
+        b"\xc1",
+    ], subprotocols=["flux.msgpack"])
+    task = asyncio.create_task(multiplexed_websocket_endpoint(socket, alice))
+    await asyncio.sleep(0.2)
+    socket.hang_up()
+    await task
+
+    assert socket.subprotocol == "flux.msgpack"
+    received = [msgpack.unpackb(payload, timestamp=3) for payload in socket.sent]
+    assert received[0] == {"type": "subscribed", "channels": [channel_id], "rejected": []}
+    assert [frame["content"] for frame in received[1:3]] == ["from text", "from msgpack"]
+    assert all(type(frame["id"]) is int for frame in received[1:3])
+    assert isinstance(received[1]["created_at"], datetime)
+    assert received[3]["type"] == "error"
+
+
+@pytest.mark.asyncio
+async def test_msgpack_subscribe_resumes_with_integer_keys(api, manager, register):
+    alice = await register("alice")
+    auth = auth_headers(alice)
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=auth)).json()["id"]
+    ids = [
+        (await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": f"m{i}"}, headers=auth)).json()["id"]
+        for i in range(3)
+    ]
+
+    socket = FakeWebSocket([msgpack.packb({
+        "type": "subscribe", "channels": [channel_id], "last_seen_ids": {channel_id: ids[0]},
+    })], subprotocols=["flux.msgpack"])
+    task = asyncio.create_task(multiplexed_websocket_endpoint(socket, alice))
+    await asyncio.sleep(0.1)
+    socket.hang_up()
+    await task
+
+    received = [msgpack.unpackb(payload, timestamp=3) for payload in socket.sent]
+    assert received[0] == {"type": "subscribed", "channels": [channel_id], "rejected": []}
+    assert [frame["id"] for frame in received[1:]] == ids[1:]
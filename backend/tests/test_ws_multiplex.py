@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeWebSocket, auth_headers
+from src.chat import ws_router
+from src.chat.ws_router import multiplexed_websocket_endpoint
+
+
+async def create_channels(api, token: str, *names: str) -> list:
+    return [
+        (await api.post("/api/chat/channels", json={"name": name}, headers=auth_headers(token))).json()["id"]
+        for name in names
+    ]
+
+
+@pytest.mark.asyncio
+async def test_one_socket_carries_many_channels(api, manager, query_budget, register):
+    alice = await register("alice")
+    bob = await register("bob")
+    general, random, private = await create_channels(api, alice, "general", "random", "private")
+    for channel_id in (general, random):
+        await api.post(f"/api/chat/channels/{channel_id}/join", headers=auth_headers(bob))
+
+    bob_socket = FakeWebSocket([{"type": "subscribe", "channels": [general, random, private, 999]}])
+    with query_budget(2):
+        bob_task = asyncio.create_task(multiplexed_websocket_endpoint(bob_socket, bob))
+        await asyncio.sleep(0.05)
+    assert bob_socket.received() == [
+        {"type": "subscribed", "channels": [general, random], "rejected": [private, 999]},
+    ]
+    assert len(manager.connections) == 1
+
+    alice_socket = FakeWebSocket([
+        {"type": "subscribe", "channels": [general, random]},
+        {"type": "message", "channel_id": random, "content": "hi random"},
+        {"type": "message", "channel_id": general, "content": "hi general"},
+    ])
+    alice_task = asyncio.create_task(multiplexed_websocket_endpoint(alice_socket, alice))
+    await asyncio.sleep(0.05)
+    received = [(frame["channel_id"], frame["content"]) for frame in bob_socket.received()[1:]]
+    assert received == [(random, "hi random"), (general, "hi general")]
+    assert bob_socket.received()[1]["user"] == "alice"
+
+    bob_socket.send_from_client({"type": "unsubscribe", "channels": [random]})
+    await asyncio.sleep(0.01)
+    alice_socket.send_from_client({"type": "message", "channel_id": random, "content": "again"})
+    await asyncio.sleep(0.05)
+    assert bob_socket.received()[-1] == {"type": "unsubscribed", "channels": [random]}
+    assert list(manager.active_connections[random]) == [conn for conn in manager.connections
+                                                         if conn.websocket is alice_socket]
+
+    for socket in (alice_socket, bob_socket):
+        socket.hang_up()
+    await asyncio.gather(alice_task, bob_task)
+    assert manager.connections == set()
+    assert manager.active_connections == {}
+
+
+@pytest.mark.asyncio
+async def test_bad_frames_get_errors_not_disconnects(api, manager, register):
+    alice = await register("alice")
+    (general,) = await create_channels(api, alice, "general")
+    socket = FakeWebSocket([
+        "not json",
+        {"type": "message", "channel_id": general, "content": "not subscribed yet"},
+        {"type": "subscribe", "channels": "all"},
+        {"type": "dance"},
+        # Heartbeat answers need no reply
+        {"type": "pong"},
+        {"type": "subscribe", "channels": [general]},
+    ])
+    task = asyncio.create_task(multiplexed_websocket_endpoint(socket, alice))
+    await asyncio.sleep(0.05)
+    assert [frame["type"] for frame in socket.received()] == ["error"] * 4 + ["subscribed"]
+    socket.hang_up()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_subscription_limit(api, manager, monkeypatch, register):
+    monkeypatch.setattr(ws_router, "CHAT_WS_MAX_SUBSCRIPTIONS", 1)
+    alice = await register("alice")
+    first, second = await create_channels(api, alice, "first", "second")
+    socket = FakeWebSocket([
+        {"type": "subscribe", "channels": [first, second]},
+        {"type": "subscribe", "channels": [first]},
+    ])
+    task = asyncio.create_task(multiplexed_websocket_endpoint(socket, alice))
+    await asyncio.sleep(0.05)
+    assert socket.received()[0]["type"] == "error"
+    assert socket.received()[1] == {"type": "subscribed", "channels": [first], "rejected": []}
+    socket.hang_up()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_invalid_token_is_refused(db, manager):
+    socket = FakeWebSocket()
+    await multiplexed_websocket_endpoint(socket, "not-a-token")
+    assert socket.close_code == 1008
+    assert manager.connections == set()
@@ -0,0 +1,213 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeWebSocket, auth_headers
+from src.chat import ws_router
+from src.chat.ws_router import RESUMES, RecentMessages, multiplexed_websocket_endpoint, websocket_endpoint
+
+
+async def post(api, channel_id: int, auth: dict, *contents: str) -> list:
+    return [
+        (await api.post(f"/api/chat/channels/{channel_id}/messages", json={"content": content}, headers=auth)).json()["id"]
+        for content in contents
+    ]
+
+
+def test_ring_buffer_only_answers_for_what_it_saw():
+    recent = RecentMessages(size=3)
+    recent.add(5, "m5")
+    # Nothing is known to be complete until a replay says so
+    assert recent.since(4) is None
+
+    recent.merge(2, [(3, "m3"), (4, "m4")])
+    assert recent.since(2) == [(3, "m3"), (4, "m4"), (5, "m5")]
+    assert recent.since(1) is None
+
+    # Full: each new frame pushes out the oldest, raising the floor with it,
+    # and frames that arrive out of id order are sorted on the way out
+    recent.add(7, "m7")
+    recent.add(6, "m6")
+    assert recent.complete_after == 4
+    assert recent.since(3) is None
+    assert recent.since(4) == [(5, "m5"), (6, "m6"), (7, "m7")]
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_from_database_then_buffer(api, manager, query_budget, register):
+    token = await register("alice")
+    auth = auth_headers(token)
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=auth)).json()["id"]
+    ids = await post(api, channel_id, auth, "one", "two", "three", "four")
+    # The counter is process-wide, so only count this test's resumes
+    resumes = dict(RESUMES.children)
+
+    first = FakeWebSocket([{"type": "subscribe", "channels": [channel_id], "last_seen_ids": {str(channel_id): ids[1]}}])
+    first_task = asyncio.create_task(multiplexed_websocket_endpoint(first, token))
+    await asyncio.sleep(0.05)
+    assert first.received()[0]["type"] == "subscribed"
+    assert first.message_ids() == ids[2:]
+    assert RESUMES.children[("database",)] == resumes.get(("database",), 0) + 1
+
+    live = await post(api, channel_id, auth, "five")
+    await asyncio.sleep(0.01)
+    assert first.message_ids() == ids[2:] + live
+
+    # A second socket with a short gap is served from memory
+    second = FakeWebSocket()
+    with query_budget(2):
+        second_task = asyncio.create_task(websocket_endpoint(second, channel_id, token, last_seen_id=ids[2]))
+        await asyncio.sleep(0.05)
+    assert second.message_ids() == [ids[3]] + live
+    assert second.received()[0]["content"] == "four"
+    assert RESUMES.children[("buffer",)] == resumes.get(("buffer",), 0) + 1
+
+    for socket in (first, second):
+        socket.hang_up()
+    await asyncio.gather(first_task, second_task)
+
+
+@pytest.mark.asyncio
+async def test_live_messages_during_replay_have_no_gap_or_duplicate(api, manager, monkeypatch, register):
+    token = await register("alice")
+    auth = auth_headers(token)
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=auth)).json()["id"]
+    ids = await post(api, channel_id, auth, *[f"m{i}" for i in range(5)])
+    monkeypatch.setattr(ws_router, "CHAT_RESUME_PAGE_SIZE", 2)
+
+    read_pages = ws_router.get_messages_page
+    pages = []
+
+    async def racing_page(*args, **kwargs):
+        page = await read_pages(*args, **kwargs)
+        if not pages:
+            # Right after the first read: a message committed too late for
+            # it, and a late duplicate of a row the replay already has
+            pages.extend(await post(api, channel_id, auth, "during replay"))
+            row = page[0][0]
+            await manager.broadcast(
+                ws_router.message_frame(channel_id, row["id"], row["content"], row["user"], row["created_at"]),
+                channel_id, row["id"],
+            )
+        return page
+
+    monkeypatch.setattr(ws_router, "get_messages_page", racing_page)
+    socket = FakeWebSocket()
+    task = asyncio.create_task(websocket_endpoint(socket, channel_id, token, last_seen_id=ids[0]))
+    await asyncio.sleep(0.05)
+    assert socket.message_ids() == ids[1:] + pages
+
+    socket.hang_up()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_long_gap_stops_at_cap_with_resync(api, manager, monkeypatch, register):
+    token = await register("alice")
+    auth = auth_headers(token)
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=auth)).json()["id"]
+    ids = await post(api, channel_id, auth, *[f"m{i}" for i in range(6)])
+    monkeypatch.setattr(ws_router, "CHAT_RESUME_PAGE_SIZE", 2)
+    monkeypatch.setattr(ws_router, "CHAT_RESUME_MAX_MESSAGES", 3)
+    resyncs = ws_router.RESYNCS.children.get((), 0)
+
+    socket = FakeWebSocket([{"type": "subscribe", "channels": [channel_id], "last_seen_ids": {str(channel_id): ids[0]}}])
+    task = asyncio.create_task(multiplexed_websocket_endpoint(socket, token))
+    await asyncio.sleep(0.05)
+    assert socket.message_ids() == ids[1:4]
+    assert socket.received()[-1] == {"type": "resync", "channel_id": channel_id}
+    assert ws_router.RESYNCS.children[()] == resyncs + 1
+    # What was sent is not the newest, so the buffer still knows nothing
+    assert manager.recent[channel_id].since(ids[0]) is None
+
+    live = await post(api, channel_id, auth, "live")
+    await asyncio.sleep(0.01)
+    assert socket.message_ids() == ids[1:4] + live
+
+    socket.hang_up()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_replay_does_not_block_the_receive_loop(api, manager, monkeypatch, register):
+    token = await register("alice")
+    auth = auth_headers(token)
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=auth)).json()["id"]
+    ids = await post(api, channel_id, auth, "one", "two")
+
+    read_pages = ws_router.get_messages_page
+    database = asyncio.Event()
+
+    async def slow_page(*args, **kwargs):
+        await database.wait()
+        return await read_pages(*args, **kwargs)
+
+    monkeypatch.setattr(ws_router, "get_messages_page", slow_page)
+    socket = FakeWebSocket([{"type": "subscribe", "channels": [channel_id], "last_seen_ids": {str(channel_id): ids[0]}}])
+    task = asyncio.create_task(multiplexed_websocket_endpoint(socket, token))
+    await asyncio.sleep(0.05)
+    (conn,) = manager.connections
+    assert channel_id in conn.replays
+
+    # The pong is read while the replay waits on the database, so the
+    # reaper sees a live client
+    before = conn.last_seen
+    socket.send_from_client({"type": "pong"})
+    await asyncio.sleep(0.01)
+    assert conn.last_seen > before
+
+    database.set()
+    await asyncio.sleep(0.05)
+    assert socket.message_ids() == ids[1:]
+    assert conn.replays == {}
+
+    # Hanging up mid-replay cancels it
+    database.clear()
+    socket.send_from_client({"type": "unsubscribe", "channels": [channel_id]})
+    socket.send_from_client({"type": "subscribe", "channels": [channel_id], "last_seen_ids": {str(channel_id): ids[0]}})
+    await asyncio.sleep(0.05)
+    replay = conn.replays[channel_id]
+    socket.hang_up()
+    await task
+    assert replay.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_survives_a_blocked_replay_on_the_channel_socket(api, manager, monkeypatch, register):
+    token = await register("alice")
+    auth = auth_headers(token)
+    channel_id = (await api.post("/api/chat/channels", json={"name": "general"}, headers=auth)).json()["id"]
+    ids = await post(api, channel_id, auth, "one", "two")
+    monkeypatch.setattr(ws_router, "CHAT_WS_PING_INTERVAL", 0)
+    monkeypatch.setattr(ws_router, "CHAT_WS_PING_TIMEOUT", 0.05)
+
+    read_pages = ws_router.get_messages_page
+    database = asyncio.Event()
+
+    async def slow_page(*args, **kwargs):
+        await database.wait()
+        return await read_pages(*args, **kwargs)
+
+    monkeypatch.setattr(ws_router, "get_messages_page", slow_page)
+    socket = FakeWebSocket()
+    task = asyncio.create_task(websocket_endpoint(socket, channel_id, token, last_seen_id=ids[0]))
+    await asyncio.sleep(0.05)
+    (conn,) = manager.connections
+
+    # Pinged while the replay waits on the database, the client answers and
+    # is still there after the timeout
+    await manager.reap()
+    await asyncio.sleep(0.01)
+    assert socket.received() == [{"type": "ping"}]
+    socket.send_from_client({"type": "pong"})
+    await asyncio.sleep(0.1)
+    await manager.reap()
+    assert not conn.closed and socket.close_code is None
+
+    database.set()
+    await asyncio.sleep(0.05)
+    assert socket.message_ids() == ids[1:]
+
+    socket.hang_up()
+    await task
+    assert conn.replays == {}
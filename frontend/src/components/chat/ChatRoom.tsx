@@ -20,6 +20,9 @@ const ChatRoom: React.FC = () => {
   const [error, setError] = useState<string | null>(null);
   const isConnecting = useRef(false);
   const reconnectTimeout = useRef<NodeJS.Timeout | null>(null);
+  // Newest message id we have; the socket resumes after it, so nothing sent
+  // while we were disconnected (or loading) is missed or shown twice
+  const lastSeenId = useRef<number | null>(null);
 
   const fetchChannel = useCallback(async () => {
     if (channelId) {
@@ -28,6 +31,9 @@ const ChatRoom: React.FC = () => {
         const channelData = await getChannel(Number(channelId));
         setChannel(channelData);
         setMessages(channelData.messages);
+        if (channelData.messages.length > 0) {
+          lastSeenId.current = Number(channelData.messages[channelData.messages.length - 1].id);
+        }
       } catch (error) {
         console.error('Failed to fetch channel:', error);
         setError('Failed to load channel. Please try again later.');
@@ -35,6 +41,25 @@ const ChatRoom: React.FC = () => {
     }
   }, [channelId]);
 
+  // The server stopped replaying a gap too long to resume: reload the
+  // history over REST, keeping live messages newer than what it returned.
+  // The channel itself is left alone so the socket stays open
+  const resync = useCallback(async () => {
+    try {
+      const channelData = await getChannel(Number(channelId));
+      const fetched = channelData.messages;
+      const newest = fetched.length > 0 ? Number(fetched[fetched.length - 1].id) : 0;
+      setMessages((prevMessages) => [
+        ...fetched,
+        ...prevMessages.filter((message) => Number(message.id) > newest),
+      ]);
+      lastSeenId.current = Math.max(lastSeenId.current ?? 0, newest);
+    } catch (error) {
+      console.error('Failed to resync channel:', error);
+      setError('Failed to load channel. Please try again later.');
+    }
+  }, [channelId]);
+
   const connectWebSocket = useCallback(() => {
     if (channelId && channel && !isConnecting.current) {
       isConnecting.current = true;
@@ -51,7 +76,8 @@ const ChatRoom: React.FC = () => {
 
       const wsUrl = BACKEND_WS_URL;
 
-      const ws = new WebSocket(`${wsUrl}/chat/ws/${channelId}?token=${token}`);
+      const resume = lastSeenId.current !== null ? `&last_seen_id=${lastSeenId.current}` : '';
+      const ws = new WebSocket(`${wsUrl}/chat/ws/${channelId}?token=${token}${resume}`);
   
       ws.onopen = () => {
         console.log('WebSocket connection established');
@@ -67,6 +93,19 @@ const ChatRoom: React.FC = () => {
       ws.onmessage = (event) => {
         try {
           const newMessage = JSON.parse(event.data);
+          if (newMessage.type === 'ping') {
+            // Heartbeat: the server closes sockets that stop answering
+            ws.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
+          if (newMessage.type === 'resync') {
+            resync();
+            return;
+          }
+          if (newMessage.type !== 'message') {
+            return;
+          }
+          lastSeenId.current = Math.max(lastSeenId.current ?? 0, Number(newMessage.id));
           setMessages((prevMessages) => [...prevMessages, newMessage]);
         } catch (error) {
           console.error('Failed to parse message:', error);
@@ -99,7 +138,7 @@ const ChatRoom: React.FC = () => {
         }
       };
     }
-  }, [channelId, channel]);
+  }, [channelId, channel, resync]);
 
   useEffect(() => {
     fetchChannel();